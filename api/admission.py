@@ -0,0 +1,44 @@
+# api/admission.py
+# Flask glue for services/common/admission.py: run a view inside an admission lane.
+import functools
+from flask import jsonify, make_response
+
+from services.common.admission import AdmissionRejected, get_admission
+
+
+def rejected_response(e):
+    resp = jsonify({"error": f"busy: {e}", "lane": e.lane})
+    resp.status_code = e.status
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+
+def admitted(classify):
+    """
+    Decorator: hold a slot in the lane returned by `classify()` (a lane name, evaluated in the
+    request context) for the whole response, including a streamed body. When the lane is
+    full the view is not run and the client gets 429/503 with Retry-After.
+    """
+
+    def deco(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            controller = get_admission()
+            if controller is None:
+                return view(*args, **kwargs)
+            try:
+                ticket = controller.acquire(classify())
+            except AdmissionRejected as e:
+                return rejected_response(e)
+            try:
+                resp = make_response(view(*args, **kwargs))
+            except BaseException:
+                ticket.release()
+                raise
+            # Streamed bodies keep querying Influx after the view returns; release when done
+            resp.call_on_close(ticket.release)
+            return resp
+
+        return wrapper
+
+    return deco
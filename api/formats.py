@@ -0,0 +1,114 @@
+# api/formats.py
+# Columnar and binary encodings for chart endpoints (/api/history, /api/indicators).
+import gzip
+import struct
+import numpy as np
+from flask import Response, request, jsonify
+
+try:
+    import brotli  # optional; enables Content-Encoding: br
+except ImportError:  # pragma: no cover - depends on the deployment image
+    brotli = None
+
+FORMATS = ("json", "columnar", "binary")
+
+# (column, dtype) for each endpoint; "q" = int64, "d" = float64 (missing values are NaN)
+HISTORY_COLUMNS = [("time_sec", "q"), ("o", "d"), ("h", "d"), ("l", "d"), ("c", "d"),
+                   ("v", "q"), ("vw", "d"), ("n", "q")]
+
+BINARY_MAGIC = b"TSB1"
+BINARY_MIMETYPE = "application/vnd.tradingbot.columns"
+_NP_TYPES = {"q": np.int64, "d": np.float64}
+
+# Don't bother compressing tiny bodies
+MIN_COMPRESS_BYTES = 1024
+
+
+def indicator_columns(fields):
+    return [("time_sec", "q")] + [(f, "d") for f in fields]
+
+
+def rows_to_arrays(rows, columns):
+    """Turn a cleaned DataFrame (or list of row dicts) into one contiguous NumPy array per column."""
+    if hasattr(rows, "columns"):
+        return {name: _frame_column(rows, name, code) for name, code in columns}
+    out = {}
+    n = len(rows)
+    for name, code in columns:
+        if code == "q":
+            out[name] = np.fromiter((r.get(name) or 0 for r in rows), dtype=np.int64, count=n)
+        else:
+            nan = float("nan")
+            out[name] = np.fromiter((nan if r.get(name) is None else r[name] for r in rows),
+                                    dtype=np.float64, count=n)
+    return out
+
+
+def _frame_column(frame, name, code):
+    n = len(frame)
+    if name not in frame.columns:
+        return np.zeros(n, dtype=np.int64) if code == "q" else np.full(n, np.nan)
+    if code == "q":
+        return frame[name].fillna(0).to_numpy(dtype=np.int64)
+    return frame[name].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def pack_binary(arrays, columns):
+    """
+    Pack columns into one little-endian buffer:
+
+        magic "TSB1" | uint32 rows | uint16 ncols | per column: uint8 name_len, name, uint8 dtype ('q'|'d')
+        | zero padding to an 8-byte boundary | column 0 data | column 1 data | ...
+
+    Every column is `rows` * 8 bytes and starts 8-byte aligned, so a browser can wrap each one
+    in a Float64Array / BigInt64Array view over the response ArrayBuffer without copying.
+    """
+    n = len(arrays[columns[0][0]]) if columns else 0
+    header = bytearray(BINARY_MAGIC)
+    header += struct.pack("<IH", n, len(columns))
+    for name, code in columns:
+        raw = name.encode("utf-8")
+        header += struct.pack("<B", len(raw)) + raw + code.encode("ascii")
+    header += b"\0" * (-len(header) % 8)
+    body = [bytes(header)]
+    for name, code in columns:
+        body.append(np.ascontiguousarray(arrays[name], dtype=_NP_TYPES[code]).astype("<" + code, copy=False).tobytes())
+    return b"".join(body)
+
+
+def columnar_payload(arrays, columns, with_iso=True):
+    """Struct-of-arrays JSON body; NaN becomes null. Adds ISO `_time` when requested."""
+    out = {}
+    if with_iso:
+        ts = arrays["time_sec"]
+        out["_time"] = np.datetime_as_string(ts.astype("datetime64[s]"), unit="s", timezone="UTC").tolist()
+    for name, code in columns:
+        arr = arrays[name]
+        if code == "d" and np.isnan(arr).any():
+            out[name] = [None if x != x else x for x in arr.tolist()]
+        else:
+            out[name] = arr.tolist()
+    return out
+
+
+def compressed_response(body, mimetype):
+    """Response with brotli or gzip Content-Encoding, negotiated from Accept-Encoding."""
+    accepted = request.headers.get("Accept-Encoding", "").lower()
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= MIN_COMPRESS_BYTES:
+        if brotli is not None and "br" in accepted:
+            body = brotli.compress(body, quality=4)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype=mimetype, headers=headers)
+
+
+def format_rows(rows, columns, fmt):
+    """Encode a materialized frame (or rows) as `columnar` JSON or `binary` packed columns."""
+    arrays = rows_to_arrays(rows, columns)
+    if fmt == "binary":
+        return compressed_response(pack_binary(arrays, columns), BINARY_MIMETYPE)
+    resp = jsonify(columnar_payload(arrays, columns))
+    return compressed_response(resp.get_data(), "application/json")
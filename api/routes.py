@@ -1,6 +1,26 @@
-from flask import Blueprint, request, jsonify
+import json
+import hashlib
+import itertools
+import pandas as pd
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from config.settings import settings
-from services.common.influx import query_flux
+from services.common.influx import flux_any, query_flux, query_frames, iter_flux_frames
+from services.common.columnar import (
+    HISTORY_FIELDS, INDICATOR_FIELDS, bars_frame, clean_chart_frame, clean_history_frame, clean_indicator_frame,
+    frame_to_json_rows,
+)
+from services.common.downsample import parse_duration, pick_window, lttb_indices
+from services.common.range_cache import get_range_cache
+from services.common.hot_window import get_hot_window_client
+from services.common.rollup import aggregate_ohlcv, pick_rollup, rollup_covers
+from services.common.bar_store import get_bar_store
+from services.common.indicators import IndicatorGrid
+from services.common.admission import estimate_cost, get_admission
+from api.admission import admitted
+from api.formats import (
+    FORMATS, HISTORY_COLUMNS, indicator_columns, format_rows, rows_to_arrays, columnar_payload,
+    compressed_response,
+)
 from datetime import datetime, timezone  # add
 
 api_bp = Blueprint("api", __name__, url_prefix="/api")
@@ -14,12 +34,63 @@ def _auth_guard():
     # This hook could be replaced by wrapping each route with @token_required
     pass
 
+def _interactive():
+    return "interactive"
+
+
+def _range_lane(default_gran, multi=False):
+    """Lane classifier from start/end/granularity (and the symbol count for batch requests)."""
+
+    def classify():
+        t0, t1 = _parse_iso(request.args.get("start")), _parse_iso(request.args.get("end"))
+        span = (t1 - t0).total_seconds() if t0 is not None and t1 is not None else None
+        step = 86400 if request.args.get("granularity", default_gran) == "day" else 60
+        series = len(_parse_symbols() or ()) if multi else 1
+        return get_admission().lane_for_cost(estimate_cost(span, step, series))
+
+    return classify
+
+
+# The streamer's hot window holds the live Polygon bars it writes to this measurement
+HOT_WINDOW_MEASUREMENT = "aggs_stream"
+
+
+def _hot_last_close(symbol, max_age_sec=86400):
+    """Latest close from the streamer's in-memory window, or None on a miss / stale bar."""
+    client = get_hot_window_client()
+    if client is None:
+        return None
+    data = client.last(symbol, 1)
+    if not data or not data.get("t"):
+        return None
+    if data["t"][-1] < (datetime.now(timezone.utc).timestamp() - max_age_sec) * 1e9:
+        return None
+    return data["c"][-1]
+
+
+def _hot_last_closes(symbols, max_age_sec=86400):
+    """{symbol: close} for the symbols with a fresh bar in the streamer's window (misses omitted)."""
+    client = get_hot_window_client()
+    if client is None:
+        return {}
+    data = client.closes(symbols) or {}
+    cutoff = (datetime.now(timezone.utc).timestamp() - max_age_sec) * 1e9
+    return {sym: tc[1] for sym, tc in data.items() if tc and tc[0] >= cutoff}
+
+
 @api_bp.get("/snapshot")
+@admitted(_interactive)
 def snapshot():
     symbol = request.args.get("symbol")
     if not symbol:
         return jsonify({"error": "symbol required"}), 400
     measurement = request.args.get("measurement", "aggs_1m")
+    if measurement == HOT_WINDOW_MEASUREMENT:
+        last_close = _hot_last_close(symbol)
+        if last_close is not None:
+            resp = jsonify({"symbol": symbol, "measurement": measurement, "last_close": last_close})
+            resp.headers["X-Source"] = "memory"
+            return resp
     flux = f'''
 from(bucket: "{settings.INFLUX_BUCKET}")
   |> range(start: -24h)
@@ -38,10 +109,525 @@ from(bucket: "{settings.INFLUX_BUCKET}")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-# ... existing code ...
+def _parse_symbols():
+    """Deduplicated `symbols` list (comma-separated), or None when empty or over the batch limit."""
+    seen = []
+    for sym in request.args.get("symbols", "").split(","):
+        sym = sym.strip()
+        if sym and sym not in seen:
+            seen.append(sym)
+    if not seen or len(seen) > settings.API_MAX_BATCH_SYMBOLS:
+        return None
+    return seen
+
+
+def _snapshots_flux(measurement, symbols):
+    return f'''
+from(bucket: "{settings.INFLUX_BUCKET}")
+  |> range(start: -24h)
+  |> filter(fn: (r) => r._measurement == "{measurement}")
+  |> filter(fn: (r) => {_symbol_predicate(symbols)})
+  |> filter(fn: (r) => r._field == "c")
+  |> group(columns: ["symbol"])
+  |> last()
+'''
+
+
+@api_bp.get("/snapshots")
+@admitted(_interactive)
+def snapshots():
+    """
+    Last close for many symbols at once: {"measurement": ..., "snapshots": {symbol: close|null}}.
+    Query params:
+      - symbols: required, comma-separated (at most API_MAX_BATCH_SYMBOLS)
+      - measurement: default aggs_1m
+    For aggs_stream, symbols the streamer's hot window knows are answered from memory; the rest
+    are read with one Flux query grouped by symbol. The X-Source header reports memory, influx
+    or mixed.
+    """
+    symbols = _parse_symbols()
+    if symbols is None:
+        return jsonify({"error": f"symbols required (at most {settings.API_MAX_BATCH_SYMBOLS})"}), 400
+    measurement = request.args.get("measurement", "aggs_1m")
+
+    out = dict.fromkeys(symbols)
+    if measurement == HOT_WINDOW_MEASUREMENT:
+        out.update(_hot_last_closes(symbols))
+    missing = [s for s in symbols if out[s] is None]
+    try:
+        if missing:
+            for row in query_flux(_snapshots_flux(measurement, missing)):
+                if row.get("symbol") in out:
+                    out[row["symbol"]] = row.get("_value")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    resp = jsonify({"measurement": measurement, "snapshots": out})
+    resp.headers["X-Source"] = "influx" if len(missing) == len(symbols) else ("mixed" if missing else "memory")
+    return resp
+
+
+# Rows per DataFrame chunk parsed from the Influx CSV response (and yielded when streaming JSON)
+STREAM_CHUNK_ROWS = 10000
+
+# Peak memory per request:
+#   - format=json without lttb (/history, /indicators, /chart) is streamed: one chunk of
+#     STREAM_CHUNK_ROWS rows from Influx, or one cached chunk, at a time;
+#   - range-cache fills read at most HISTORY_CACHE_FILL_CHUNKS chunks per query;
+#   - these still hold the whole (downsampled) range, because their output needs all of it
+#     before the first byte: mode=lttb (picks points across the whole series), the columnar and
+#     binary formats (whole columns, compressed as one body), /history/batch (one object across
+#     symbols), /indicators/grid (rolling windows over every bar) and tiered reads that combine
+#     the local bar store with Influx. Their size is bounded by the range and bucket the client
+#     asks for; use resolution/max_points to keep them small.
+
+
+def _iter_clean_frames(flux, clean):
+    """Cleaned DataFrames for `flux`, decoded and sanitized a chunk at a time (empty ones skipped)."""
+    frames = iter_flux_frames(flux, chunk_rows=STREAM_CHUNK_ROWS)
+    try:
+        for df in frames:
+            frame = clean(df)
+            if len(frame):
+                yield frame
+    finally:
+        frames.close()
+
+
+def _stream_json_rows(flux, clean):
+    """
+    Run `flux` and return a Response that emits a JSON array incrementally, one decoded and
+    sanitized chunk of STREAM_CHUNK_ROWS rows at a time, so the full result is never held.
+
+    The first chunk is pulled before the response starts, so query errors still become a 500.
+    The Flux query must already return rows sorted by _time.
+    """
+    frames = _iter_clean_frames(flux, clean)
+    try:
+        first = next(frames, None)
+    except Exception:
+        frames.close()
+        raise
+
+    def generate():
+        try:
+            yield "["
+            sep = ""
+            for frame in itertools.chain([first] if first is not None else [], frames):
+                yield sep + frame_to_json_rows(frame)[1:-1]
+                sep = ","
+            yield "]"
+        finally:
+            frames.close()
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+def _dump_rows(rows):
+    return ",".join(json.dumps(r, separators=(",", ":")) for r in rows)
+
+
+def _stream_json_segments(segments):
+    """
+    Stream range-cache segments (see RangeCache.iter_segments) as one JSON array.
+    The first segment is produced before the response starts so query errors become a 500.
+    """
+    segments = iter(segments)
+    first = next(segments, None)
+
+    def generate():
+        yield "["
+        sep = ""
+        for kind, body in itertools.chain([first] if first is not None else [], segments):
+            if kind == "json":
+                # Cached or freshly encoded chunk: already-encoded rows, emitted as-is
+                parts = [body] if body else []
+            else:
+                parts = [_dump_rows(body[i:i + STREAM_CHUNK_ROWS]) for i in range(0, len(body), STREAM_CHUNK_ROWS)]
+            for part in parts:
+                yield sep + part
+                sep = ","
+        yield "]"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+def _segment_rows(segments):
+    for kind, body in segments:
+        if kind == "json":
+            yield from (json.loads("[" + body + "]") if body else [])
+        else:
+            yield from body
+
+
+def _concat_frames(frames, clean):
+    frames = list(frames)
+    if not frames:
+        return clean(None)
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def _query_clean_frame(flux, clean):
+    """
+    Whole cleaned result of `flux` as one DataFrame. Goes through query_frames, so identical
+    concurrent requests (e.g. many users opening the same chart) share one Influx query.
+    """
+    frames = (clean(df) for df in query_frames(flux, chunk_rows=STREAM_CHUNK_ROWS))
+    return _concat_frames((f for f in frames if len(f)), clean)
+
+
+def _materialize(segments, flux, clean):
+    """All cleaned rows as one DataFrame, from cache segments when available, else from the query."""
+    if segments is not None:
+        empty = clean(None)
+        rows = list(_segment_rows(segments))
+        return pd.DataFrame.from_records(rows, columns=empty.columns) if rows else empty
+    return _query_clean_frame(flux, clean)
+
+
+def _json_frame_response(frame):
+    return Response(frame_to_json_rows(frame), mimetype="application/json")
+
+
+def _parse_format():
+    fmt = request.args.get("format", "json")
+    return fmt if fmt in FORMATS else None
+
+
+def _parse_indicator_fields():
+    """Indicator fields from the `fields` query param (default: all), or None if none are valid."""
+    fields_param = request.args.get("fields", "")
+    if not fields_param.strip():
+        return list(INDICATOR_FIELDS)
+    req_fields = [f.strip() for f in fields_param.split(",") if f.strip()]
+    keep_fields = [f for f in req_fields if f in INDICATOR_FIELDS]
+    return keep_fields or None
+
+
+def _parse_iso(value):
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _epoch_iso(sec):
+    return datetime.fromtimestamp(sec, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _parse_since():
+    """The `since` cursor (epoch seconds, exclusive) or None; raises ValueError if malformed."""
+    value = request.args.get("since")
+    return int(value) if value not in (None, "") else None
+
+
+def _start_after(start, since, step_sec):
+    """
+    Range start for rows newer than `since`: the first bar/bucket boundary after it, or the
+    original `start` if that is later. Returns an ISO timestamp.
+    """
+    t0 = _parse_iso(start)
+    nxt = (since // step_sec + 1) * step_sec
+    if t0 is not None and t0.timestamp() >= nxt:
+        return start
+    return _epoch_iso(nxt)
+
+
+def _past_end(start, end):
+    t0, t1 = _parse_iso(start), _parse_iso(end)
+    return t0 is not None and t1 is not None and t0 >= t1
+
+
+def _latest_point(measurement, symbol, start, end, field):
+    """(epoch_sec, value) of the newest `field` point for `symbol` in [start, end), or None."""
+    rows = query_flux(f'''
+from(bucket: "{settings.INFLUX_BUCKET}")
+  |> range(start: time(v: "{start}"), stop: time(v: "{end}"))
+  |> filter(fn: (r) => r._measurement == "{measurement}")
+  |> filter(fn: (r) => r.symbol == "{symbol}")
+  |> filter(fn: (r) => r._field == "{field}")
+  |> last()
+''')
+    if not rows:
+        return None
+    t = rows[-1].get("_time")
+    if isinstance(t, str):
+        t = _parse_iso(t)
+    if t is None:
+        return None
+    return int(t.timestamp()), rows[-1].get("_value")
+
+
+def _body_range(start, end, since, step_sec):
+    """The range a response covers, normalized for validators: epoch (lo, hi) with `since` applied."""
+    if since is not None:
+        start = _start_after(start, since, step_sec)
+    return _range_secs(start, end, step_sec) or (start, end)
+
+
+def _validators(params, latest, version=None):
+    """
+    (etag, last_modified) for the current request. The weak ETag covers the endpoint, the parsed
+    parameters that shape the body (`params`, so argument order and spelling don't matter), the
+    newest bar's time and value, and the range cache's `version` of the rows when there is one,
+    so it changes when a bar is appended, re-sent or backfilled.
+    """
+    key = "|".join(str(p) for p in (request.path, *params, latest, version)).encode("utf-8")
+    etag = hashlib.sha1(key).hexdigest()[:24]
+    last_modified = datetime.fromtimestamp(latest[0], tz=timezone.utc) if latest else None
+    return etag, last_modified
+
+
+def _not_modified(etag, last_modified):
+    """A 304 response when the client's If-None-Match / If-Modified-Since still match, else None."""
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        matched = last_modified <= request.if_modified_since
+    else:
+        matched = False
+    if not matched:
+        return None
+    return _with_validators(Response(status=304), etag, last_modified)
+
+
+def _with_validators(resp, etag, last_modified):
+    resp.set_etag(etag, weak=True)
+    if last_modified is not None:
+        resp.last_modified = last_modified
+    # Let browsers keep the body but revalidate on every poll
+    resp.cache_control.no_cache = True
+    return resp
+
+
+def _empty_response(fmt, columns, clean):
+    if fmt == "json":
+        return Response("[]", mimetype="application/json")
+    return format_rows(clean(None), columns, fmt)
+
+
+def _range_secs(start, end, step_sec, align=False):
+    """(lo, hi) epoch seconds for ISO start/end, lo snapped down to a bucket when `align`; None if unparseable."""
+    t0, t1 = _parse_iso(start), _parse_iso(end)
+    if t0 is None or t1 is None:
+        return None
+    lo, hi = int(t0.timestamp()), int(t1.timestamp())
+    if align:
+        lo -= lo % step_sec
+    return lo, hi
+
+
+def _cached_segments(key_prefix, start, end, step_sec, flux_for, clean, align=False, fetch=None):
+    """
+    Serve [start, end) through the range cache, querying Influx only for missing chunks.
+    Returns None when the cache is disabled or start/end are not plain ISO8601 timestamps.
+
+    Args:
+        key_prefix: cache key for the series (kind, measurement, symbol, fields, resolution).
+        step_sec: bar or bucket size in seconds.
+        flux_for: callable(start_iso, end_iso) -> Flux query for that sub-range.
+        clean: frame sanitizer (services/common/columnar.py) returning rows with time_sec.
+        align: snap start down to a bucket boundary (for aggregated buckets).
+        fetch: optional callable(lo_sec, hi_sec) -> cleaned frame used instead of flux_for
+            (see _tiered_fetch).
+    """
+    cache = get_range_cache()
+    bounds = _range_secs(start, end, step_sec, align)
+    if cache is None or bounds is None:
+        return None
+    return cache.iter_segments(key_prefix, bounds[0], bounds[1], step_sec, _cache_fetch(flux_for, clean, fetch))
+
+
+def _cache_fetch(flux_for, clean, fetch=None):
+    if fetch is not None:
+        return fetch
+
+    def query(a, b):
+        return _query_clean_frame(flux_for(_epoch_iso(a), _epoch_iso(b)), clean)
+    return query
+
+
+def _request_validators(params, measurement, symbol, start, end, field, key_prefix, step_sec, flux_for, clean,
+                        align=False, fetch=None, body_start=None):
+    """
+    (etag, last_modified) of a range request (see _validators). The newest `field` row and the
+    version of the rows in [body_start or start, end) are read through the range cache (no
+    Influx round trip when the chunks are cached); without the cache the newest point comes
+    from a last() query. Both the first request and its conditional revalidations go through
+    here, so they derive the validators the same way.
+    """
+    cache = get_range_cache()
+    bounds = _range_secs(start, end, step_sec, align)
+    latest = version = None
+    if cache is not None and bounds is not None:
+        fetch = _cache_fetch(flux_for, clean, fetch)
+        latest = cache.last_row(key_prefix, bounds[0], bounds[1], step_sec, fetch, field)
+        body = _range_secs(body_start, end, step_sec, align) if body_start is not None else bounds
+        version = cache.version(key_prefix, body[0], body[1], step_sec, fetch) if body is not None else None
+    if latest is None:
+        latest = _latest_point(measurement, symbol, start, end, field)
+    return _validators(params, latest, version)
+
+
+def _symbol_predicate(symbols):
+    """Flux predicate body for one symbol (str) or a set of symbols (list)."""
+    if isinstance(symbols, str):
+        return f'r.symbol == "{symbols}"'
+    return flux_any("symbol", symbols)
+
+
+def _history_flux(measurement, symbol, start, end, window=None):
+    """
+    Pivoted OHLCV rows for one symbol, sorted by time. With `window` (a Flux duration),
+    bars are bucketed in Flux with OHLCV-correct aggregates: o=first, h=max, l=min, c=last,
+    v/n=sum and vw=volume-weighted mean of the bar VWAPs. Buckets are labelled by their start.
+    Values are cast to float so the per-field streams share one schema when regrouped.
+
+    `symbol` may also be a list: rows for all of them come back in one query, grouped by
+    and carrying a `symbol` column, each group sorted by time.
+    """
+    multi = not isinstance(symbol, str)
+    group = 'group(columns: ["symbol"])' if multi else "group()"
+    cols = '"_time","o","h","l","c","v","vw","n"' + (',"symbol"' if multi else "")
+    base = f'''
+data = from(bucket: "{settings.INFLUX_BUCKET}")
+  |> range(start: time(v: "{start}"), stop: time(v: "{end}"))
+  |> filter(fn: (r) => r._measurement == "{measurement}")
+  |> filter(fn: (r) => {_symbol_predicate(symbol)})
+'''
+    if not window:
+        return base + f'''
+data
+  |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+  |> keep(columns: [{cols}])
+  |> {group}
+  |> sort(columns: ["_time"], desc: false)
+'''
+    return base + f'''
+agg = (field, f) => data
+  |> filter(fn: (r) => r._field == field)
+  |> toFloat()
+  |> aggregateWindow(every: {window}, fn: f, createEmpty: false, timeSrc: "_start")
+pv = data
+  |> filter(fn: (r) => r._field == "vw" or r._field == "v")
+  |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+  |> map(fn: (r) => ({{r with _field: "pv", _value: r.vw * float(v: r.v)}}))
+  |> drop(columns: ["vw", "v"])
+  |> aggregateWindow(every: {window}, fn: sum, createEmpty: false, timeSrc: "_start")
+
+union(tables: [agg(field: "o", f: first), agg(field: "h", f: max), agg(field: "l", f: min),
+               agg(field: "c", f: last), agg(field: "v", f: sum), agg(field: "n", f: sum), pv])
+  |> keep(columns: ["_time", "_field", "_value"{', "symbol"' if multi else ""}])
+  |> {group}
+  |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+  |> map(fn: (r) => ({{r with vw: if exists r.pv and exists r.v and r.v > 0 then r.pv / float(v: r.v) else 0.0}}))
+  |> keep(columns: [{cols}])
+  |> sort(columns: ["_time"], desc: false)
+'''
+
+
+def _tiered_fetch(measurement, symbol, window, step_sec, start, end):
+    """
+    fetch(lo_sec, hi_sec) -> cleaned history frame that takes the closed months held by the
+    local bar store from disk (bucketed here when `window` is set, like _history_flux does in
+    Flux) and only the rest from Influx. None when the store is off or holds none of the range.
+    """
+    store = get_bar_store()
+    bounds = _range_secs(start, end, step_sec)
+    if store is None or bounds is None:
+        return None
+    mark = store.watermark(measurement, symbol)
+    if mark is None:
+        return None
+    # Only whole buckets come from disk
+    d0, d1 = mark[0] + (-mark[0] % step_sec), mark[1] - mark[1] % step_sec
+    if d1 <= max(d0, bounds[0]) or d0 >= bounds[1]:
+        return None
+
+    def influx(a, b):
+        return _query_clean_frame(_history_flux(measurement, symbol, _epoch_iso(a), _epoch_iso(b), window),
+                                  clean_history_frame)
+
+    def fetch(lo, hi):
+        a, b = max(lo, d0), min(hi, d1)
+        if a >= b:
+            return influx(lo, hi)
+        bars = store.read(measurement, symbol, a, b)
+        if window:
+            bars = aggregate_ohlcv(bars["time_sec"], bars["o"], bars["h"], bars["l"], bars["c"],
+                                   bars["v"], bars["vw"], bars["n"], step_sec)
+        parts = [influx(lo, a) if lo < a else None, bars_frame(bars), influx(b, hi) if b < hi else None]
+        return _concat_frames((p for p in parts if p is not None and len(p)), clean_history_frame)
+
+    return fetch
+
+
+def _rollup_source(symbol, window, end):
+    """
+    (measurement, flux_window) serving `window` buckets from the coarsest rollup whose bars tile
+    it and whose watermark covers the range, or None to stay on aggs_1m. flux_window is None
+    when the rollup bars already are the requested buckets.
+    """
+    window_sec = parse_duration(window)
+    picked = pick_rollup(window_sec) if window_sec else None
+    if picked is None:
+        return None
+    t1 = _parse_iso(end)
+    try:
+        covered = rollup_covers(symbol, picked[0], picked[1], t1.timestamp() if t1 else float("inf"))
+    except Exception:
+        return None  # watermark lookup failed; the minute data is always complete
+    if not covered:
+        return None
+    return picked[0], (None if picked[1] == window_sec else window)
+
+
+def _resolve_window(native_sec, start, end, mode, max_points, resolution):
+    """
+    Flux bucket for a history request, as (window or None, error or None): an explicit
+    `resolution` coarser than the native bars, else the smallest bucket fitting `max_points`.
+    """
+    if resolution:
+        res_sec = parse_duration(resolution)
+        if res_sec is None:
+            return None, "invalid resolution; use e.g. 5m, 1h, 1d"
+        return (resolution if res_sec > native_sec else None), None
+    if max_points <= 0:
+        return None, None
+    t0, t1 = _parse_iso(start), _parse_iso(end)
+    if t0 is None or t1 is None:
+        return None, "start/end must be ISO8601 when max_points is set"
+    if mode == "ohlc":
+        picked = pick_window((t1 - t0).total_seconds(), max_points, native_sec)
+    else:
+        # Pre-bucket in Flux to a few times the budget so LTTB has bounded input
+        picked = pick_window((t1 - t0).total_seconds(), max_points * 4, native_sec)
+    return (picked[1] if picked else None), None
+
 
 @api_bp.get("/history")
+@admitted(_range_lane("minute"))
 def history():
+    """
+    OHLCV bars from aggs_1d/aggs_1m.
+    Query params:
+      - symbol, start, end: required (start/end ISO8601)
+      - granularity: day|minute (default: minute)
+      - resolution: optional bucket size (e.g. 5m, 1h, 1d) aggregated in Flux
+      - max_points: optional point budget; picks the smallest bucket that fits it
+      - mode: ohlc (default) buckets bars; lttb keeps the subset of bars that best preserves
+        the close line shape (for line views), also sized by max_points
+      - format: json (default, list of row objects) | columnar (object of arrays) |
+        binary (packed int64/float64 columns, see api/formats.pack_binary); columnar and
+        binary are gzip/brotli compressed when the client accepts it
+      - since: optional time_sec cursor; only bars/buckets starting after it are returned
+    The chosen bucket is returned in the X-Resolution header ("raw" when not downsampled).
+    Bucketed minute requests are served from the coarsest rollup (aggs_5m/15m/1h/4h) that
+    tiles the bucket and is caught up; the measurement read is in X-Source-Measurement.
+    Closed months held by the local bar store (BAR_STORE_DIR) are read from disk.
+    Responses carry ETag/Last-Modified from the newest bar in [start, end) and, with the range
+    cache on, the version of the cached chunks of the range; conditional requests that still
+    match get a 304 without a query when those chunks are cached.
+    """
     symbol = request.args.get("symbol")
     gran = request.args.get("granularity", "minute")
     start = request.args.get("start")
@@ -49,63 +635,149 @@ def history():
     if not symbol or not start or not end:
         return jsonify({"error": "symbol, start, end required"}), 400
     measurement = "aggs_1d" if gran == "day" else "aggs_1m"
-    flux = f'''
-from(bucket: "{settings.INFLUX_BUCKET}")
-  |> range(start: time(v: "{start}"), stop: time(v: "{end}"))
-  |> filter(fn: (r) => r._measurement == "{measurement}")
-  |> filter(fn: (r) => r.symbol == "{symbol}")
-  |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
-  |> keep(columns: ["_time","o","h","l","c","v","vw","n"])
-'''
+    native_sec = 86400 if gran == "day" else 60
+
+    mode = request.args.get("mode", "ohlc")
+    if mode not in ("ohlc", "lttb"):
+        return jsonify({"error": "mode must be ohlc or lttb"}), 400
+    fmt = _parse_format()
+    if fmt is None:
+        return jsonify({"error": "format must be one of " + ",".join(FORMATS)}), 400
     try:
-        rows = query_flux(flux)
-        # Backend sanitation: drop invalid rows, coerce numbers, sort by time asc
-        clean = []
-        for r in rows or []:
-            t = r.get("_time")
-            if not t:
-                continue
-            # Normalize time to ISO string and epoch seconds
-            try:
-                if isinstance(t, str):
-                    dt = datetime.fromisoformat(t.replace("Z", "+00:00"))
-                else:
-                    # Influx client may return datetime already
-                    dt = t if isinstance(t, datetime) else None
-                    if dt is None:
-                        continue
-                dt = dt.astimezone(timezone.utc)
-                iso = dt.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z")
-                tsec = int(dt.timestamp())
-            except Exception:
-                continue
-            try:
-                o = float(r.get("o"))
-                h = float(r.get("h"))
-                l = float(r.get("l"))
-                c = float(r.get("c"))
-            except Exception:
-                continue
-            out = {
-                "_time": iso,
-                "time_sec": tsec,
-                "o": o,
-                "h": h,
-                "l": l,
-                "c": c,
-                "v": int(r.get("v", 0)) if r.get("v") is not None else 0,
-                "vw": float(r.get("vw", 0.0)) if r.get("vw") is not None else 0.0,
-                "n": int(r.get("n", 0)) if r.get("n") is not None else 0,
-            }
-            clean.append(out)
-        clean.sort(key=lambda x: x["time_sec"])
-        return jsonify(clean)
+        max_points = int(request.args.get("max_points", "0"))
+    except ValueError:
+        return jsonify({"error": "max_points must be an integer"}), 400
+    window, error = _resolve_window(native_sec, start, end, mode, max_points, request.args.get("resolution"))
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        since = _parse_since()
+    except ValueError:
+        return jsonify({"error": "since must be an integer time_sec"}), 400
+
+    step_sec = parse_duration(window) if window else native_sec
+    try:
+        # Bucketed minute views read the coarsest up-to-date rollup instead of every 1m bar
+        source, flux_window = measurement, window
+        if window and gran != "day" and settings.ROLLUPS_ENABLED:
+            source, flux_window = _rollup_source(symbol, window, end) or (measurement, window)
+        key_prefix = f"h|{source}|{symbol}|{flux_window or 'raw'}"
+
+        def flux_for(a, b):
+            return _history_flux(source, symbol, a, b, flux_window)
+
+        # Closed months on local disk are read there; of the rest, closed chunks come from the
+        # range cache and only missing/open chunks hit Influx
+        tiered = _tiered_fetch(source, symbol, flux_window, step_sec, start, end)
+        params = (source, symbol, flux_window or "raw", mode, max_points if mode == "lttb" else 0, fmt,
+                  _body_range(start, end, since, step_sec))
+        etag, last_modified = _request_validators(
+            params, source, symbol, start, end, "c", key_prefix, step_sec, flux_for, clean_history_frame,
+            align=bool(window), fetch=tiered)
+        not_modified = _not_modified(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        if since is not None:
+            start = _start_after(start, since, step_sec)
+            if _past_end(start, end):
+                resp = _empty_response(fmt, HISTORY_COLUMNS, clean_history_frame)
+                resp.headers["X-Resolution"] = window or "raw"
+                return _with_validators(resp, etag, last_modified)
+            tiered = _tiered_fetch(source, symbol, flux_window, step_sec, start, end)
+        segments = _cached_segments(key_prefix, start, end, step_sec, flux_for, clean_history_frame,
+                                    align=bool(window), fetch=tiered)
+        lttb = mode == "lttb" and max_points > 0
+        frame = None
+        if segments is None and tiered is not None:
+            frame = tiered(*_range_secs(start, end, step_sec, align=bool(window)))
+        elif lttb or fmt != "json":
+            frame = _materialize(segments, _history_flux(source, symbol, start, end, flux_window), clean_history_frame)
+        if frame is not None:
+            if lttb:
+                frame = _lttb_rows(frame, max_points)
+            resp = _json_frame_response(frame) if fmt == "json" else format_rows(frame, HISTORY_COLUMNS, fmt)
+        elif segments is not None:
+            resp = _stream_json_segments(segments)
+        else:
+            # Sorted server-side so chunks can be cleaned and streamed out in order
+            resp = _stream_json_rows(_history_flux(source, symbol, start, end, flux_window), clean_history_frame)
+        resp.headers["X-Resolution"] = window or "raw"
+        resp.headers["X-Source-Measurement"] = source
+        return _with_validators(resp, etag, last_modified)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+@api_bp.get("/history/batch")
+@admitted(_range_lane("minute", multi=True))
+def history_batch():
+    """
+    OHLCV bars for several symbols from one Flux query grouped by symbol.
+    Query params:
+      - symbols: required, comma-separated (at most API_MAX_BATCH_SYMBOLS)
+      - start, end, granularity, resolution, max_points, mode: as for /history (max_points
+        applies per symbol)
+      - format: json (default, {symbol: [rows]}) | columnar ({symbol: {column: [...]}})
+    Symbols without data map to an empty list/columns. X-Resolution as for /history.
+    """
+    symbols = _parse_symbols()
+    gran = request.args.get("granularity", "minute")
+    start = request.args.get("start")
+    end = request.args.get("end")
+    if symbols is None or not start or not end:
+        return jsonify({"error": f"symbols (at most {settings.API_MAX_BATCH_SYMBOLS}), start, end required"}), 400
+    measurement = "aggs_1d" if gran == "day" else "aggs_1m"
+    native_sec = 86400 if gran == "day" else 60
+
+    mode = request.args.get("mode", "ohlc")
+    if mode not in ("ohlc", "lttb"):
+        return jsonify({"error": "mode must be ohlc or lttb"}), 400
+    fmt = request.args.get("format", "json")
+    if fmt not in ("json", "columnar"):
+        return jsonify({"error": "format must be json or columnar"}), 400
+    try:
+        max_points = int(request.args.get("max_points", "0"))
+    except ValueError:
+        return jsonify({"error": "max_points must be an integer"}), 400
+    window, error = _resolve_window(native_sec, start, end, mode, max_points, request.args.get("resolution"))
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        frames = query_frames(_history_flux(measurement, symbols, start, end, window), chunk_rows=STREAM_CHUNK_ROWS)
+        raw = pd.concat(frames, ignore_index=True) if frames else None
+        out = {}
+        groups = dict(tuple(raw.groupby("symbol", sort=False))) if raw is not None and "symbol" in raw else {}
+        for sym in symbols:
+            frame = clean_history_frame(groups.get(sym))
+            if mode == "lttb" and max_points > 0:
+                frame = _lttb_rows(frame, max_points)
+            if fmt == "json":
+                out[sym] = frame
+            else:
+                out[sym] = columnar_payload(rows_to_arrays(frame, HISTORY_COLUMNS), HISTORY_COLUMNS)
+        if fmt == "json":
+            # Per-symbol arrays are encoded by pandas; only the outer object is assembled here
+            body = "{" + ",".join(json.dumps(sym) + ":" + frame_to_json_rows(f) for sym, f in out.items()) + "}"
+            resp = Response(body, mimetype="application/json")
+        else:
+            resp = compressed_response(json.dumps(out, separators=(",", ":")).encode("utf-8"), "application/json")
+        resp.headers["X-Resolution"] = window or "raw"
+        return resp
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def _lttb_rows(frame, max_points):
+    if len(frame) > max_points:
+        keep = lttb_indices(frame["time_sec"].to_numpy(), frame["c"].to_numpy(), max_points)
+        frame = frame.iloc[keep].reset_index(drop=True)
+    return frame
+
 # ... existing code ...
 
 @api_bp.get("/indicators")
+@admitted(_range_lane("day"))
 def indicators():
     """
     Return technical indicators from ta_1d/ta_1m.
@@ -114,71 +786,226 @@ def indicators():
       - granularity: day|minute (default: day)
       - start, end: ISO8601 timestamps, required
       - fields: optional comma-separated subset of [bb_l,bb_m,bb_u,macd,macds,macdh,rsi]
+      - format: json (default) | columnar | binary, as for /history (missing values are null/NaN)
+      - since: optional time_sec cursor; only rows after it are returned
+    ETag/Last-Modified and 304 handling as for /history.
     """
     symbol = request.args.get("symbol")
     gran = request.args.get("granularity", "day")
     start = request.args.get("start")
     end = request.args.get("end")
-    fields_param = request.args.get("fields", "")
 
     if not symbol or not start or not end:
         return jsonify({"error": "symbol, start, end required"}), 400
+    fmt = _parse_format()
+    if fmt is None:
+        return jsonify({"error": "format must be one of " + ",".join(FORMATS)}), 400
 
     measurement = "ta_1d" if gran == "day" else "ta_1m"
-    all_fields = ["bb_l", "bb_m", "bb_u", "macd", "macds", "macdh", "rsi"]
-    if fields_param.strip():
-        req_fields = [f.strip() for f in fields_param.split(",") if f.strip()]
-        keep_fields = [f for f in req_fields if f in all_fields]
-        if not keep_fields:
-            return jsonify({"error": "invalid fields; allowed: " + ",".join(all_fields)}), 400
-    else:
-        keep_fields = all_fields
+    keep_fields = _parse_indicator_fields()
+    if keep_fields is None:
+        return jsonify({"error": "invalid fields; allowed: " + ",".join(INDICATOR_FIELDS)}), 400
+
+    try:
+        since = _parse_since()
+    except ValueError:
+        return jsonify({"error": "since must be an integer time_sec"}), 400
+    step_sec = 86400 if gran == "day" else 60
+    columns = indicator_columns(keep_fields)
+
+    def clean(df):
+        return clean_indicator_frame(df, keep_fields)
+
+    try:
+        key_prefix = f"i|{measurement}|{symbol}|{','.join(keep_fields)}"
+
+        def flux_for(a, b):
+            return _indicators_flux(measurement, symbol, a, b, keep_fields)
+
+        params = (measurement, symbol, tuple(keep_fields), fmt, _body_range(start, end, since, step_sec))
+        etag, last_modified = _request_validators(
+            params, measurement, symbol, start, end, keep_fields[0], key_prefix, step_sec, flux_for, clean)
+        not_modified = _not_modified(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        if since is not None:
+            start = _start_after(start, since, step_sec)
+            if _past_end(start, end):
+                return _with_validators(_empty_response(fmt, columns, clean), etag, last_modified)
+        segments = _cached_segments(key_prefix, start, end, step_sec, flux_for, clean)
+        flux = _indicators_flux(measurement, symbol, start, end, keep_fields)
+        if fmt != "json":
+            resp = format_rows(_materialize(segments, flux, clean), columns, fmt)
+        elif segments is not None:
+            resp = _stream_json_segments(segments)
+        else:
+            resp = _stream_json_rows(flux, clean)
+        return _with_validators(resp, etag, last_modified)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@api_bp.get("/indicators/grid")
+@admitted(_range_lane("day"))
+def indicators_grid():
+    """
+    Indicators computed from the bars on request (services/common/indicators.py), for any
+    parameter sets rather than only the one stored in ta_1d/ta_1m.
+    Query params:
+      - symbol, start, end: required (start/end ISO8601)
+      - granularity: day|minute (default: day)
+      - parameter sets, at least one and at most API_MAX_INDICATOR_SETS in total:
+        bb=20x2,50x2.5  sma=20,50  ema=9,21  macd=12-26-9  rsi=7,14  atr=14  vwap=D,W,M
+      - format: json (default) | columnar | binary, as for /history
+    Columns are named as pandas_ta names them (BBL_20_2.0, MACDh_12_26_9, RSI_14, ATRr_14,
+    VWAP_D, ...). Bars before `start` are read so every set is warmed up at `start`.
+    ETag/Last-Modified and 304 handling as for /history.
+    """
+    symbol = request.args.get("symbol")
+    gran = request.args.get("granularity", "day")
+    start = request.args.get("start")
+    end = request.args.get("end")
+    if not symbol or not start or not end:
+        return jsonify({"error": "symbol, start, end required"}), 400
+    fmt = _parse_format()
+    if fmt is None:
+        return jsonify({"error": "format must be one of " + ",".join(FORMATS)}), 400
+    try:
+        grid = IndicatorGrid.parse({k: request.args[k] for k in IndicatorGrid.KINDS if k in request.args})
+    except ValueError as e:
+        return jsonify({"error": f"invalid indicator parameters: {e}"}), 400
+    if not 0 < grid.size <= settings.API_MAX_INDICATOR_SETS:
+        return jsonify({"error": f"between 1 and {settings.API_MAX_INDICATOR_SETS} parameter sets required "
+                                 "(" + ",".join(IndicatorGrid.KINDS) + ")"}), 400
+    measurement = "aggs_1d" if gran == "day" else "aggs_1m"
+    step_sec = 86400 if gran == "day" else 60
+    bounds = _range_secs(start, end, step_sec)
+    if bounds is None:
+        return jsonify({"error": "start and end must be ISO8601 timestamps"}), 400
+
+    try:
+        key_prefix = f"h|{measurement}|{symbol}|raw"
+
+        def flux_for(a, b):
+            return _history_flux(measurement, symbol, a, b)
+
+        # Warm-up bars before start, with slack for gaps in trading (weekends, halts)
+        lo = _epoch_iso(bounds[0] - 2 * grid.warmup * step_sec)
+        tiered = _tiered_fetch(measurement, symbol, None, step_sec, lo, end)
+        params = (measurement, symbol, tuple(grid.columns()), fmt, bounds)
+        etag, last_modified = _request_validators(
+            params, measurement, symbol, start, end, "c", key_prefix, step_sec, flux_for, clean_history_frame,
+            fetch=tiered, body_start=lo)
+        not_modified = _not_modified(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        segments = _cached_segments(key_prefix, lo, end, step_sec, flux_for, clean_history_frame, fetch=tiered)
+        if segments is None and tiered is not None:
+            bars = tiered(*_range_secs(lo, end, step_sec))
+        else:
+            bars = _materialize(segments, _history_flux(measurement, symbol, lo, end), clean_history_frame)
+
+        cols = grid.compute(*(bars[f].to_numpy(dtype="float64") for f in ("c", "h", "l", "v")),
+                            time_sec=bars["time_sec"].to_numpy(dtype="int64"))
+        keep = bars["time_sec"].to_numpy(dtype="int64") >= bounds[0]
+        names = grid.columns()
+        frame = pd.DataFrame({"_time": bars["_time"].to_numpy()[keep], "time_sec": bars["time_sec"].to_numpy()[keep],
+                              **{name: cols[name][keep] for name in names}})
+        resp = _json_frame_response(frame) if fmt == "json" else format_rows(frame, indicator_columns(names), fmt)
+        return _with_validators(resp, etag, last_modified)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
+
+def _indicators_flux(measurement, symbol, start, end, keep_fields):
     # Build Flux to pivot fields to columns and keep only requested ones
     cols = '","'.join(["_time"] + keep_fields)
-    flux = f'''
+    return f'''
 from(bucket: "{settings.INFLUX_BUCKET}")
   |> range(start: time(v: "{start}"), stop: time(v: "{end}"))
   |> filter(fn: (r) => r._measurement == "{measurement}")
   |> filter(fn: (r) => r.symbol == "{symbol}")
   |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
   |> keep(columns: ["{cols}"])
+  |> group()
+  |> sort(columns: ["_time"], desc: false)
+'''
+
+
+def _chart_flux(candles, indicators, symbol, start, end, keep_fields):
+    """
+    One pass over both measurements: candle and indicator fields are merged into a single
+    table and pivoted on _time, so each row carries the bar and its indicator values (the pivot
+    is a full outer join: a time present in only one measurement still gets a row).
+    Values are cast to float so int (v, n) and float fields share one schema.
+    """
+    return f'''
+from(bucket: "{settings.INFLUX_BUCKET}")
+  |> range(start: time(v: "{start}"), stop: time(v: "{end}"))
+  |> filter(fn: (r) => r.symbol == "{symbol}")
+  |> filter(fn: (r) => (r._measurement == "{candles}" and {flux_any("_field", HISTORY_FIELDS)})
+                    or (r._measurement == "{indicators}" and {flux_any("_field", keep_fields)}))
+  |> toFloat()
+  |> keep(columns: ["_time", "_field", "_value"])
+  |> group()
+  |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
   |> sort(columns: ["_time"], desc: false)
 '''
+
+
+@api_bp.get("/chart")
+@admitted(_range_lane("minute"))
+def chart():
+    """
+    Candles and indicators for one symbol from a single Flux query, joined on _time.
+    Query params:
+      - symbol, start, end: required (start/end ISO8601)
+      - granularity: day|minute (default: minute); reads aggs_1d+ta_1d or aggs_1m+ta_1m
+      - fields: optional comma-separated indicator subset (default: all)
+      - format: json (default) | columnar | binary, as for /history
+    Rows follow the candles (o,h,l,c,v,vw,n); indicator values missing at a bar are null/NaN.
+    A timestamp with indicator values but no candle is kept with null/NaN o,h,l,c (v, vw, n 0).
+    """
+    symbol = request.args.get("symbol")
+    gran = request.args.get("granularity", "minute")
+    start = request.args.get("start")
+    end = request.args.get("end")
+    if not symbol or not start or not end:
+        return jsonify({"error": "symbol, start, end required"}), 400
+    fmt = _parse_format()
+    if fmt is None:
+        return jsonify({"error": "format must be one of " + ",".join(FORMATS)}), 400
+    keep_fields = _parse_indicator_fields()
+    if keep_fields is None:
+        return jsonify({"error": "invalid fields; allowed: " + ",".join(INDICATOR_FIELDS)}), 400
+
+    candles, indicators = ("aggs_1d", "ta_1d") if gran == "day" else ("aggs_1m", "ta_1m")
+
+    def clean(df):
+        return clean_chart_frame(df, keep_fields)
+
     try:
-        rows = query_flux(flux)
-        # Sanitize: drop rows with missing time; coerce numeric fields; sort asc
-        clean = []
-        for r in rows or []:
-            t = r.get("_time")
-            if not t:
-                continue
-            try:
-                if isinstance(t, str):
-                    dt = datetime.fromisoformat(t.replace("Z", "+00:00"))
-                else:
-                    dt = t if isinstance(t, datetime) else None
-                    if dt is None:
-                        continue
-                dt = dt.astimezone(timezone.utc)
-                iso = dt.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z")
-                tsec = int(dt.timestamp())
-            except Exception:
-                continue
-            out = {"_time": iso, "time_sec": tsec}
-            any_valid = False
-            for f in keep_fields:
-                val = r.get(f)
-                if val is None:
-                    continue
-                try:
-                    out[f] = float(val)
-                    any_valid = True
-                except Exception:
-                    pass
-            if any_valid:
-                clean.append(out)
-        clean.sort(key=lambda x: x["time_sec"])
-        return jsonify(clean)
+        segments = _cached_segments(
+            f"c|{candles}|{indicators}|{symbol}|{','.join(keep_fields)}", start, end,
+            86400 if gran == "day" else 60,
+            lambda a, b: _chart_flux(candles, indicators, symbol, a, b, keep_fields),
+            clean,
+        )
+        flux = _chart_flux(candles, indicators, symbol, start, end, keep_fields)
+        if fmt != "json":
+            columns = HISTORY_COLUMNS + [(f, "d") for f in keep_fields]
+            return format_rows(_materialize(segments, flux, clean), columns, fmt)
+        if segments is not None:
+            return _stream_json_segments(segments)
+        return _stream_json_rows(flux, clean)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@api_bp.get("/cache/stats")
+def cache_stats():
+    cache = get_range_cache()
+    store = get_bar_store()
+    stats = cache.stats() if cache is not None else {"enabled": False}
+    stats["bar_store"] = store.stats() if store is not None else {"enabled": False}
+    return jsonify(stats)
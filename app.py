@@ -6,7 +6,9 @@ from api.routes import api_bp
 from db.mongo import mongo
 import os
 from config.settings import settings
-from influxdb_client import InfluxDBClient
+from services.common.influx import influx_health, influx_client_stats, single_flight_stats
+from services.common.admission import get_admission
+from api.admission import admitted
 from flask_cors import CORS
 
 app = Flask(__name__)
@@ -32,7 +34,12 @@ app.register_blueprint(data_bp, url_prefix='/data')
 app.register_blueprint(api_bp, url_prefix='/api')
 
 
+def _health_lane():
+    return "health"
+
+
 @app.route('/health')
+@admitted(_health_lane)
 def health():
     status = {"mongo": "unknown", "influx": "unknown"}
     # Mongo check
@@ -42,15 +49,10 @@ def health():
     except Exception as e:
         status["mongo"] = f"error: {e}"
 
-    # Influx check
+    # Influx check (shared pooled client, no per-request connection)
     try:
-        client = InfluxDBClient(url=settings.INFLUX_URL, token=settings.INFLUX_TOKEN, org=settings.INFLUX_ORG)
-        h = client.health()
-        if getattr(h, "status", "").lower() == "pass":
-            status["influx"] = "ok"
-        else:
-            status["influx"] = f"error: {getattr(h, 'message', 'unknown')}"
-        client.close()
+        ok, message = influx_health()
+        status["influx"] = "ok" if ok else f"error: {message}"
     except Exception as e:
         status["influx"] = f"error: {e}"
 
@@ -58,16 +60,23 @@ def health():
     return jsonify(status), http_code
 
 
+def _influx_stats():
+    admission = get_admission()
+    return {
+        "pool": influx_client_stats(),
+        "single_flight": single_flight_stats(),
+        "admission": admission.stats() if admission is not None else {"enabled": False},
+    }
+
+
 @app.route('/health/influx')
+@admitted(_health_lane)
 def health_influx():
     try:
-        client = InfluxDBClient(url=settings.INFLUX_URL, token=settings.INFLUX_TOKEN, org=settings.INFLUX_ORG)
-        h = client.health()
-        client.close()
-        ok = getattr(h, "status", "").lower() == "pass"
-        return jsonify({"influx": "ok" if ok else "error"}), 200 if ok else 503
+        ok, _ = influx_health()
+        return jsonify({"influx": "ok" if ok else "error", **_influx_stats()}), 200 if ok else 503
     except Exception as e:
-        return jsonify({"influx": f"error: {e}"}), 503
+        return jsonify({"influx": f"error: {e}", **_influx_stats()}), 503
 
 
 @app.route('/health/mongo')
@@ -1,9 +1,10 @@
 # blueprints/data.py (example usage)
 from flask import Blueprint, jsonify, request
-from influxdb_client import Point, WritePrecision
 from config.settings import settings  # use centralized settings
 # Prefer canonical helpers from services/common/influx
 from services.common.influx import query_flux
+from services.common.line_protocol import encode_row
+from api.admission import admitted
 
 data_bp = Blueprint("data", __name__)
 
@@ -12,26 +13,31 @@ data_bp = Blueprint("data", __name__)
 def write_ohlc():
     body = request.get_json()
     # expects symbol, interval, exchange, time_sec, open, high, low, close, volume, trades
-    p = (
-        Point("ohlc")
-        .tag("symbol", body["symbol"])
-        .tag("exchange", body["exchange"])
-        .tag("interval", body["interval"])
-        .field("open", float(body["open"]))
-        .field("high", float(body["high"]))
-        .field("low", float(body["low"]))
-        .field("close", float(body["close"]))
-        .field("volume", float(body.get("volume", 0.0)))
-        .field("trades", int(body.get("trades", 0)))
-        .time(int(body["time_sec"]) * 1_000_000_000, WritePrecision.NS)
+    line = encode_row(
+        "ohlc",
+        {"symbol": body["symbol"], "exchange": body["exchange"], "interval": body["interval"]},
+        {
+            "open": float(body["open"]),
+            "high": float(body["high"]),
+            "low": float(body["low"]),
+            "close": float(body["close"]),
+            "volume": float(body.get("volume", 0.0)),
+            "trades": int(body.get("trades", 0)),
+        },
+        int(body["time_sec"]) * 1_000_000_000,
     )
     # Use the canonical batch helper
     from services.common.influx import write_points_batch
-    write_points_batch([p])
+    write_points_batch([line])
     return jsonify({"status": "ok"})
 
 
+def _interactive():
+    return "interactive"
+
+
 @data_bp.route("/ohlc/last", methods=["GET"])
+@admitted(_interactive)
 def last_ohlc():
     symbol = request.args.get("symbol", "BTC/USD")
     interval = request.args.get("interval", "1m")
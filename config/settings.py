@@ -5,17 +5,89 @@ from dataclasses import dataclass
 class Settings:
     # Polygon
     POLYGON_API_KEY: str = os.getenv("POLYGON_API_KEY", "")
+    POLYGON_RATE_PER_SEC: float = float(os.getenv("POLYGON_RATE_PER_SEC", "20"))   # REST requests/sec; 0 = no limit
+    POLYGON_BURST: int = int(os.getenv("POLYGON_BURST", "20"))
+    POLYGON_BASE_URL: str = os.getenv("POLYGON_BASE_URL", "https://api.polygon.io")  # or a local stub
+    POLYGON_POOL_SIZE: int = int(os.getenv("POLYGON_POOL_SIZE", "16"))              # keep-alive connections
+    POLYGON_TIMEOUT_SEC: float = float(os.getenv("POLYGON_TIMEOUT_SEC", "30"))
+    POLYGON_MAX_RETRIES: int = int(os.getenv("POLYGON_MAX_RETRIES", "6"))           # 5xx/connection retries per page
+    POLYGON_PREFETCH_PAGES: int = int(os.getenv("POLYGON_PREFETCH_PAGES", "2"))     # REST read-ahead; 0 = off
+
+    # Historical backfill (services/common/backfill.py)
+    BACKFILL_WORKERS: int = int(os.getenv("BACKFILL_WORKERS", "8"))               # concurrent Polygon fetchers
+    BACKFILL_WRITERS: int = int(os.getenv("BACKFILL_WRITERS", "2"))               # concurrent Influx writers
+    BACKFILL_QUEUE_BATCHES: int = int(os.getenv("BACKFILL_QUEUE_BATCHES", "64"))  # fetched batches buffered
+    COVERAGE_DIR: str = os.getenv("COVERAGE_DIR", "var/coverage")                 # loaded-day index + checkpoints
+
+    # Indicator batch job (services/common/ta_batch.py)
+    INDICATOR_PROCESSES: int = int(os.getenv("INDICATOR_PROCESSES", "0"))         # compute processes; 0 = CPU count
+    INDICATOR_GROUP_SIZE: int = int(os.getenv("INDICATOR_GROUP_SIZE", "50"))      # symbols per grouped close query
+    API_MAX_INDICATOR_SETS: int = int(os.getenv("API_MAX_INDICATOR_SETS", "64"))  # parameter sets per /api/indicators/grid
 
     # InfluxDB v2
     INFLUX_URL: str = os.getenv("INFLUX_URL", "http://localhost:8086")
     INFLUX_TOKEN: str = os.getenv("INFLUX_TOKEN", "")
     INFLUX_ORG: str = os.getenv("INFLUX_ORG", "primary")
     INFLUX_BUCKET: str = os.getenv("INFLUX_BUCKET", "market_data")
+    INFLUX_POOL_SIZE: int = int(os.getenv("INFLUX_POOL_SIZE", "16"))                    # shared client HTTP pool
+    INFLUX_TIMEOUT_MS: int = int(os.getenv("INFLUX_TIMEOUT_MS", "10000"))
+    INFLUX_WRITE_BATCH_SIZE: int = int(os.getenv("INFLUX_WRITE_BATCH_SIZE", "1000"))    # streamer flush on size
+    INFLUX_WRITE_FLUSH_MS: int = int(os.getenv("INFLUX_WRITE_FLUSH_MS", "250"))         # ...or on this timer
+    INFLUX_WRITE_QUEUE_SIZE: int = int(os.getenv("INFLUX_WRITE_QUEUE_SIZE", "50000"))   # buffered points
+    INFLUX_SPILL_DIR: str = os.getenv("INFLUX_SPILL_DIR", "")                           # empty = backpressure
+    INFLUX_SINGLE_FLIGHT: bool = os.getenv("INFLUX_SINGLE_FLIGHT", "true").lower() == "true"  # coalesce queries
+
+    # Admission control for Influx-backed API requests (limits are per worker process)
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_INTERACTIVE_SLOTS: int = int(os.getenv("ADMISSION_INTERACTIVE_SLOTS", "8"))
+    ADMISSION_INTERACTIVE_QUEUE: int = int(os.getenv("ADMISSION_INTERACTIVE_QUEUE", "32"))
+    ADMISSION_BULK_SLOTS: int = int(os.getenv("ADMISSION_BULK_SLOTS", "2"))
+    ADMISSION_BULK_QUEUE: int = int(os.getenv("ADMISSION_BULK_QUEUE", "4"))
+    ADMISSION_HEALTH_SLOTS: int = int(os.getenv("ADMISSION_HEALTH_SLOTS", "2"))
+    ADMISSION_HEALTH_QUEUE: int = int(os.getenv("ADMISSION_HEALTH_QUEUE", "8"))
+    ADMISSION_MAX_WAIT_MS: int = int(os.getenv("ADMISSION_MAX_WAIT_MS", "2000"))       # then 503
+    ADMISSION_BULK_POINTS: int = int(os.getenv("ADMISSION_BULK_POINTS", "100000"))     # est. points => bulk lane
+
+    # Rollups (aggs_5m/15m/1h/4h from aggs_1m + aggs_stream; see services/common/rollup.py)
+    ROLLUPS_ENABLED: bool = os.getenv("ROLLUPS_ENABLED", "true").lower() == "true"   # API reads + streamer
+    ROLLUP_INTERVAL_SEC: int = int(os.getenv("ROLLUP_INTERVAL_SEC", "60"))        # streamer catch-up; 0 = off
+    ROLLUP_GRACE_SEC: int = int(os.getenv("ROLLUP_GRACE_SEC", "120"))             # late 1m bars allowance
+    ROLLUP_MAX_LAG_SEC: int = int(os.getenv("ROLLUP_MAX_LAG_SEC", "300"))         # API: max watermark lag
+    ROLLUP_CHUNK_DAYS: int = int(os.getenv("ROLLUP_CHUNK_DAYS", "30"))            # source read per query
+
+    # Local on-disk bar tier (closed months as memory-mapped Arrow files; services/common/bar_store.py)
+    BAR_STORE_DIR: str = os.getenv("BAR_STORE_DIR", "")                           # empty = off
+    BAR_STORE_GRACE_SEC: int = int(os.getenv("BAR_STORE_GRACE_SEC", "86400"))     # month closes after this
+
+    # Multi-symbol endpoints (/api/snapshots, /api/history/batch)
+    API_MAX_BATCH_SYMBOLS: int = int(os.getenv("API_MAX_BATCH_SYMBOLS", "200"))   # symbols per request
+
+    # /api/history and /api/indicators range cache
+    HISTORY_CACHE_ENABLED: bool = os.getenv("HISTORY_CACHE_ENABLED", "true").lower() == "true"
+    HISTORY_CACHE_MAX_MB: int = int(os.getenv("HISTORY_CACHE_MAX_MB", "256"))             # local LRU size
+    HISTORY_CACHE_CHUNK_ROWS: int = int(os.getenv("HISTORY_CACHE_CHUNK_ROWS", "1440"))    # bars per cached chunk
+    HISTORY_CACHE_GRACE_SEC: int = int(os.getenv("HISTORY_CACHE_GRACE_SEC", "120"))       # late-write allowance
+    HISTORY_CACHE_OPEN_TTL_SEC: float = float(os.getenv("HISTORY_CACHE_OPEN_TTL_SEC", "5"))  # open tail chunk
+    HISTORY_CACHE_FILL_CHUNKS: int = int(os.getenv("HISTORY_CACHE_FILL_CHUNKS", "4"))     # chunks per fill query
+    HISTORY_CACHE_REDIS_URL: str = os.getenv("HISTORY_CACHE_REDIS_URL", "")               # optional shared tier
 
     # Streaming
     STREAM_SYMBOLS: str = os.getenv("STREAM_SYMBOLS", "X:BTCUSD")
     WS_BIND_HOST: str = os.getenv("WS_BIND_HOST", "0.0.0.0")
     WS_BIND_PORT: int = int(os.getenv("WS_BIND_PORT", "8081"))
+    WS_CLIENT_QUEUE_SIZE: int = int(os.getenv("WS_CLIENT_QUEUE_SIZE", "1000"))      # per-client outbound buffer
+    WS_SLOW_CLIENT_POLICY: str = os.getenv("WS_SLOW_CLIENT_POLICY", "drop_oldest")  # drop_oldest|latest|disconnect
+    WS_MAX_SUBSCRIPTIONS: int = int(os.getenv("WS_MAX_SUBSCRIPTIONS", "500"))       # symbols per client
+    WS_STATS_INTERVAL_SEC: float = float(os.getenv("WS_STATS_INTERVAL_SEC", "30"))  # 0 disables lag logging
+    TA_STREAM_ENABLED: bool = os.getenv("TA_STREAM_ENABLED", "true").lower() == "true"  # live ta_1m + "ta" messages
+    TA_STREAM_SEED_DAYS: int = int(os.getenv("TA_STREAM_SEED_DAYS", "7"))           # closes read without a ta_state
+
+    # Hot window of recent bars (kept by the streamer, read by the API)
+    HOT_WINDOW_SIZE: int = int(os.getenv("HOT_WINDOW_SIZE", "1440"))              # bars kept per symbol
+    HOT_WINDOW_BIND_HOST: str = os.getenv("HOT_WINDOW_BIND_HOST", "127.0.0.1")    # no auth: keep internal
+    HOT_WINDOW_BIND_PORT: int = int(os.getenv("HOT_WINDOW_BIND_PORT", "8082"))    # streamer side; 0 = off
+    HOT_WINDOW_ADDR: str = os.getenv("HOT_WINDOW_ADDR", "")                       # API side, e.g. streamer:8082
+    HOT_WINDOW_TIMEOUT_MS: int = int(os.getenv("HOT_WINDOW_TIMEOUT_MS", "100"))
 
     # JWT
     SECRET_KEY: str = os.getenv("SECRET_KEY", "")           # Flask secret (and fallback for JWT)
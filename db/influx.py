@@ -5,12 +5,14 @@ from influxdb_client import Point, WritePrecision  # re-export types used by cal
 # Reuse the canonical helpers
 from services.common.influx import (
     get_influxdb_client,
+    get_shared_client,
     get_write_api,
     point_from_bar,
     write_points_batch,
     write_points_batch_async,
     query_flux,
 )
+from services.common.line_protocol import encode_row
 
 # Back-compat: single-point writer used by some call sites
 def write_point(measurement=None, tags=None, fields=None, timestamp_ns=None):
@@ -22,13 +24,8 @@ def write_point(measurement=None, tags=None, fields=None, timestamp_ns=None):
     if isinstance(measurement, Point):
         point = measurement
     else:
-        # Build a Point from provided args
-        p = Point(measurement or "measurement")
-        for k, v in (tags or {}).items():
-            p = p.tag(k, v)
-        for k, v in (fields or {}).items():
-            p = p.field(k, v)
-        if timestamp_ns is not None:
-            p = p.time(int(timestamp_ns), WritePrecision.NS)
-        point = p
+        # Encode the line directly from provided args
+        point = encode_row(measurement or "measurement", tags, fields or {}, timestamp_ns)
+        if point is None:
+            raise ValueError("write_point requires at least one non-null field")
     write_points_batch([point])
\ No newline at end of file
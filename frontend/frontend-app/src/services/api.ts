@@ -4,70 +4,100 @@ import axios from 'axios'
 
 const BASE = 'http://localhost:5000'
 
-// helper: parse ISO string -> epoch seconds; returns null if invalid
-function toEpochSec(t: any): number | null {
-  const ms = Date.parse(typeof t === 'string' ? t : String(t))
-  return Number.isNaN(ms) ? null : Math.floor(ms / 1000)
+type Columns = Record<string, Float64Array | BigInt64Array>
+
+// Decode the packed column format served with format=binary (see api/formats.py pack_binary):
+// "TSB1" | uint32 rows | uint16 ncols | per column: uint8 len, name, dtype ('q'|'d') | pad to 8 | data
+// Each column is a zero-copy typed-array view over the response buffer.
+export function decodeColumns(buf: ArrayBuffer): { rows: number; columns: Columns } {
+  const view = new DataView(buf)
+  const magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3))
+  if (magic !== 'TSB1') throw new Error('unexpected binary payload')
+  const rows = view.getUint32(4, true)
+  const ncols = view.getUint16(8, true)
+  let off = 10
+  const specs: Array<[string, string]> = []
+  const dec = new TextDecoder()
+  for (let i = 0; i < ncols; i++) {
+    const len = view.getUint8(off)
+    const name = dec.decode(new Uint8Array(buf, off + 1, len))
+    const code = String.fromCharCode(view.getUint8(off + 1 + len))
+    specs.push([name, code])
+    off += 2 + len
+  }
+  off += (8 - (off % 8)) % 8
+  const columns: Columns = {}
+  for (const [name, code] of specs) {
+    columns[name] = code === 'q' ? new BigInt64Array(buf, off, rows) : new Float64Array(buf, off, rows)
+    off += rows * 8
+  }
+  return { rows, columns }
 }
 
-export async function fetchCandles(symbol: string, gran: 'day' | 'minute', start: string, end: string) {
-  const url = `${BASE}/api/history`
-  const { data } = await axios.get(url, {
-    params: { symbol, granularity: gran, start, end },
+async function fetchColumns(path: string, params: Record<string, string>) {
+  const { data } = await axios.get(`${BASE}${path}`, {
+    params: { ...params, format: 'binary' },
+    responseType: 'arraybuffer',
   })
+  return decodeColumns(data as ArrayBuffer)
+}
 
-  const candles = (Array.isArray(data) ? data : [])
-    .map((r: any) => {
-      const time = toEpochSec(r?._time)
-      const open = Number(r?.o)
-      const high = Number(r?.h)
-      const low = Number(r?.l)
-      const close = Number(r?.c)
-      // filter out any invalid numbers
-      if (
-        time == null ||
-        Number.isNaN(open) ||
-        Number.isNaN(high) ||
-        Number.isNaN(low) ||
-        Number.isNaN(close)
-      ) return null
-      return {
-        time,
-        open,
-        high,
-        low,
-        close,
-        volume: Number.isNaN(Number(r?.v)) ? 0 : Number(r?.v),
-      }
-    })
-    .filter((x: any) => x !== null)
-    // sort strictly ascending by time
-    .sort((a: any, b: any) => a.time - b.time)
-
-  return candles
+export async function fetchCandles(symbol: string, gran: 'day' | 'minute', start: string, end: string) {
+  // Rows arrive sanitized and time-ordered from the API; only numbers need copying out
+  const { rows, columns } = await fetchColumns('/api/history', { symbol, granularity: gran, start, end })
+  return toCandles(rows, columns)
 }
 
 export async function fetchIndicators(symbol: string, gran: 'day' | 'minute', start: string, end: string, fields?: string[]) {
-  const url = `${BASE}/api/indicators`
-  const { data } = await axios.get(url, {
-    params: {
-      symbol,
-      granularity: gran,
-      start,
-      end,
-      ...(fields && fields.length ? { fields: fields.join(',') } : {}),
-    },
+  const { rows, columns } = await fetchColumns('/api/indicators', {
+    symbol,
+    granularity: gran,
+    start,
+    end,
+    ...(fields && fields.length ? { fields: fields.join(',') } : {}),
   })
+  return toIndicatorLines(rows, columns)
+}
+
+// Candles and indicators joined on the server from one query (/api/chart): one round trip per view
+export async function fetchChart(symbol: string, gran: 'day' | 'minute', start: string, end: string, fields?: string[]) {
+  const { rows, columns } = await fetchColumns('/api/chart', {
+    symbol,
+    granularity: gran,
+    start,
+    end,
+    ...(fields && fields.length ? { fields: fields.join(',') } : {}),
+  })
+  return { candles: toCandles(rows, columns), indicators: toIndicatorLines(rows, columns) }
+}
+
+function toCandles(rows: number, columns: Columns) {
+  const t = columns.time_sec as BigInt64Array
+  const o = columns.o as Float64Array
+  const h = columns.h as Float64Array
+  const l = columns.l as Float64Array
+  const c = columns.c as Float64Array
+  const v = columns.v as BigInt64Array
+  const candles = new Array(rows)
+  for (let i = 0; i < rows; i++) {
+    candles[i] = { time: Number(t[i]), open: o[i], high: h[i], low: l[i], close: c[i], volume: Number(v[i]) }
+  }
+  return candles
+}
 
-  const rows = (Array.isArray(data) ? data : [])
-    .map((r: any) => ({ ...r, __t: toEpochSec(r?._time) }))
-    .filter((r: any) => r.__t != null)
-    .sort((a: any, b: any) => a.__t - b.__t)
+function toIndicatorLines(rows: number, columns: Columns) {
+  const t = columns.time_sec as BigInt64Array
 
-  const toLine = (key: string) =>
-    rows
-      .filter((r: any) => r[key] != null && !Number.isNaN(Number(r[key])))
-      .map((r: any) => ({ time: r.__t, value: Number(r[key]) }))
+  // Missing values are NaN in the packed columns
+  const toLine = (key: string) => {
+    const col = columns[key] as Float64Array | undefined
+    const out: Array<{ time: number; value: number }> = []
+    if (!col) return out
+    for (let i = 0; i < rows; i++) {
+      if (!Number.isNaN(col[i])) out.push({ time: Number(t[i]), value: col[i] })
+    }
+    return out
+  }
 
   const bb_l = toLine('bb_l')
   const bb_m = toLine('bb_m')
@@ -6,36 +6,63 @@ from typing import Optional
 
 # Local imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from scripts.load_historical import load as load_cmd
+from config.settings import settings
+from services.common.backfill import default_engine, find_gaps, sync_coverage
+from services.common.coverage import get_coverage_index
+from services.common.polygon import TokenBucket
 
 
-@click.command(context_settings=dict(ignore_unknown_options=True, allow_extra_args=True))
+@click.command()
 @click.option("--symbols", required=True, help="Comma-separated list, e.g., X:BTCUSD,X:ETHUSD")
 @click.option("--granularity", type=click.Choice(["day", "minute"]), default="day")
-@click.option("--start", "start_date", required=True)
-@click.option("--end", "end_date", required=True)
+@click.option("--start", "start_date", required=True, help="Start date (YYYY-MM-DD)")
+@click.option("--end", "end_date", required=True, help="End date (YYYY-MM-DD)")
 @click.option("--adjusted", type=bool, default=True)
 @click.option("--batch-size", type=int, default=5000)
-@click.pass_context
-def backfill(ctx: click.Context, symbols: str, granularity: str, start_date: str, end_date: str, adjusted: bool,
-             batch_size: int):
+@click.option("--workers", type=int, default=None, help="Concurrent Polygon fetchers [BACKFILL_WORKERS]")
+@click.option("--writers", type=int, default=None, help="Concurrent Influx writers [BACKFILL_WRITERS]")
+@click.option("--rate", type=float, default=None, help="Polygon requests/sec, 0 = unlimited [POLYGON_RATE_PER_SEC]")
+@click.option("--chunk-months", type=int, default=1, show_default=True, help="Months per minute-data job")
+@click.option("--progress-sec", type=float, default=10.0, show_default=True, help="Progress report interval")
+@click.option("--full", is_flag=True, help="Refetch whole ranges, ignoring the coverage index")
+@click.option("--rebuild-index", is_flag=True, help="Re-scan Influx for loaded days before fetching gaps")
+@click.option("--verify", is_flag=True, help="Only list missing days (index rebuilt from Influx); no download")
+def backfill(symbols: str, granularity: str, start_date: str, end_date: str, adjusted: bool, batch_size: int,
+             workers: Optional[int], writers: Optional[int], rate: Optional[float], chunk_months: int,
+             progress_sec: float, full: bool, rebuild_index: bool, verify: bool):
     """
-    Runs the historical loader for multiple symbols sequentially.
+    Backfills many symbols concurrently: (symbol, month) jobs share one Polygon rate limit and
+    fetched batches are written to Influx by separate writer threads. Only days missing from
+    the coverage index are fetched, and finished jobs are checkpointed, so reruns resume.
     """
     sym_list = [s.strip() for s in symbols.split(",") if s.strip()]
-    for s in sym_list:
-        click.echo(f"=== Backfilling {s} ===")
-        # Reuse load_historical CLI function programmatically
-        ctx.invoke(
-            load_cmd,
-            symbol=s,
-            granularity=granularity,
-            start_date=start_date,
-            end_date=end_date,
-            adjusted=adjusted,
-            batch_size=batch_size,
-        )
-        click.echo(f"=== Done {s} ===")
+    if verify:
+        sync_coverage(get_coverage_index(), sym_list, granularity, rebuild=True, adjusted=adjusted)
+        total = 0
+        for sym, gaps in find_gaps(sym_list, start_date, end_date, granularity, adjusted=adjusted).items():
+            click.echo(f"{sym}: " + (", ".join(f"{a} -> {b}" for a, b in gaps) or "complete"))
+            total += len(gaps)
+        click.echo(f"{total} gaps across {len(sym_list)} symbols in {start_date} -> {end_date}.")
+        return
+    if not settings.POLYGON_API_KEY:
+        raise click.UsageError("POLYGON_API_KEY env var is required")
+    limiter = TokenBucket(rate, settings.POLYGON_BURST) if rate is not None else None
+    engine = default_engine(granularity, adjusted, workers=workers, writers=writers, batch_size=batch_size,
+                            limiter=limiter, coverage=False if full else None)
+
+    click.echo(f"=== Backfilling {len(sym_list)} symbols ({granularity}) {start_date} -> {end_date} "
+               f"with {engine.workers} fetchers / {engine.writers} writers ===")
+    summary = engine.run(sym_list, start_date, end_date, chunk_months=chunk_months,
+                         progress=lambda lines: click.echo("\n".join(lines)), progress_sec=progress_sec,
+                         rebuild_index=rebuild_index)
+    click.echo(f"=== Done: {summary['written']} points in {summary['elapsed_sec']}s "
+               f"({summary['bars_per_sec']:,.0f} points/s), {summary['months_stored']} months stored, "
+               f"{summary['limiter']['pauses']} rate-limit pauses, {summary['checkpoints']} of {summary['chunks']} "
+               f"chunks checkpointed ===")
+    for failure in summary["failures"]:
+        click.echo(f"Failed: {failure}", err=True)
+    if summary["failures"]:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# scripts/bar_store.py
+import os
+import sys
+from datetime import datetime, timezone
+import click
+
+# Ensure project root on path when running via docker compose
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from config.settings import settings
+from services.common.influx import query_flux
+from services.common.bar_store import get_bar_store
+
+
+def _measurement_symbols(measurement):
+    rows = query_flux(f'''
+import "influxdata/influxdb/schema"
+schema.tagValues(bucket: "{settings.INFLUX_BUCKET}", tag: "symbol",
+                 predicate: (r) => r._measurement == "{measurement}", start: 0)
+''')
+    return sorted(r["_value"] for r in rows if r.get("_value"))
+
+
+def _month(sec):
+    return datetime.fromtimestamp(sec, tz=timezone.utc).strftime("%Y-%m")
+
+
+@click.command()
+@click.option("--symbols", default="", help="Comma-separated symbols (default: every symbol in the measurement)")
+@click.option("--measurement", default="aggs_1m", show_default=True, help="Bar measurement to mirror")
+@click.option("--status", is_flag=True, help="Only print the on-disk month ranges")
+def main(symbols, measurement, status):
+    """
+    Copy closed months of bars from Influx into the local bar store (BAR_STORE_DIR).
+
+    Each symbol continues from its watermark; run it periodically (e.g. daily) to keep in sync.
+    """
+    store = get_bar_store()
+    if store is None:
+        raise click.UsageError("BAR_STORE_DIR is not set")
+    sym_list = [s.strip() for s in symbols.split(",") if s.strip()] or _measurement_symbols(measurement)
+    if not sym_list:
+        click.echo(f"No symbols found in '{measurement}'.")
+        return
+
+    for sym in sym_list:
+        if status:
+            mark = store.watermark(measurement, sym)
+            shown = f"{_month(mark[0])} .. {_month(mark[1] - 1)}" if mark else "-"
+            click.echo(f"{sym}: {shown}")
+        else:
+            n = store.sync(measurement, sym)
+            click.echo(f"{sym}: synced {n} months")
+
+
+if __name__ == "__main__":
+    main()
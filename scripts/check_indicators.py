@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# scripts/check_indicators.py
+import os
+import sys
+import time
+import click
+import numpy as np
+import pandas as pd
+
+# Ensure project root on path when running via docker compose
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from config.settings import settings
+from services.common.influx import query_frames
+from services.common.columnar import clean_history_frame
+from services.common.indicators import IndicatorGrid
+
+
+def _influx_bars(symbol, granularity, start, end):
+    measurement = "aggs_1d" if granularity == "day" else "aggs_1m"
+    frames = query_frames(f'''
+from(bucket: "{settings.INFLUX_BUCKET}")
+  |> range(start: time(v: "{start}"), stop: time(v: "{end}"))
+  |> filter(fn: (r) => r._measurement == "{measurement}")
+  |> filter(fn: (r) => r.symbol == "{symbol}")
+  |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+  |> keep(columns: ["_time","o","h","l","c","v","vw","n"])
+  |> group()
+  |> sort(columns: ["_time"], desc: false)
+''')
+    return clean_history_frame(pd.concat(frames, ignore_index=True) if frames else None)
+
+
+def _synthetic_bars(n, seed):
+    """Random-walk minute bars (log-normal closes, high/low around them)."""
+    rng = np.random.default_rng(seed)
+    c = 30000.0 * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    spread = np.abs(rng.normal(0, 0.001, (2, n)))
+    return pd.DataFrame({
+        "time_sec": 1_700_000_000 + 60 * np.arange(n, dtype=np.int64),
+        "h": c * (1 + spread[0]), "l": c * (1 - spread[1]), "c": c,
+        "v": rng.integers(1, 1000, n).astype(np.float64),
+    })
+
+
+def _pandas_ta(grid, bars):
+    """pandas_ta output for every column of `grid` (same column names)."""
+    import pandas_ta as ta  # reference implementation, only needed here
+
+    index = pd.DatetimeIndex(pd.to_datetime(bars["time_sec"].to_numpy(), unit="s"))
+    close, high, low = (pd.Series(bars[f].to_numpy(dtype=np.float64), index=index) for f in ("c", "h", "l"))
+    volume = pd.Series(bars["v"].to_numpy(dtype=np.float64), index=index)
+    parts = [ta.bbands(close, length=n, std=s) for n, s in grid.bb]
+    parts += [ta.sma(close, length=n) for n in grid.sma] + [ta.ema(close, length=n) for n in grid.ema]
+    parts += [ta.macd(close, fast=f, slow=s, signal=g) for f, s, g in grid.macd]
+    parts += [ta.rsi(close, length=n) for n in grid.rsi]
+    parts += [ta.atr(high, low, close, length=n) for n in grid.atr]
+    parts += [ta.vwap(high, low, close, volume, anchor=a) for a in grid.vwap]
+    out = {}
+    for part in parts:
+        if part is None:
+            continue
+        for name, col in (part.items() if isinstance(part, pd.DataFrame) else [(part.name, part)]):
+            out[name] = col.to_numpy(dtype=np.float64)
+    return out
+
+
+@click.command()
+@click.option("--symbol", default=None, help="Check against this symbol's bars (default: synthetic bars)")
+@click.option("--granularity", type=click.Choice(["day", "minute"]), default="minute")
+@click.option("--start", "start_date", default=None, help="Start ISO8601 (with --symbol)")
+@click.option("--end", "end_date", default=None, help="End ISO8601 (with --symbol)")
+@click.option("--bars", type=int, default=200_000, show_default=True, help="Synthetic bar count")
+@click.option("--seed", type=int, default=1, show_default=True)
+@click.option("--bb", default="10x2,20x2,20x2.5,50x2", show_default=True, help="length x std pairs")
+@click.option("--sma", default="20,50", show_default=True)
+@click.option("--ema", default="9,21", show_default=True)
+@click.option("--macd", default="12-26-9,5-35-5", show_default=True, help="fast-slow-signal triples")
+@click.option("--rsi", default="7,14", show_default=True)
+@click.option("--atr", default="14", show_default=True)
+@click.option("--vwap", default="D", show_default=True, help="Anchors (D, W, M)")
+@click.option("--tolerance", type=float, default=1e-8, show_default=True,
+              help="Max |difference| relative to the column's largest |value|")
+def main(symbol, granularity, start_date, end_date, bars, seed, bb, sma, ema, macd, rsi, atr, vwap, tolerance):
+    """
+    Compare the services/common/indicators.py grid with pandas_ta, column by column.
+
+    Exits with status 1 when a column differs beyond --tolerance or has NaNs in other places.
+    """
+    grid = IndicatorGrid.parse({"bb": bb, "sma": sma, "ema": ema, "macd": macd, "rsi": rsi, "atr": atr,
+                                "vwap": vwap})
+    if symbol:
+        if not start_date or not end_date:
+            raise click.UsageError("--symbol needs --start and --end")
+        frame = _influx_bars(symbol, granularity, start_date, end_date)
+    else:
+        frame = _synthetic_bars(bars, seed)
+    if frame.empty:
+        click.echo("No bars to check.")
+        return
+
+    t0 = time.perf_counter()
+    ours = grid.compute(frame["c"].to_numpy(), frame["h"].to_numpy(), frame["l"].to_numpy(),
+                        frame["v"].to_numpy(), frame["time_sec"].to_numpy())
+    t1 = time.perf_counter()
+    ref = _pandas_ta(grid, frame)
+    t2 = time.perf_counter()
+    click.echo(f"{len(frame)} bars, {grid.size} parameter sets: grid {t1 - t0:.3f}s, pandas_ta {t2 - t1:.3f}s")
+
+    failed = 0
+    for name in grid.columns():
+        if name not in ref:
+            click.echo(f"{name:>16}: no pandas_ta output")
+            failed += 1
+            continue
+        a, b = ours[name], ref[name]
+        same_nan = np.array_equal(np.isnan(a), np.isnan(b))
+        both = np.isfinite(a) & np.isfinite(b)
+        scale = np.max(np.abs(b[both]), initial=0.0) or 1.0
+        err = np.max(np.abs(a[both] - b[both]), initial=0.0) / scale
+        ok = same_nan and err <= tolerance
+        failed += not ok
+        click.echo(f"{name:>16}: max rel diff {err:.2e}{'' if same_nan else ', NaN positions differ'}"
+                   f"{'' if ok else '  <-- FAIL'}")
+    if failed:
+        click.echo(f"{failed} columns differ.", err=True)
+        sys.exit(1)
+    click.echo("All columns match.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,133 +1,91 @@
 #!/usr/bin/env python3
 import os
 import sys
-import math
 import click
-import pandas as pd
-import pandas_ta as ta
 
 # Ensure project root on path when running via docker compose
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from config.settings import settings
-from services.common.influx import query_flux, write_points_batch
-from influxdb_client import Point, WritePrecision
+from services.common.influx import query_flux
+from services.common.ta_batch import bars_measurement, default_batch, epoch_sec, ta_measurement
+from services.common.ta_state import IndicatorParams
 
 
-def _fetch_close_series(symbol, granularity, start, end):
-    measurement = "aggs_1d" if granularity == "day" else "aggs_1m"
-    flux = f'''
-from(bucket: "{settings.INFLUX_BUCKET}")
-  |> range(start: time(v: "{start}"), stop: time(v: "{end}"))
-  |> filter(fn: (r) => r._measurement == "{measurement}")
-  |> filter(fn: (r) => r.symbol == "{symbol}")
-  |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
-  |> keep(columns: ["_time","c"])
-'''
-    rows = query_flux(flux)
-    if not rows:
-        return pd.DataFrame(columns=["_time", "c"])
-    df = pd.DataFrame(rows)
-    # Normalize column names if Flux returns different keys casing
-    if "_time" not in df.columns:
-        # try to find time column
-        for k in df.columns:
-            if k.lower() == "_time":
-                df.rename(columns={k: "_time"}, inplace=True)
-                break
-    if "c" not in df.columns:
-        raise RuntimeError("No 'c' (close) field found in queried data.")
-    df["_time"] = pd.to_datetime(df["_time"])
-    df.sort_values("_time", inplace=True)
-    df.set_index("_time", inplace=True)
-    return df[["c"]]
-
-
-def _compute_indicators(df, bb_length, bb_std, macd_fast, macd_slow, macd_signal, rsi_length):
-    out = pd.DataFrame(index=df.index)
-    close = df["c"].astype(float)
-
-    # Bollinger Bands (middle band is SMA)
-    bb = ta.bbands(close, length=bb_length, std=bb_std)
-    if bb is not None and not bb.empty:
-        # bb columns typically: BBL_<len>_<std>.0, BBM_<len>_<std>.0, BBU_<len>_<std>.0
-        out["bb_l"] = bb.iloc[:, 0]
-        out["bb_m"] = bb.iloc[:, 1]
-        out["bb_u"] = bb.iloc[:, 2]
-
-    # MACD
-    macd = ta.macd(close, fast=macd_fast, slow=macd_slow, signal=macd_signal)
-    if macd is not None and not macd.empty:
-        # macd columns typically: MACD_<fast>_<slow>_<signal>, MACDs_<...>, MACDh_<...>
-        out["macd"] = macd.iloc[:, 0]
-        out["macds"] = macd.iloc[:, 1]
-        out["macdh"] = macd.iloc[:, 2]
-
-    # RSI
-    rsi = ta.rsi(close, length=rsi_length)
-    if rsi is not None and not rsi.empty:
-        out["rsi"] = rsi
-
-    return out
-
-
-def _points_from_indicators(symbol, granularity, indicators):
-    measurement = "ta_1d" if granularity == "day" else "ta_1m"
-    tags = {"symbol": symbol, "source": "ta"}
-    points = []
-    for ts, row in indicators.iterrows():
-        # Skip if all NaN (warm-up period)
-        if row.isna().all():
-            continue
-        p = Point(measurement)
-        for k, v in tags.items():
-            p = p.tag(k, v)
-        # Add fields only when not NaN
-        for fname in ["bb_l", "bb_m", "bb_u", "macd", "macds", "macdh", "rsi"]:
-            val = row.get(fname)
-            if val is not None and not (isinstance(val, float) and math.isnan(val)):
-                p = p.field(fname, float(val))
-        # Time in ns
-        p = p.time(int(pd.Timestamp(ts).value), WritePrecision.NS)
-        points.append(p)
-    return points
+def _measurement_symbols(measurement):
+    rows = query_flux(f'''
+import "influxdata/influxdb/schema"
+schema.tagValues(bucket: "{settings.INFLUX_BUCKET}", tag: "symbol",
+                 predicate: (r) => r._measurement == "{measurement}", start: 0)
+''')
+    return sorted(r["_value"] for r in rows if r.get("_value"))
 
 
 @click.command()
-@click.option("--symbol", required=True, help="Ticker symbol (e.g., X:BTCUSD)")
+@click.option("--symbol", default=None, help="Ticker symbol (e.g., X:BTCUSD)")
+@click.option("--symbols", default=None, help="Comma-separated symbols, e.g., X:BTCUSD,X:ETHUSD")
+@click.option("--all-symbols", is_flag=True, help="Every symbol in the bar measurement (aggs_1d / aggs_1m)")
 @click.option("--granularity", type=click.Choice(["day", "minute"]), default="day")
-@click.option("--start", "start_date", required=True, help="Start ISO8601 (e.g., 2023-01-01T00:00:00Z)")
-@click.option("--end", "end_date", required=True, help="End ISO8601 (e.g., 2023-12-31T23:59:59Z)")
+@click.option("--start", "start_date", default=None,
+              help="Start ISO8601 (e.g., 2023-01-01T00:00:00Z); optional with --incremental once state exists")
+@click.option("--end", "end_date", default=None,
+              help="End ISO8601 (e.g., 2023-12-31T23:59:59Z); defaults to the start of the current bar")
+@click.option("--incremental", is_flag=True, default=False,
+              help="Continue from the saved indicator state: fetch only the warm-up lookback and new bars")
+@click.option("--processes", type=int, default=None, help="Compute processes, 1 = in-process [INDICATOR_PROCESSES]")
+@click.option("--group-size", type=int, default=None, help="Symbols per grouped close query [INDICATOR_GROUP_SIZE]")
+@click.option("--batch-size", type=int, default=None, help="Points per Influx write [INFLUX_WRITE_BATCH_SIZE]")
+@click.option("--progress-sec", type=float, default=10.0, show_default=True, help="Progress report interval")
 @click.option("--bb-length", type=int, default=20, show_default=True, help="Bollinger Bands length (SMA)")
 @click.option("--bb-std", type=float, default=2.0, show_default=True, help="Bollinger Bands stddev")
 @click.option("--macd-fast", type=int, default=12, show_default=True, help="MACD fast length")
 @click.option("--macd-slow", type=int, default=26, show_default=True, help="MACD slow length")
 @click.option("--macd-signal", type=int, default=9, show_default=True, help="MACD signal length")
 @click.option("--rsi-length", type=int, default=14, show_default=True, help="RSI length")
-def main(symbol, granularity, start_date, end_date, bb_length, bb_std, macd_fast, macd_slow, macd_signal, rsi_length):
+def main(symbol, symbols, all_symbols, granularity, start_date, end_date, incremental, processes, group_size,
+         batch_size, progress_sec, bb_length, bb_std, macd_fast, macd_slow, macd_signal, rsi_length):
+    """
+    Compute BBANDS/MACD/RSI from closes and write them to ta_1d / ta_1m.
+
+    Several symbols are fetched in grouped queries, computed across a process pool and written
+    through one shared writer; a summary line per symbol reports timings and failures.
+    """
     if not settings.INFLUX_URL or not settings.INFLUX_TOKEN or not settings.INFLUX_ORG or not settings.INFLUX_BUCKET:
         raise click.UsageError("InfluxDB settings missing (INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG, INFLUX_BUCKET).")
-
-    click.echo(f"Loading close series for {symbol} [{granularity}] {start_date} -> {end_date} ...")
-    df = _fetch_close_series(symbol, granularity, start_date, end_date)
-    if df.empty:
-        click.echo("No data found in Influx for the given range.")
-        return
-
-    click.echo("Computing indicators (BBANDS, MACD, RSI) ...")
-    indicators = _compute_indicators(df, bb_length, bb_std, macd_fast, macd_slow, macd_signal, rsi_length)
-
-    click.echo("Preparing points ...")
-    points = _points_from_indicators(symbol, granularity, indicators)
-    if not points:
-        click.echo("Nothing to write (likely due to warm-up NaNs).")
+    if sum(map(bool, (symbol, symbols, all_symbols))) != 1:
+        raise click.UsageError("Pass exactly one of --symbol, --symbols or --all-symbols.")
+    if not start_date and not incremental:
+        raise click.UsageError("--start is required unless --incremental is set.")
+
+    if all_symbols:
+        sym_list = _measurement_symbols(bars_measurement(granularity))
+    else:
+        sym_list = [s.strip() for s in (symbols or symbol).split(",") if s.strip()]
+    if not sym_list:
+        click.echo(f"No symbols found in '{bars_measurement(granularity)}'.")
         return
 
-    click.echo(f"Writing {len(points)} indicator points to Influx measurement "
-               f"{'ta_1d' if granularity=='day' else 'ta_1m'} ...")
-    write_points_batch(points)
-    click.echo("Done.")
+    params = IndicatorParams(bb_length, bb_std, macd_fast, macd_slow, macd_signal, rsi_length)
+    # A single symbol has nothing to spread across processes
+    batch = default_batch(granularity, params, processes=1 if len(sym_list) == 1 else processes,
+                          group_size=group_size, batch_size=batch_size)
+    start_sec = epoch_sec(start_date) if start_date else None
+    end_sec = epoch_sec(end_date) if end_date else None
+    click.echo(f"=== Indicators (BBANDS, MACD, RSI) for {len(sym_list)} symbols [{granularity}] "
+               f"{start_date or 'saved state'} -> {end_date or 'now'}"
+               f"{' (incremental)' if incremental else ''} with {batch.processes} processes ===")
+    summary = batch.run(sym_list, start_sec, end_sec, incremental=incremental,
+                        progress=lambda lines: click.echo("\n".join(lines)), progress_sec=progress_sec)
+
+    for res in summary["results"]:
+        click.echo(res.line(), err=bool(res.error))
+    click.echo(f"=== Done: {summary['written']} points to {ta_measurement(granularity)} in {summary['elapsed_sec']}s "
+               f"({summary['points_per_sec']:,.0f} points/s; fetch {summary['fetch_sec']}s, compute "
+               f"{summary['compute_sec']}s, write {summary['write_sec']}s), {summary['failed']} of "
+               f"{summary['symbols']} symbols failed ===")
+    if summary["failures"]:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,28 +1,24 @@
 import sys
 from typing import List, Dict, Any
-from influxdb_client import Point, WritePrecision
 from db.influx import write_points_batch
+from services.common.line_protocol import encode_row, series_key
 
 def to_ns(sec: int) -> int:
     return sec * 1_000_000_000
 
-def build_points(symbol: str, interval: str, exchange: str, candles: List[Dict[str, Any]]) -> List[Point]:
+def build_points(symbol: str, interval: str, exchange: str, candles: List[Dict[str, Any]]) -> List[str]:
+    key = series_key("ohlc", {"symbol": symbol, "exchange": exchange, "interval": interval})
     points = []
     for c in candles:
-        p = (
-            Point("ohlc")
-            .tag("symbol", symbol)
-            .tag("exchange", exchange)
-            .tag("interval", interval)
-            .field("open", float(c["open"]))
-            .field("high", float(c["high"]))
-            .field("low", float(c["low"]))
-            .field("close", float(c["close"]))
-            .field("volume", float(c.get("volume", 0.0)))
-            .field("trades", int(c.get("trades", 0)))
-            .time(to_ns(int(c["time_sec"])), WritePrecision.NS)
-        )
-        points.append(p)
+        fields = {
+            "open": float(c["open"]),
+            "high": float(c["high"]),
+            "low": float(c["low"]),
+            "close": float(c["close"]),
+            "volume": float(c.get("volume", 0.0)),
+            "trades": int(c.get("trades", 0)),
+        }
+        points.append(encode_row("ohlc", None, fields, to_ns(int(c["time_sec"])), key=key))
     return points
 
 def main():
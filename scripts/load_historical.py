@@ -1,20 +1,14 @@
 #!/usr/bin/env python3
-import os
-import sys
-import time
-import click
 # scripts/load_historical.py
-#!/usr/bin/env python3
 import os
 import sys
-import time
 import click
 
 # Ensure project root on path when running via docker compose
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from services.common.polygon import list_aggregates
-from services.common.influx import write_points_batch, point_from_bar
+from services.common.backfill import default_engine, find_gaps, sync_coverage
+from services.common.coverage import get_coverage_index
 from config.settings import settings
 
 @click.command()
@@ -24,42 +18,40 @@ from config.settings import settings
 @click.option("--end", "end_date", required=True, help="End date (YYYY-MM-DD)")
 @click.option("--adjusted", type=bool, default=True, help="Use adjusted aggregates")
 @click.option("--batch-size", type=int, default=5000, help="Influx write batch size")
-def load(symbol, granularity, start_date, end_date, adjusted, batch_size):
+@click.option("--full", is_flag=True, help="Refetch the whole range, ignoring the coverage index")
+@click.option("--rebuild-index", is_flag=True, help="Re-scan Influx for loaded days before fetching gaps")
+@click.option("--verify", is_flag=True, help="Only list missing days (index rebuilt from Influx); no download")
+def load(symbol, granularity, start_date, end_date, adjusted, batch_size, full, rebuild_index, verify):
+    measurement = "aggs_1d" if granularity == "day" else "aggs_1m"
+    if verify:
+        sync_coverage(get_coverage_index(), [symbol], granularity, rebuild=True, adjusted=adjusted)
+        gaps = find_gaps([symbol], start_date, end_date, granularity, adjusted=adjusted)[symbol]
+        for a, b in gaps:
+            click.echo(f"{symbol} {measurement}: missing {a} -> {b}")
+        click.echo(f"{len(gaps)} gaps in {start_date} -> {end_date}.")
+        return
+
     api_key = settings.POLYGON_API_KEY
     if not api_key:
         raise click.UsageError("POLYGON_API_KEY env var is required")
 
-    measurement = "aggs_1d" if granularity == "day" else "aggs_1m"
-    tags = {"symbol": symbol, "source": "polygon", "adjusted": str(adjusted).lower()}
-
     click.echo(f"Fetching {granularity} aggregates for {symbol} {start_date} -> {end_date} (adjusted={adjusted})")
-    total = 0
-    batch = []
-
-    for bar in list_aggregates(
-        api_key=api_key,
-        symbol=symbol,
-        multiplier=1,
-        timespan=granularity,
-        start=start_date,
-        end=end_date,
-        adjusted=adjusted,
-        sort="asc",
-        limit=50000,
-    ):
-        pt = point_from_bar(measurement, tags, bar)
-        batch.append(pt)
-        if len(batch) >= batch_size:
-            write_points_batch(batch)
-            total += len(batch)
-            batch.clear()
-            time.sleep(0.05)
-
-    if batch:
-        write_points_batch(batch)
-        total += len(batch)
 
-    click.echo(f"Done. Wrote {total} points to Influx '{settings.INFLUX_BUCKET}' in measurement '{measurement}'.")
+    # One fetcher walks the missing month chunks in order while writer threads drain batches
+    # to Influx; finished chunks are checkpointed so a rerun continues where this one stopped
+    engine = default_engine(granularity, adjusted, workers=1, batch_size=batch_size,
+                            coverage=False if full else None)
+    summary = engine.run([symbol], start_date, end_date, rebuild_index=rebuild_index)
+    if engine.coverage is not None:
+        click.echo(f"{summary['chunks']} missing chunks fetched ({summary['checkpoints']} checkpointed).")
+    for failure in summary["failures"]:
+        click.echo(f"Failed: {failure}", err=True)
+
+    click.echo(f"Done. Wrote {summary['written']} points to Influx '{settings.INFLUX_BUCKET}' in measurement '{measurement}'.")
+    if engine.store is not None:
+        click.echo(f"Stored {summary['months_stored']} closed months in the local bar store ({settings.BAR_STORE_DIR}).")
+    if summary["failures"]:
+        sys.exit(1)
 
 if __name__ == "__main__":
     load()
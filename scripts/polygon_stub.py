@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# scripts/polygon_stub.py
+# Local stand-in for the Polygon aggregates REST endpoint, for exercising the REST client and
+# backfills without an API key: run it, then set POLYGON_BASE_URL=http://localhost:8090.
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import threading
+import urllib.parse
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import click
+
+# Ensure project root on path when running via docker compose
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.common.polygon import TokenBucket
+
+SPAN_SEC = {"minute": 60, "hour": 3600, "day": 86400}
+
+
+def _day_ms(value, end=False):
+    dt = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000) + (86_400_000 if end else 0)
+
+
+def synthetic_bars(symbol, step_ms, lo_ms, hi_ms):
+    """Deterministic random-walk bars for [lo_ms, hi_ms) (same symbol and time -> same bar)."""
+    out = []
+    for t in range(-(-lo_ms // step_ms) * step_ms, hi_ms, step_ms):
+        rnd = random.Random(f"{symbol}:{t}")
+        base = 100.0 + sum(map(ord, symbol)) % 1000 + rnd.uniform(-1, 1)
+        o, c = base, base + rnd.uniform(-0.5, 0.5)
+        out.append({"t": t, "o": o, "h": max(o, c) + rnd.random(), "l": min(o, c) - rnd.random(), "c": c,
+                    "v": rnd.randint(1, 1000), "vw": (o + c) / 2, "n": rnd.randint(1, 50)})
+    return out
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        gz = "gzip" in self.headers.get("Accept-Encoding", "")
+        if gz:
+            body = gzip.compress(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if gz:
+            self.send_header("Content-Encoding", "gzip")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        # v2/aggs/ticker/{symbol}/range/{multiplier}/{timespan}/{from}/{to}
+        if len(parts) != 9 or parts[:3] != ["v2", "aggs", "ticker"] or parts[4] != "range":
+            return self._send(404, {"status": "NOT_FOUND"})
+        if self.server.limiter is not None and not self.server.limiter.try_acquire():
+            return self._send(429, {"status": "ERROR", "error": "rate limited"}, {"Retry-After": "1"})
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        symbol = urllib.parse.unquote(parts[3])
+        step_ms = int(parts[5]) * SPAN_SEC.get(parts[6], 60) * 1000
+        q = urllib.parse.parse_qs(url.query)
+        limit = min(int(q.get("limit", ["5000"])[0]), self.server.page_size)
+        lo = int(q["cursor"][0]) if "cursor" in q else _day_ms(parts[7])
+        hi = _day_ms(parts[8], end=True)
+        bars = synthetic_bars(symbol, step_ms, lo, min(hi, lo + limit * step_ms))
+        payload = {"ticker": symbol, "status": "OK", "resultsCount": len(bars), "results": bars}
+        if bars and bars[-1]["t"] + step_ms < hi:
+            query = {k: v[0] for k, v in q.items() if k != "apiKey"}
+            query["cursor"] = str(bars[-1]["t"] + step_ms)
+            payload["next_url"] = f"http://{self.headers.get('Host')}{url.path}?{urllib.parse.urlencode(query)}"
+        self._send(200, payload)
+
+
+class _StubLimiter(TokenBucket):
+    """Server-side token bucket that refuses (-> 429) instead of waiting."""
+
+    def try_acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + max(0.0, now - self._updated) * self.rate)
+            self._updated = max(self._updated, now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+def make_server(host="127.0.0.1", port=8090, page_size=50000, rate=0.0, latency_ms=0, verbose=False):
+    """A ThreadingHTTPServer serving the stub (port 0 picks a free port); call serve_forever()."""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.page_size = page_size
+    server.limiter = _StubLimiter(rate, max(1, int(rate))) if rate > 0 else None
+    server.latency = latency_ms / 1000.0
+    server.verbose = verbose
+    server.lock = threading.Lock()
+    server.connections = 0
+    return server
+
+
+def start_in_thread(**kwargs):
+    """Start the stub on a background thread; returns (server, base_url)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="polygon-stub", daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=8090, show_default=True)
+@click.option("--page-size", type=int, default=50000, show_default=True, help="Max bars per page")
+@click.option("--rate", type=float, default=0.0, show_default=True, help="Requests/sec before 429s; 0 = none")
+@click.option("--latency-ms", type=int, default=0, show_default=True, help="Added delay per request")
+@click.option("--verbose", is_flag=True, help="Log every request")
+def main(host, port, page_size, rate, latency_ms, verbose):
+    """Serve synthetic Polygon aggregates (paginated, gzip, optional 429s)."""
+    server = make_server(host, port, page_size, rate, latency_ms, verbose)
+    click.echo(f"Polygon stub on http://{host}:{port} (POLYGON_BASE_URL)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
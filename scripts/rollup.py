@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# scripts/rollup.py
+import os
+import sys
+from datetime import datetime, timezone
+import click
+
+# Ensure project root on path when running via docker compose
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from config.settings import settings
+from services.common.influx import flux_any, query_flux
+from services.common.rollup import (ROLLUP_SOURCE, ROLLUP_SOURCES, ROLLUPS, catch_up, rebuild, read_watermarks,
+                                    rewind_watermarks)
+
+
+def _source_symbols(source):
+    sources = ROLLUP_SOURCES if source == ROLLUP_SOURCE else (source,)
+    rows = query_flux(f'''
+import "influxdata/influxdb/schema"
+schema.tagValues(bucket: "{settings.INFLUX_BUCKET}", tag: "symbol",
+                 predicate: (r) => {flux_any("_measurement", sources)}, start: 0)
+''')
+    return sorted(r["_value"] for r in rows if r.get("_value"))
+
+
+def _epoch(value):
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+@click.command()
+@click.option("--symbols", default="", help="Comma-separated symbols (default: every symbol in the source)")
+@click.option("--source", default=ROLLUP_SOURCE, show_default=True, help="Measurement rolled up (aggs_1m: merged with aggs_stream)")
+@click.option("--rebuild", "do_rebuild", is_flag=True, help="Delete and recompute rollups over --start/--end")
+@click.option("--start", "start_date", help="Rebuild start (YYYY-MM-DD or ISO8601)")
+@click.option("--end", "end_date", help="Rebuild end (YYYY-MM-DD or ISO8601)")
+@click.option("--since", "since_date", help="Catch up again from this date (e.g. after a backfill of it)")
+@click.option("--status", is_flag=True, help="Only print the stored watermarks")
+def main(symbols, source, do_rebuild, start_date, end_date, since_date, status):
+    """
+    Maintain aggs_5m/aggs_15m/aggs_1h/aggs_4h from 1-minute bars.
+
+    By default each symbol is caught up from its watermark to the last closed bucket; with
+    --since the watermarks are first moved back to that date.
+    """
+    sym_list = [s.strip() for s in symbols.split(",") if s.strip()] or _source_symbols(source)
+    if not sym_list:
+        click.echo(f"No symbols found in '{source}'.")
+        return
+    if do_rebuild and not (start_date and end_date):
+        raise click.UsageError("--rebuild requires --start and --end")
+
+    for sym in sym_list:
+        if status:
+            marks = read_watermarks(sym, source)
+            shown = ", ".join(
+                f"{m}={datetime.fromtimestamp(marks[m], tz=timezone.utc):%Y-%m-%dT%H:%MZ}" if m in marks else f"{m}=-"
+                for m, _ in ROLLUPS
+            )
+            click.echo(f"{sym}: {shown}")
+        elif do_rebuild:
+            n = rebuild(sym, _epoch(start_date), _epoch(end_date), source=source)
+            click.echo(f"{sym}: rebuilt {n} bucket points")
+        else:
+            if since_date:
+                rewind_watermarks(sym, _epoch(since_date), source=source)
+            n = catch_up(sym, source=source)
+            click.echo(f"{sym}: wrote {n} bucket points")
+
+
+if __name__ == "__main__":
+    main()
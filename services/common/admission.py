@@ -0,0 +1,157 @@
+# services/common/admission.py
+# Admission control for Influx-backed work: per-lane concurrency limits with bounded wait queues.
+import time
+import threading
+
+from config.settings import settings
+
+LANES = ("interactive", "bulk", "health")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a lane cannot take more work: `status` is 429 (queue full) or 503 (waited too long)."""
+
+    def __init__(self, lane, status, retry_after, reason):
+        super().__init__(f"{lane} lane {reason}")
+        self.lane = lane
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class Ticket:
+    """A held slot; release() is idempotent so it can be wired to several cleanup paths."""
+
+    __slots__ = ("_lane", "_released")
+
+    def __init__(self, lane):
+        self._lane = lane
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._lane.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Lane:
+    """
+    At most `limit` concurrent holders. Further callers wait (up to `max_wait` seconds) while
+    fewer than `queue` are already waiting; otherwise they are turned away immediately.
+    """
+
+    def __init__(self, name, limit, queue, max_wait):
+        self.name = name
+        self.limit = max(1, int(limit))
+        self.queue = max(0, int(queue))
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self.in_use = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+
+    def acquire(self):
+        with self._cond:
+            if self.in_use < self.limit and not self.waiting:
+                self.in_use += 1
+                self.admitted += 1
+                return Ticket(self)
+            if self.waiting >= self.queue:
+                self.rejected_full += 1
+                raise AdmissionRejected(self.name, 429, 1, "queue full")
+            self.waiting += 1
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while self.in_use >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected_timeout += 1
+                        raise AdmissionRejected(self.name, 503, max(1, int(self.max_wait + 0.5)), "wait timed out")
+                    self._cond.wait(remaining)
+                self.in_use += 1
+                self.admitted += 1
+                self.queued += 1
+                return Ticket(self)
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.in_use -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "queue": self.queue,
+                "in_use": self.in_use,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected_full": self.rejected_full,
+                "rejected_timeout": self.rejected_timeout,
+            }
+
+
+class AdmissionController:
+    """
+    Separate lanes so expensive scans cannot starve cheap lookups or health checks:
+    interactive (small ranges, snapshots), bulk (long/high-resolution ranges) and health.
+    Limits are per process; with N workers Influx sees at most N times each lane's limit.
+    """
+
+    def __init__(self, lanes, bulk_points):
+        self.lanes = lanes
+        self.bulk_points = bulk_points
+
+    def lane_for_cost(self, cost):
+        """Lane for a request expected to scan `cost` points (None = unknown, treated as bulk)."""
+        return "bulk" if cost is None or cost > self.bulk_points else "interactive"
+
+    def acquire(self, lane):
+        return self.lanes[lane].acquire()
+
+    def stats(self):
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+
+def estimate_cost(span_sec, step_sec, series=1):
+    """Points an Influx query scans: range length / native bar size, per series."""
+    if span_sec is None or span_sec < 0:
+        return None
+    return int(span_sec // max(1, step_sec) + 1) * max(1, series)
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission():
+    """Process-wide AdmissionController configured from settings, or None when disabled."""
+    global _controller
+    if not settings.ADMISSION_ENABLED:
+        return None
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                wait = settings.ADMISSION_MAX_WAIT_MS / 1000.0
+                _controller = AdmissionController(
+                    {
+                        "interactive": Lane("interactive", settings.ADMISSION_INTERACTIVE_SLOTS,
+                                            settings.ADMISSION_INTERACTIVE_QUEUE, wait),
+                        "bulk": Lane("bulk", settings.ADMISSION_BULK_SLOTS, settings.ADMISSION_BULK_QUEUE, wait),
+                        "health": Lane("health", settings.ADMISSION_HEALTH_SLOTS, settings.ADMISSION_HEALTH_QUEUE, wait),
+                    },
+                    bulk_points=settings.ADMISSION_BULK_POINTS,
+                )
+    return _controller
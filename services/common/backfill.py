@@ -0,0 +1,408 @@
+# services/common/backfill.py
+# Concurrent historical backfill: Polygon REST -> Influx (and the local bar store).
+#
+# Work is split into (symbol, date chunk) jobs. Fetch workers pull jobs, page through Polygon
+# under one shared TokenBucket and hand encoded batches to a bounded queue; writer threads
+# drain it into Influx, so fetching and writing overlap. A full queue blocks the fetchers.
+#
+# With a coverage index (services/common/coverage.py) only the uncovered days are planned, and
+# each job is marked pending when it starts and checkpointed into the index once all of its
+# batches are written, so an interrupted run picks up with the jobs that had not finished.
+# The job's closed months go to the bar store at the same point, so the disk tier never holds
+# bars Influx did not accept.
+#
+# Minute loads move the rollup watermarks (services/common/rollup.py) of the loaded symbols back
+# to the earliest day written, so the next catch-up rolls the new bars up.
+import time
+import queue
+import logging
+import threading
+from datetime import date, timedelta
+
+import pandas as pd
+
+from config.settings import settings
+from services.common.polygon import TokenBucket, list_aggregates
+from services.common.influx import write_points_batch
+from services.common.line_protocol import encode_bar, series_key
+from services.common.bar_store import get_bar_store
+from services.common.coverage import DAY, get_coverage_index
+from services.common.rollup import ROLLUP_SOURCE, rewind_watermarks
+
+logger = logging.getLogger("backfill")
+
+_BAR_KEYS = ["timestamp", "open", "high", "low", "close", "volume", "vwap", "transactions"]
+
+
+def month_chunks(start_date, end_date, months=1):
+    """
+    Inclusive (start, end) YYYY-MM-DD pairs covering [start_date, end_date], cut on calendar
+    month boundaries every `months` months (so whole months can go to the bar store).
+    """
+    lo, hi = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    chunks = []
+    while lo <= hi:
+        y, m = divmod(lo.month - 1 + max(1, months), 12)
+        nxt = date(lo.year + y, m + 1, 1)
+        end = min(hi, nxt - timedelta(days=1))
+        chunks.append((lo.isoformat(), end.isoformat()))
+        lo = nxt
+    return chunks
+
+
+def _date_sec(value):
+    return int(pd.Timestamp(value, tz="UTC").timestamp())
+
+
+def _sec_date(sec):
+    return pd.Timestamp(sec, unit="s", tz="UTC").strftime("%Y-%m-%d")
+
+
+def plan_jobs(symbols, start_date, end_date, granularity="minute", chunk_months=1, coverage=None,
+              adjusted=True):
+    """
+    (symbol, start, end) jobs with inclusive YYYY-MM-DD dates, ordered by start date so early
+    months of every symbol land first. With `coverage` only the days it lacks are planned.
+    """
+    measurement = "aggs_1d" if granularity == "day" else "aggs_1m"
+    jobs = []
+    for symbol in symbols:
+        if coverage is None:
+            spans = [(start_date, end_date)]
+        else:
+            gaps = coverage.gaps(measurement, symbol, adjusted, _date_sec(start_date), _date_sec(end_date) + DAY)
+            spans = [(_sec_date(lo), _sec_date(hi - DAY)) for lo, hi in gaps]
+        for a, b in spans:
+            chunks = [(a, b)] if granularity == "day" else month_chunks(a, b, chunk_months)
+            jobs.extend((symbol, c0, c1) for c0, c1 in chunks)
+    jobs.sort(key=lambda j: (j[1], j[0]))
+    return jobs
+
+
+def sync_coverage(coverage, symbols, granularity="minute", rebuild=False, adjusted=True):
+    """Build the index from Influx for symbols that have none yet (every symbol when `rebuild`)."""
+    measurement = "aggs_1d" if granularity == "day" else "aggs_1m"
+    for symbol in symbols:
+        if rebuild or not coverage.exists(measurement, symbol, adjusted):
+            coverage.rebuild(measurement, symbol, adjusted)
+
+
+def find_gaps(symbols, start_date, end_date, granularity="minute", coverage=None, adjusted=True):
+    """{symbol: [(start, end) inclusive YYYY-MM-DD]} of the days in the range not yet covered."""
+    coverage = coverage if coverage is not None else get_coverage_index()
+    measurement = "aggs_1d" if granularity == "day" else "aggs_1m"
+    lo, hi = _date_sec(start_date), _date_sec(end_date) + DAY
+    return {
+        symbol: [(_sec_date(a), _sec_date(b - DAY))
+                 for a, b in coverage.gaps(measurement, symbol, adjusted, lo, hi)]
+        for symbol in symbols
+    }
+
+
+class _Job:
+    """A (symbol, date chunk) unit of work and its write bookkeeping for checkpoints."""
+
+    __slots__ = ("symbol", "start_date", "end_date", "pending", "fetched", "failed", "settled", "bars")
+
+    def __init__(self, symbol, start_date, end_date):
+        self.symbol = symbol
+        self.start_date = start_date
+        self.end_date = end_date
+        self.pending = 0  # batches queued but not yet written
+        self.fetched = False
+        self.failed = False
+        self.settled = False
+        self.bars = None  # fetched bars kept for the bar store until the Influx writes succeed
+
+    def key(self):
+        return self.symbol, self.start_date, self.end_date
+
+
+def _store_frame(bars):
+    df = pd.DataFrame.from_records(bars, columns=_BAR_KEYS)
+    return pd.DataFrame({
+        "time_sec": df["timestamp"].to_numpy(dtype="int64") // 1_000_000_000,
+        "o": df["open"], "h": df["high"], "l": df["low"], "c": df["close"],
+        "v": df["volume"], "vw": df["vwap"], "n": df["transactions"],
+    }).sort_values("time_sec", kind="stable")
+
+
+def store_months(store, measurement, symbol, bars, start_date, end_date):
+    """Write the complete closed months of loaded bars for [start_date, end_date] to the bar store."""
+    lo = int(pd.Timestamp(start_date, tz="UTC").timestamp())
+    hi = int((pd.Timestamp(end_date, tz="UTC") + pd.Timedelta(days=1)).timestamp())  # end date is inclusive
+    return store.store(measurement, symbol, _store_frame(bars), lo, hi)
+
+
+class WorkerStats:
+    """Counters for one fetch worker; `current` is the job it is on."""
+
+    def __init__(self, name):
+        self.name = name
+        self.jobs = 0
+        self.bars = 0
+        self.busy_sec = 0.0
+        self.current = None
+
+    def line(self):
+        rate = self.bars / self.busy_sec if self.busy_sec else 0.0
+        current = " ".join(self.current) if self.current else "idle"
+        return f"{self.name}: {self.jobs} chunks, {self.bars} bars, {rate:,.0f} bars/s, {current}"
+
+
+class BackfillEngine:
+    """
+    Runs backfill jobs with `workers` fetch threads and `writers` Influx writer threads.
+    run() returns a summary dict; failed jobs are reported there, not raised.
+    The bar store only holds adjusted bars, so `store` is ignored for unadjusted loads.
+    """
+
+    def __init__(self, api_key, granularity="minute", adjusted=True, workers=8, writers=2,
+                 batch_size=5000, queue_batches=64, limiter=None, store=None, coverage=None,
+                 rewind_rollups=False, write=write_points_batch):
+        self.api_key = api_key
+        self.granularity = granularity
+        self.adjusted = adjusted
+        self.measurement = "aggs_1d" if granularity == "day" else "aggs_1m"
+        self.workers = max(1, int(workers))
+        self.writers = max(1, int(writers))
+        self.batch_size = max(1, int(batch_size))
+        self.limiter = limiter if limiter is not None else TokenBucket(0)
+        self.store = store if adjusted else None
+        self.coverage = coverage
+        self.rewind_rollups = rewind_rollups and self.measurement == ROLLUP_SOURCE
+        self.write = write
+        self._jobs = queue.Queue()
+        self._batches = queue.Queue(maxsize=max(1, int(queue_batches)))
+        self._lock = threading.Lock()
+        self.stats = [WorkerStats(f"fetch-{i}") for i in range(self.workers)]
+        self.total_jobs = 0
+        self.done_jobs = 0
+        self.written = 0
+        self.write_sec = 0.0
+        self.months_stored = 0
+        self.checkpoints = 0
+        self.failures = []
+        self.loaded = {}  # symbol -> earliest epoch day with written bars
+        self.started = None
+
+    def _queue_batch(self, job, batch):
+        with self._lock:
+            job.pending += 1
+        self._batches.put((job, batch))
+
+    def _settle(self, job):
+        # Caller holds self._lock. True (once) when the job is fetched and every batch written;
+        # the caller then runs _finish(job) outside the lock
+        if job.fetched and job.pending == 0 and not job.failed and not job.settled:
+            job.settled = True
+            return True
+        if job.failed:
+            job.bars = None
+        return False
+
+    def _finish(self, job):
+        """Store the job's closed months on disk and checkpoint it, now that Influx has every bar."""
+        symbol, start_date, end_date = job.key()
+        try:
+            if job.bars is not None:
+                n = store_months(self.store, self.measurement, symbol, job.bars, start_date, end_date)
+                job.bars = None
+                with self._lock:
+                    self.months_stored += n
+            if self.coverage is not None:
+                self.coverage.mark_fetched(self.measurement, symbol, self.adjusted, _date_sec(start_date),
+                                           _date_sec(end_date) + DAY)
+                with self._lock:
+                    self.checkpoints += 1
+        except Exception as e:
+            logger.warning("Backfill %s %s..%s: storing/checkpointing failed: %s", *job.key(), e)
+            with self._lock:
+                self.failures.append((*job.key(), f"finish: {e}"))
+
+    def _fetch_job(self, stats, job):
+        symbol, start_date, end_date = job.key()
+        tags = {"symbol": symbol, "source": "polygon", "adjusted": str(self.adjusted).lower()}
+        key = series_key(self.measurement, tags)
+        if self.coverage is not None:
+            self.coverage.mark_started(self.measurement, symbol, self.adjusted, _date_sec(start_date),
+                                       _date_sec(end_date) + DAY)
+        batch = []
+        loaded = job.bars = [] if self.store is not None else None
+        for bar in list_aggregates(
+            api_key=self.api_key,
+            symbol=symbol,
+            multiplier=1,
+            timespan=self.granularity,
+            start=start_date,
+            end=end_date,
+            adjusted=self.adjusted,
+            sort="asc",
+            limit=50000,
+            limiter=self.limiter,
+        ):
+            batch.append(encode_bar(self.measurement, tags, bar, key=key))
+            if loaded is not None:
+                loaded.append(bar)
+            stats.bars += 1
+            if len(batch) >= self.batch_size:
+                self._queue_batch(job, batch)
+                batch = []
+        if batch:
+            self._queue_batch(job, batch)
+        with self._lock:
+            job.fetched = True
+            done = self._settle(job)
+        if done:
+            self._finish(job)
+
+    def _fetch_loop(self, stats):
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                return
+            stats.current = job.key()
+            t0 = time.monotonic()
+            try:
+                self._fetch_job(stats, job)
+            except Exception as e:
+                logger.warning("Backfill %s %s..%s failed: %s", *job.key(), e)
+                with self._lock:
+                    job.failed = True
+                    job.bars = None
+                    self.failures.append((*job.key(), str(e)))
+            finally:
+                stats.busy_sec += time.monotonic() - t0
+                stats.jobs += 1
+                stats.current = None
+                with self._lock:
+                    self.done_jobs += 1
+
+    def _write_loop(self):
+        while True:
+            item = self._batches.get()
+            if item is None:
+                return
+            job, batch = item
+            t0 = time.monotonic()
+            done = False
+            try:
+                self.write(batch)
+                with self._lock:
+                    self.written += len(batch)
+                    lo = _date_sec(job.start_date)
+                    self.loaded[job.symbol] = min(lo, self.loaded.get(job.symbol, lo))
+            except Exception as e:
+                logger.warning("Backfill write of %d points for %s %s..%s failed: %s", len(batch), *job.key(), e)
+                with self._lock:
+                    job.failed = True
+                    self.failures.append((*job.key(), f"write of {len(batch)} points: {e}"))
+            finally:
+                with self._lock:
+                    self.write_sec += time.monotonic() - t0
+                    job.pending -= 1
+                    done = self._settle(job)
+            if done:
+                self._finish(job)
+
+    def progress(self):
+        """Lines describing overall and per-worker progress and throughput."""
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        bars = sum(s.bars for s in self.stats)
+        limiter = self.limiter.stats()
+        lines = [
+            f"{self.done_jobs}/{self.total_jobs} chunks, {bars} bars fetched ({bars / elapsed if elapsed else 0:,.0f}/s), "
+            f"{self.written} written, queue {self._batches.qsize()}/{self._batches.maxsize}, "
+            f"{limiter['acquired']} requests, {limiter['pauses']} rate-limit pauses, {len(self.failures)} failures, "
+            f"{self.checkpoints} checkpoints"
+        ]
+        lines.extend("  " + s.line() for s in self.stats)
+        return lines
+
+    def run(self, symbols, start_date, end_date, chunk_months=1, progress=None, progress_sec=10.0,
+            rebuild_index=False):
+        """
+        Backfill every symbol over [start_date, end_date] (YYYY-MM-DD, inclusive), skipping
+        what the coverage index already has (see plan_jobs). Day bars are fetched as one chunk
+        per gap; minute bars in `chunk_months` calendar-month chunks. Symbols without an index
+        yet (all of them with `rebuild_index`) are indexed from Influx first.
+        `progress(lines)` is called every `progress_sec` seconds while running.
+        """
+        if self.coverage is not None:
+            sync_coverage(self.coverage, symbols, self.granularity, rebuild=rebuild_index, adjusted=self.adjusted)
+        jobs = plan_jobs(symbols, start_date, end_date, self.granularity, chunk_months, self.coverage,
+                         adjusted=self.adjusted)
+        for job in jobs:
+            self._jobs.put(_Job(*job))
+        self.total_jobs = len(jobs)
+        self.started = time.monotonic()
+
+        writers = [threading.Thread(target=self._write_loop, name=f"backfill-write-{i}", daemon=True)
+                   for i in range(self.writers)]
+        fetchers = [threading.Thread(target=self._fetch_loop, args=(s,), name=s.name, daemon=True)
+                    for s in self.stats]
+        for t in writers + fetchers:
+            t.start()
+        deadline = time.monotonic() + progress_sec
+        for t in fetchers:
+            while t.is_alive():
+                t.join(timeout=max(0.0, deadline - time.monotonic()) if progress is not None else None)
+                if progress is not None and time.monotonic() >= deadline:
+                    progress(self.progress())
+                    deadline += progress_sec
+        for _ in writers:
+            self._batches.put(None)
+        for t in writers:
+            t.join()
+        if progress is not None:
+            progress(self.progress())
+        rewound = self._rewind_rollups() if self.rewind_rollups else 0
+
+        elapsed = time.monotonic() - self.started
+        return {
+            "chunks": self.total_jobs,
+            "bars": sum(s.bars for s in self.stats),
+            "written": self.written,
+            "months_stored": self.months_stored,
+            "checkpoints": self.checkpoints,
+            "rollups_rewound": rewound,
+            "elapsed_sec": round(elapsed, 1),
+            "bars_per_sec": round(self.written / elapsed, 1) if elapsed else 0.0,
+            "write_sec": round(self.write_sec, 1),
+            "limiter": self.limiter.stats(),
+            "failures": self.failures,
+        }
+
+
+    def _rewind_rollups(self):
+        """Move the rollup watermarks of every loaded symbol back to its first written day."""
+        rewound = 0
+        for symbol, lo in sorted(self.loaded.items()):
+            try:
+                rewound += bool(rewind_watermarks(symbol, lo, write=self.write))
+            except Exception as e:
+                logger.warning("Rewinding rollup watermarks of %s failed: %s", symbol, e)
+                self.failures.append((symbol, _sec_date(lo), "-", f"rollup rewind: {e}"))
+        return rewound
+
+
+def default_engine(granularity="minute", adjusted=True, **overrides):
+    """
+    BackfillEngine with the POLYGON_*/BACKFILL_* settings, the configured bar store and the
+    coverage index (pass coverage=False to refetch whole ranges).
+    """
+    opts = {
+        "workers": settings.BACKFILL_WORKERS,
+        "writers": settings.BACKFILL_WRITERS,
+        "batch_size": settings.INFLUX_WRITE_BATCH_SIZE,
+        "queue_batches": settings.BACKFILL_QUEUE_BATCHES,
+        "limiter": TokenBucket(settings.POLYGON_RATE_PER_SEC, settings.POLYGON_BURST),
+        "store": get_bar_store(),
+        "coverage": get_coverage_index(),
+        "rewind_rollups": settings.ROLLUPS_ENABLED,
+    }
+    opts.update({k: v for k, v in overrides.items() if v is not None})
+    if opts["coverage"] is False:
+        opts["coverage"] = None
+    return BackfillEngine(settings.POLYGON_API_KEY, granularity=granularity, adjusted=adjusted, **opts)
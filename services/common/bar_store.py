@@ -0,0 +1,234 @@
+# services/common/bar_store.py
+# Local on-disk tier of closed months of bars, so long-range reads skip the trip to Influx.
+#
+# Layout: <BAR_STORE_DIR>/<measurement>/<quoted symbol>/<YYYY-MM>.arrow holds one closed UTC
+# month (time_sec, o, h, l, c, v, vw, n) as an uncompressed Arrow IPC file, and watermark.json
+# next to them records the contiguous range of complete months [first, synced). Files are
+# memory-mapped on read, so columns are used in place rather than decoded.
+#
+# Months are filled by backfills once Influx has accepted their bars and by sync() (see
+# scripts/bar_store.py), which copies every month that has closed since the watermark.
+# Only adjusted bars (adjusted=true, the series the API and indicator jobs read) are stored:
+# unadjusted backfills skip the store and sync() reads the adjusted series alone.
+import os
+import json
+import time
+import logging
+import threading
+import urllib.parse
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from config.settings import settings
+from services.common.columnar import HISTORY_FIELDS
+from services.common.rollup import first_bar_sec, source_frame
+
+logger = logging.getLogger("bar_store")
+
+BAR_COLUMNS = ["time_sec"] + HISTORY_FIELDS
+_INT_COLUMNS = ("time_sec", "v", "n")
+WATERMARK_FILE = "watermark.json"
+
+
+def month_start(sec):
+    dt = datetime.fromtimestamp(sec, tz=timezone.utc)
+    return int(datetime(dt.year, dt.month, 1, tzinfo=timezone.utc).timestamp())
+
+
+def next_month(sec):
+    dt = datetime.fromtimestamp(sec, tz=timezone.utc)
+    year, month = (dt.year + 1, 1) if dt.month == 12 else (dt.year, dt.month + 1)
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+
+
+def _months(lo, hi):
+    m = lo
+    while m < hi:
+        yield m
+        m = next_month(m)
+
+
+def _empty(columns):
+    return pd.DataFrame({c: np.empty(0, dtype=np.int64 if c in _INT_COLUMNS else np.float64) for c in columns})
+
+
+def _atomic_write(path, write):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class BarStore:
+    """
+    Month files under `root`. A month is closed (eligible for disk) once it ended more than
+    `grace_sec` ago; later months are always read from Influx.
+    """
+
+    def __init__(self, root, grace_sec):
+        self.root = root
+        self.grace_sec = grace_sec
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.rows_read = 0
+        self.months_written = 0
+
+    def _dir(self, measurement, symbol):
+        return os.path.join(self.root, measurement, urllib.parse.quote(symbol, safe=""))
+
+    def _path(self, measurement, symbol, month):
+        name = datetime.fromtimestamp(month, tz=timezone.utc).strftime("%Y-%m")
+        return os.path.join(self._dir(measurement, symbol), name + ".arrow")
+
+    def closed_before(self, now=None):
+        """Start of the first month that is not closed yet."""
+        now = time.time() if now is None else now
+        return month_start(int(now) - self.grace_sec)
+
+    def watermark(self, measurement, symbol):
+        """(first_sec, synced_sec): every month in [first, synced) is on disk; None when empty."""
+        try:
+            with open(os.path.join(self._dir(measurement, symbol), WATERMARK_FILE)) as f:
+                data = json.load(f)
+            return int(data["first"]), int(data["synced"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _set_watermark(self, measurement, symbol, first, synced):
+        body = json.dumps({"first": first, "synced": synced}).encode("utf-8")
+
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                f.write(body)
+
+        _atomic_write(os.path.join(self._dir(measurement, symbol), WATERMARK_FILE), write)
+
+    def _extend(self, measurement, symbol, lo, hi):
+        # The on-disk range stays contiguous: months that don't touch it are kept as files and
+        # only counted once a later write bridges the gap. Every month file is complete, so the
+        # range also grows over adjacent files (months written out of order, e.g. by backfill)
+        with self._lock:
+            mark = self.watermark(measurement, symbol)
+            if mark is not None:
+                if lo > mark[1] or hi < mark[0]:
+                    return
+                lo, hi = min(lo, mark[0]), max(hi, mark[1])
+            while os.path.exists(self._path(measurement, symbol, hi)):
+                hi = next_month(hi)
+            while lo > 0 and os.path.exists(self._path(measurement, symbol, month_start(lo - 1))):
+                lo = month_start(lo - 1)
+            self._set_watermark(measurement, symbol, lo, hi)
+
+    def write_month(self, measurement, symbol, month, frame):
+        """Replace the file of the month starting at `month` with `frame` (BAR_COLUMNS, time-sorted)."""
+        import pyarrow as pa  # optional dependency, only needed when BAR_STORE_DIR is set
+
+        table = pa.table({
+            c: frame[c].to_numpy(dtype=np.int64 if c in _INT_COLUMNS else np.float64) for c in BAR_COLUMNS
+        })
+        path = self._path(measurement, symbol, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        def write(tmp):
+            with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+        _atomic_write(path, write)
+        self.months_written += 1
+
+    def store(self, measurement, symbol, frame, lo, hi, now=None):
+        """
+        Write the closed months lying wholly inside [lo, hi) from `frame`, which must hold every
+        bar of that range sorted by time_sec, and extend the watermark. Returns months written.
+        """
+        limit = min(hi, self.closed_before(now))
+        m = lo if lo == month_start(lo) else next_month(lo)
+        ts = frame["time_sec"].to_numpy(dtype=np.int64) if frame is not None and len(frame) else np.empty(0, np.int64)
+        first, written = m, 0
+        while next_month(m) <= limit:
+            end = next_month(m)
+            a, b = np.searchsorted(ts, [m, end])
+            self.write_month(measurement, symbol, m, frame.iloc[a:b] if b > a else _empty(BAR_COLUMNS))
+            written += 1
+            m = end
+        if written:
+            self._extend(measurement, symbol, first, m)
+        return written
+
+    def read(self, measurement, symbol, lo, hi, columns=None):
+        """
+        Bars in [lo, hi) from the month files as a DataFrame of time_sec plus `columns` (default:
+        all fields). Callers keep [lo, hi) inside the watermark range; missing files read empty.
+        """
+        import pyarrow as pa
+
+        cols = ["time_sec"] + list(columns if columns is not None else HISTORY_FIELDS)
+        tables = []
+        for m in _months(month_start(lo), hi):
+            path = self._path(measurement, symbol, m)
+            if not os.path.exists(path):
+                continue
+            table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all().select(cols)
+            ts = table.column("time_sec").to_numpy()
+            a, b = np.searchsorted(ts, [lo, hi])
+            if b > a:
+                tables.append(table.slice(a, b - a))
+        self.reads += 1
+        if not tables:
+            return _empty(cols)
+        table = tables[0] if len(tables) == 1 else pa.concat_tables(tables)
+        self.rows_read += table.num_rows
+        # Single-chunk numeric columns without nulls become NumPy views of the mapped file
+        return table.to_pandas(split_blocks=True)
+
+    def sync(self, measurement, symbol, now=None):
+        """
+        Copy every closed month of `symbol` after the watermark from Influx (from its first bar
+        when nothing is on disk yet), one month per query. Returns months written.
+        """
+        mark = self.watermark(measurement, symbol)
+        if mark is not None:
+            lo = mark[1]
+        else:
+            first = first_bar_sec(symbol, measurement)
+            if first is None:
+                return 0
+            lo = month_start(first)
+        written = 0
+        limit = self.closed_before(now)
+        for m in _months(lo, limit):
+            end = next_month(m)
+            frame = source_frame(symbol, measurement, m, end, adjusted=True)
+            written += self.store(measurement, symbol, frame, m, end, now)
+        if written:
+            logger.info("Bar store sync %s/%s: %d months", measurement, symbol, written)
+        return written
+
+    def stats(self):
+        return {
+            "root": self.root,
+            "reads": self.reads,
+            "rows_read": self.rows_read,
+            "months_written": self.months_written,
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bar_store():
+    """Process-wide BarStore configured from settings, or None when BAR_STORE_DIR is unset."""
+    global _store
+    if not settings.BAR_STORE_DIR:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = BarStore(settings.BAR_STORE_DIR, settings.BAR_STORE_GRACE_SEC)
+    return _store
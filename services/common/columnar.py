@@ -0,0 +1,152 @@
+# services/common/columnar.py
+# Vectorized sanitation of Flux query output (see iter_flux_frames in services/common/influx.py).
+# Replaces per-row datetime parsing / float coercion with bulk pandas/NumPy operations.
+import numpy as np
+import pandas as pd
+
+HISTORY_FIELDS = ["o", "h", "l", "c", "v", "vw", "n"]
+INDICATOR_FIELDS = ["bb_l", "bb_m", "bb_u", "macd", "macds", "macdh", "rsi"]
+
+# pandas' JSON writer defaults to 10 significant digits; keep full float precision
+JSON_DOUBLE_PRECISION = 15
+
+
+def parse_times_ns(values):
+    """Bulk-parse RFC3339 strings (or datetimes) to UTC int64 ns. Returns (ns, valid_mask)."""
+    t = pd.to_datetime(pd.Series(values), utc=True, errors="coerce", format="ISO8601")
+    valid = t.notna().to_numpy()
+    ns = t.dt.tz_convert("UTC").to_numpy(dtype="datetime64[ns]").view(np.int64)
+    return ns, valid
+
+
+def numeric(df, name):
+    """Column as float64 with NaN for missing/unparseable values (a NaN column if absent)."""
+    if name not in df.columns:
+        return np.full(len(df), np.nan)
+    col = df[name]
+    if col.dtype.kind not in "fiu":
+        col = pd.to_numeric(col, errors="coerce")
+    return col.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def iso_seconds(ns):
+    """'YYYY-MM-DDTHH:MM:SSZ' strings for int64 ns timestamps."""
+    return np.datetime_as_string(ns.astype("datetime64[ns]").astype("datetime64[s]"), unit="s", timezone="UTC")
+
+
+def _time_ordered(ns):
+    # Flux queries already sort by _time; only pay for a sort when that isn't the case
+    if len(ns) > 1 and not (np.diff(ns) >= 0).all():
+        return np.argsort(ns, kind="stable")
+    return None
+
+
+def clean_history_frame(df, extra_fields=()):
+    """
+    Sanitize pivoted OHLCV output: drop rows without a valid _time or o/h/l/c, coerce numbers
+    (missing v/vw/n become 0) and order by time. Returns a DataFrame with columns
+    _time (ISO), time_sec, o, h, l, c, v, vw, n, plus `extra_fields` as float64 (NaN if missing).
+    """
+    return _clean_bars(df, extra_fields, keep_extra=False)
+
+
+def clean_chart_frame(df, fields):
+    """
+    As clean_history_frame(df, fields), but a row without o/h/l/c is kept when any of `fields`
+    is finite: an indicator value at a bar missing (or invalid) in the candles comes back with
+    NaN o/h/l/c (and 0 v/vw/n) instead of being dropped.
+    """
+    return _clean_bars(df, fields, keep_extra=True)
+
+
+def _clean_bars(df, extra_fields, keep_extra):
+    if df is None or len(df) == 0 or "_time" not in df.columns:
+        return pd.DataFrame(columns=["_time", "time_sec"] + HISTORY_FIELDS + list(extra_fields))
+    ns, valid = parse_times_ns(df["_time"])
+    cols = {f: numeric(df, f) for f in HISTORY_FIELDS}
+    has_bar = np.ones(len(df), dtype=bool)
+    for f in ("o", "h", "l", "c"):
+        has_bar &= np.isfinite(cols[f])
+    extra = {f: numeric(df, f) for f in extra_fields}
+    keep = has_bar.copy()
+    if keep_extra:
+        for arr in extra.values():
+            keep |= np.isfinite(arr)
+    valid &= keep
+    ns = ns[valid]
+    out = {"_time": iso_seconds(ns), "time_sec": ns // 1_000_000_000}
+    for f in ("o", "h", "l", "c"):
+        # A partial bar is no bar: all of o/h/l/c are NaN on indicator-only rows
+        out[f] = np.where(has_bar, cols[f], np.nan)[valid]
+    out["v"] = np.nan_to_num(cols["v"][valid], nan=0.0).astype(np.int64)
+    out["vw"] = np.nan_to_num(cols["vw"][valid], nan=0.0)
+    out["n"] = np.nan_to_num(cols["n"][valid], nan=0.0).astype(np.int64)
+    for f in extra_fields:
+        out[f] = extra[f][valid]
+    frame = pd.DataFrame(out)
+    order = _time_ordered(ns)
+    return frame if order is None else frame.iloc[order].reset_index(drop=True)
+
+
+def clean_indicator_frame(df, fields):
+    """
+    Sanitize pivoted indicator output: drop rows without a valid _time or without any finite
+    requested field; non-numeric values become NaN. Returns _time, time_sec and `fields`.
+    """
+    if df is None or len(df) == 0 or "_time" not in df.columns:
+        return pd.DataFrame(columns=["_time", "time_sec"] + list(fields))
+    ns, valid = parse_times_ns(df["_time"])
+    cols = {f: numeric(df, f) for f in fields}
+    any_valid = np.zeros(len(df), dtype=bool)
+    for arr in cols.values():
+        any_valid |= np.isfinite(arr)
+    valid &= any_valid
+    ns = ns[valid]
+    out = {"_time": iso_seconds(ns), "time_sec": ns // 1_000_000_000}
+    for f in fields:
+        out[f] = cols[f][valid]
+    frame = pd.DataFrame(out)
+    order = _time_ordered(ns)
+    return frame if order is None else frame.iloc[order].reset_index(drop=True)
+
+
+def clean_close_frame(df, field="c"):
+    """
+    Sanitize a pivoted `_time`/`field` result into a float64 `field` column indexed by a
+    UTC DatetimeIndex named `_time`, dropping rows with a bad time or non-finite value.
+    """
+    if df is None or len(df) == 0 or "_time" not in df.columns:
+        return pd.DataFrame({field: np.empty(0)}, index=pd.DatetimeIndex([], tz="UTC", name="_time"))
+    ns, valid = parse_times_ns(df["_time"])
+    values = numeric(df, field)
+    valid &= np.isfinite(values)
+    ns, values = ns[valid], values[valid]
+    order = _time_ordered(ns)
+    if order is not None:
+        ns, values = ns[order], values[order]
+    return close_frame(ns, values, field)
+
+
+def close_frame(ns, values, field="c"):
+    """clean_close_frame-shaped frame from time-sorted int64 ns timestamps and float values."""
+    index = pd.DatetimeIndex(np.asarray(ns, dtype=np.int64).view("datetime64[ns]"), name="_time").tz_localize("UTC")
+    return pd.DataFrame({field: np.asarray(values, dtype=np.float64)}, index=index)
+
+
+def bars_frame(cols):
+    """
+    clean_history_frame-shaped DataFrame from already-clean, time-sorted columns (a mapping with
+    time_sec and HISTORY_FIELDS, e.g. bars read from the local bar store); only _time is derived.
+    """
+    time_sec = np.asarray(cols["time_sec"], dtype=np.int64)
+    out = {"_time": iso_seconds(time_sec * 1_000_000_000), "time_sec": time_sec}
+    for f in HISTORY_FIELDS:
+        out[f] = np.asarray(cols[f], dtype=np.int64 if f in ("v", "n") else np.float64)
+    return pd.DataFrame(out, copy=False)
+
+
+def frame_to_json_rows(frame):
+    """JSON array text for a cleaned frame (NaN becomes null), encoded by pandas' C writer."""
+    if len(frame) == 0:
+        return "[]"
+    return frame.to_json(orient="records", double_precision=JSON_DOUBLE_PRECISION)
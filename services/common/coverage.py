@@ -0,0 +1,173 @@
+# services/common/coverage.py
+# Which days of a bar measurement are already loaded, per symbol, so backfills fetch only gaps.
+#
+# The index for (measurement, symbol, adjusted) is three sorted lists of [lo, hi) epoch-second
+# ranges on whole UTC days, kept as JSON under COVERAGE_DIR:
+#   - data:    past days that hold at least one bar in Influx (rebuilt from a per-day count query);
+#   - fetched: ranges a backfill job has fully fetched and written (its checkpoints), which
+#     also covers days Polygon has no bars for (weekends, holidays, halted symbols);
+#   - pending: ranges of jobs that were started but not checkpointed (still running, failed or
+#     interrupted). Their days may hold only part of their bars, so only checkpoints count there.
+# A day is covered when it is fetched, or holds data and is not pending.
+import os
+import json
+import time
+import threading
+import urllib.parse
+
+from config.settings import settings
+from services.common.influx import query_flux
+
+DAY = 86400
+
+
+def merge_ranges(ranges):
+    """Sorted, non-overlapping union of [lo, hi) ranges (touching ranges are joined)."""
+    out = []
+    for lo, hi in sorted((int(a), int(b)) for a, b in ranges if b > a):
+        if out and lo <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], hi)
+        else:
+            out.append([lo, hi])
+    return [(a, b) for a, b in out]
+
+
+def subtract_ranges(lo, hi, ranges):
+    """Parts of [lo, hi) not covered by the merged `ranges`."""
+    gaps = []
+    cursor = lo
+    for a, b in ranges:
+        if b <= cursor:
+            continue
+        if a >= hi:
+            break
+        if a > cursor:
+            gaps.append((cursor, a))
+        cursor = max(cursor, b)
+    if cursor < hi:
+        gaps.append((cursor, hi))
+    return gaps
+
+
+def _clip(ranges, lo, hi):
+    return [(max(a, lo), min(b, hi)) for a, b in ranges if b > lo and a < hi]
+
+
+def _outside(ranges, lo, hi):
+    out = []
+    for a, b in ranges:
+        out.extend(subtract_ranges(a, b, [(lo, hi)]))
+    return out
+
+
+class CoverageIndex:
+    """Per (measurement, symbol, adjusted) coverage files under `root`; writes are atomic."""
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _path(self, measurement, symbol, adjusted):
+        kind = "adjusted" if adjusted else "unadjusted"
+        return os.path.join(self.root, measurement, kind, urllib.parse.quote(symbol, safe="") + ".json")
+
+    def exists(self, measurement, symbol, adjusted):
+        return os.path.exists(self._path(measurement, symbol, adjusted))
+
+    def _load(self, measurement, symbol, adjusted):
+        try:
+            with open(self._path(measurement, symbol, adjusted)) as f:
+                data = json.load(f)
+            return tuple(merge_ranges(data.get(k, [])) for k in ("data", "fetched", "pending"))
+        except (OSError, ValueError, TypeError):
+            return [], [], []
+
+    def _save(self, measurement, symbol, adjusted, data, fetched, pending):
+        path = self._path(measurement, symbol, adjusted)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"data": data, "fetched": fetched, "pending": pending, "updated": int(time.time())}, f)
+        os.replace(tmp, path)
+
+    def covered(self, measurement, symbol, adjusted):
+        data, fetched, pending = self._load(measurement, symbol, adjusted)
+        for a, b in pending:
+            data = _outside(data, a, b)
+        return merge_ranges(data + fetched)
+
+    def gaps(self, measurement, symbol, adjusted, lo, hi):
+        """Uncovered parts of [lo, hi), widened to whole days."""
+        lo, hi = lo - lo % DAY, hi + (-hi % DAY)
+        return subtract_ranges(lo, hi, self.covered(measurement, symbol, adjusted))
+
+    def mark_started(self, measurement, symbol, adjusted, lo, hi):
+        """A job over [lo, hi) starts writing: its days count as covered only once checkpointed."""
+        lo, hi = lo - lo % DAY, hi + (-hi % DAY)
+        with self._lock:
+            data, fetched, pending = self._load(measurement, symbol, adjusted)
+            self._save(measurement, symbol, adjusted, data, fetched, merge_ranges(pending + [(lo, hi)]))
+
+    def mark_fetched(self, measurement, symbol, adjusted, lo, hi):
+        """
+        Checkpoint: [lo, hi) was fully fetched and written. Clears the job's pending range;
+        only whole, past days are added as fetched.
+        """
+        today = int(time.time()) // DAY * DAY
+        wide = (lo - lo % DAY, hi + (-hi % DAY))
+        lo, hi = lo + (-lo % DAY), min(hi - hi % DAY, today)
+        with self._lock:
+            data, fetched, pending = self._load(measurement, symbol, adjusted)
+            if hi > lo:
+                fetched = merge_ranges(fetched + [(lo, hi)])
+            self._save(measurement, symbol, adjusted, data, fetched, _outside(pending, *wide))
+
+    def rebuild(self, measurement, symbol, adjusted, lo=None, hi=None):
+        """
+        Replace the `data` ranges within [lo, hi) (default: all time) with the past days that
+        hold bars in Influx. Checkpointed `fetched` and `pending` ranges are kept. Returns the
+        new covered ranges.
+        """
+        today = int(time.time()) // DAY * DAY
+        lo = 0 if lo is None else lo - lo % DAY
+        hi = today + DAY if hi is None else hi + (-hi % DAY)
+        days = influx_days(measurement, symbol, adjusted, lo, hi)
+        # Today is still being written, so its bars never prove the day complete
+        found = merge_ranges((d, d + DAY) for d in days if d < today)
+        with self._lock:
+            data, fetched, pending = self._load(measurement, symbol, adjusted)
+            data = merge_ranges(_outside(data, lo, hi) + _clip(found, lo, hi))
+            self._save(measurement, symbol, adjusted, data, fetched, pending)
+        return self.covered(measurement, symbol, adjusted)
+
+
+def _flux_time(sec):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(sec))
+
+
+def influx_days(measurement, symbol, adjusted, lo, hi):
+    """Start (epoch seconds) of every UTC day in [lo, hi) with at least one (un)adjusted bar of `symbol`."""
+    rows = query_flux(f'''
+from(bucket: "{settings.INFLUX_BUCKET}")
+  |> range(start: time(v: "{_flux_time(lo)}"), stop: time(v: "{_flux_time(hi)}"))
+  |> filter(fn: (r) => r._measurement == "{measurement}")
+  |> filter(fn: (r) => r.symbol == "{symbol}" and r.adjusted == "{str(adjusted).lower()}")
+  |> filter(fn: (r) => r._field == "c")
+  |> aggregateWindow(every: 1d, fn: count, createEmpty: false, timeSrc: "_start")
+  |> keep(columns: ["_time", "_value"])
+''')
+    return sorted({int(r["_time"].timestamp()) // DAY * DAY for r in rows if r.get("_value")})
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_coverage_index():
+    """Process-wide CoverageIndex under COVERAGE_DIR."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = CoverageIndex(settings.COVERAGE_DIR)
+    return _index
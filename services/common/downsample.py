@@ -0,0 +1,79 @@
+# services/common/downsample.py
+# Helpers for sizing chart responses to a point budget instead of to the time range.
+import re
+import math
+import numpy as np
+
+# Candidate bucket sizes (seconds) and their Flux duration literals, smallest first
+NICE_WINDOWS = [
+    (60, "1m"), (120, "2m"), (300, "5m"), (600, "10m"), (900, "15m"), (1800, "30m"),
+    (3600, "1h"), (7200, "2h"), (14400, "4h"), (21600, "6h"), (43200, "12h"),
+    (86400, "1d"), (604800, "1w"),
+]
+
+_DURATION_RE = re.compile(r"^(\d+)(s|m|h|d|w)$")
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(value):
+    """Parse a Flux-style duration like '5m' or '4h' into seconds; returns None if invalid."""
+    m = _DURATION_RE.match((value or "").strip())
+    if not m or int(m.group(1)) <= 0:
+        return None
+    return int(m.group(1)) * _UNIT_SECONDS[m.group(2)]
+
+
+def pick_window(span_sec, max_points, native_sec):
+    """
+    Smallest nice bucket that keeps roughly `max_points` buckets over `span_sec`.
+    Returns (seconds, flux_literal), or None when the native bar size already fits the budget.
+    """
+    if max_points <= 0 or span_sec <= 0:
+        return None
+    target = span_sec / float(max_points)
+    if target <= native_sec:
+        return None
+    for sec, lit in NICE_WINDOWS:
+        if sec >= target and sec > native_sec:
+            return sec, lit
+    # Beyond the table: whole days
+    days = int(math.ceil(target / 86400.0))
+    return days * 86400, f"{days}d"
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets decimation. Returns the indices of the points to keep
+    (always including the first and last), preserving the visual shape of a line series.
+
+    Args:
+        x, y: 1-D float arrays of equal length, x ascending.
+        threshold: number of points to keep.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    out = np.empty(threshold, dtype=np.int64)
+    out[0] = 0
+    out[-1] = n - 1
+    # Bucket boundaries over the interior points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        # Average of the next bucket (or the last point) is the third triangle vertex
+        if i + 2 < len(edges):
+            nlo, nhi = edges[i + 1], max(edges[i + 2], edges[i + 1] + 1)
+        else:
+            nlo, nhi = n - 1, n
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+        bx = x[lo:hi]
+        by = y[lo:hi]
+        area = np.abs((x[a] - avg_x) * (by - y[a]) - (x[a] - bx) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
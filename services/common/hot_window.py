@@ -0,0 +1,198 @@
+# services/common/hot_window.py
+# In-memory window of the most recent bars per symbol, kept by the streamer and
+# read by the API over a small local TCP channel (newline-delimited JSON).
+import json
+import socket
+import asyncio
+import logging
+import threading
+import time
+import numpy as np
+
+from config.settings import settings
+
+logger = logging.getLogger("hot_window")
+
+# Column order of the per-symbol value matrix
+FIELDS = ("o", "h", "l", "c", "v", "vw", "n")
+_BAR_KEYS = ("open", "high", "low", "close", "volume", "vwap", "transactions")
+
+
+class SymbolRing:
+    """Fixed-size ring of bars for one symbol: int64 timestamps (ns) plus a float64 value matrix."""
+
+    __slots__ = ("ts", "values", "head", "count")
+
+    def __init__(self, size):
+        self.ts = np.zeros(size, dtype=np.int64)
+        self.values = np.zeros((size, len(FIELDS)), dtype=np.float64)
+        self.head = 0   # next write position
+        self.count = 0
+
+    def push(self, ts_ns, row):
+        size = len(self.ts)
+        if self.count:
+            last = (self.head - 1) % size
+            last_ts = self.ts[last]
+            if ts_ns == last_ts:
+                # Same bar re-sent (updated aggregate): overwrite in place
+                self.values[last] = row
+                return
+            if ts_ns < last_ts:
+                return  # late/out-of-order bar; Influx remains the source of truth for history
+        self.ts[self.head] = ts_ns
+        self.values[self.head] = row
+        self.head = (self.head + 1) % size
+        self.count = min(self.count + 1, size)
+
+    def tail(self, n):
+        """Last `n` bars in ascending time order as (ts, values) array copies."""
+        n = min(n, self.count)
+        size = len(self.ts)
+        idx = (np.arange(self.head - n, self.head)) % size
+        return self.ts[idx], self.values[idx]
+
+
+class HotWindow:
+    """Per-symbol ring buffers of the last `size` bars."""
+
+    def __init__(self, size=1440):
+        self.size = max(1, int(size))
+        self.rings = {}
+
+    def update(self, bar):
+        ring = self.rings.get(bar["symbol"])
+        if ring is None:
+            ring = self.rings[bar["symbol"]] = SymbolRing(self.size)
+        ring.push(int(bar["timestamp"]), [float(bar.get(k, 0.0) or 0.0) for k in _BAR_KEYS])
+
+    def last(self, symbol, n):
+        """Columnar dict of the last `n` bars for `symbol` ({"t": [...ns], "o": [...], ...}), or None."""
+        ring = self.rings.get(symbol)
+        if ring is None or ring.count == 0:
+            return None
+        ts, values = ring.tail(n)
+        out = {"symbol": symbol, "t": ts.tolist()}
+        for i, f in enumerate(FIELDS):
+            out[f] = values[:, i].tolist()
+        return out
+
+    def closes(self, symbols):
+        """{symbol: [ts_ns, close]} of the latest bar for each known symbol in `symbols`."""
+        out = {}
+        ci = FIELDS.index("c")
+        for sym in symbols:
+            ring = self.rings.get(sym)
+            if ring is not None and ring.count:
+                last = (ring.head - 1) % len(ring.ts)
+                out[sym] = [int(ring.ts[last]), float(ring.values[last, ci])]
+        return out
+
+    def handle(self, req):
+        op = req.get("op")
+        if op == "last":
+            return {"ok": True, "data": self.last(req.get("symbol"), max(1, int(req.get("n", 1))))}
+        if op == "closes":
+            return {"ok": True, "data": self.closes(req.get("symbols") or [])}
+        if op == "symbols":
+            return {"ok": True, "data": {s: r.count for s, r in self.rings.items()}}
+        return {"ok": False, "error": "unknown op"}
+
+
+async def serve_hot_window(window, host, port):
+    """
+    Serve `window` to API processes: one JSON request per line, one JSON response per line.
+    The protocol has no authentication, so `host` must only be reachable from the API
+    (loopback or an internal network, see HOT_WINDOW_BIND_HOST).
+    """
+
+    async def on_client(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    resp = window.handle(json.loads(line))
+                except Exception as e:
+                    resp = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(resp, separators=(",", ":")).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(on_client, host, port)
+    logger.info("Hot window listening on %s:%s", host, port)
+    async with server:
+        await server.serve_forever()
+
+
+class HotWindowClient:
+    """
+    Blocking client used by Flask workers. Keeps one connection per thread, and after a
+    failure stops trying for `retry_after` seconds so an absent streamer costs nothing.
+    All methods return None on a miss or when the streamer is unavailable.
+    """
+
+    def __init__(self, addr, timeout=0.1, retry_after=5.0):
+        host, _, port = addr.rpartition(":")
+        self.addr = (host or "localhost", int(port))
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._local = threading.local()
+        self._down_until = 0.0
+
+    def _request(self, req):
+        if time.monotonic() < self._down_until:
+            return None
+        conn = getattr(self._local, "conn", None)
+        try:
+            if conn is None:
+                sock = socket.create_connection(self.addr, timeout=self.timeout)
+                conn = self._local.conn = (sock, sock.makefile("rb"))
+            sock, rfile = conn
+            sock.sendall(json.dumps(req).encode("utf-8") + b"\n")
+            line = rfile.readline()
+            if not line:
+                raise ConnectionError("hot window closed the connection")
+            resp = json.loads(line)
+            return resp.get("data") if resp.get("ok") else None
+        except (OSError, ValueError) as e:
+            logger.debug("Hot window unavailable: %s", e)
+            self._drop()
+            self._down_until = time.monotonic() + self.retry_after
+            return None
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+    def last(self, symbol, n):
+        return self._request({"op": "last", "symbol": symbol, "n": int(n)})
+
+    def closes(self, symbols):
+        return self._request({"op": "closes", "symbols": list(symbols)})
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_hot_window_client():
+    """Process-wide client from settings.HOT_WINDOW_ADDR, or None when not configured."""
+    global _client
+    if not settings.HOT_WINDOW_ADDR:
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HotWindowClient(settings.HOT_WINDOW_ADDR, timeout=settings.HOT_WINDOW_TIMEOUT_MS / 1000.0)
+    return _client
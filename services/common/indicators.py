@@ -0,0 +1,348 @@
+# services/common/indicators.py
+# Vectorized indicator kernels over contiguous float64 arrays, plus a parameter-grid engine.
+#
+# Values follow pandas_ta 0.3.14b0 defaults (checked with scripts/check_indicators.py):
+#   - sma / bbands: rolling mean and population stddev (ddof=0) over `length` bars;
+#   - ema: seeded with the SMA of the first `length` values, then alpha = 2 / (length + 1),
+#     adjust=False; macd = ema(fast) - ema(slow), signal = ema(signal) of the macd line;
+#   - rma (rsi, atr): ewm(alpha=1/length, adjust=True) once `length` values were seen;
+#   - atr: rma of the true range; vwap: typical price (hlc3) weighted, reset every anchor
+#     period (D/W/M, UTC).
+# Leading values without enough history are NaN.
+#
+# A grid shares the work parameter sets have in common: one set of block prefix sums of
+# x and x^2 serves every SMA/band length, each EMA/RMA length runs once however many
+# MACD/RSI/ATR sets use it, and price changes, true range and price*volume are computed
+# once. The exponential recursions use pandas' compiled ewm (the kernel pandas_ta runs on).
+import re
+
+import numpy as np
+import pandas as pd
+
+# Block size for the prefix sums; sums restart per block, relative to the block's first value,
+# so they stay small and the differences keep full precision on long, trending series
+_BLOCK = 256
+
+
+def _f64(x):
+    return np.ascontiguousarray(x, dtype=np.float64)
+
+
+class RollingSums:
+    """
+    Windowed sums of x and x^2 for any length up to `max_length`, from block-restarted prefix
+    sums built once. Feed it finite values (cleaned closes).
+    """
+
+    def __init__(self, x, max_length=1):
+        x = _f64(x)
+        self.n = n = len(x)
+        k = _BLOCK
+        while k < max_length:
+            k *= 2
+        self.block = k
+        nb = -(-n // k) if n else 0
+        # Padded to whole blocks; row b holds block b, relative to its first value
+        self.ref = x[::k].copy()
+        y = np.zeros(nb * k)
+        y[:n] = x
+        y = y.reshape(nb, k) - self.ref[:, None]
+        self.p1 = np.cumsum(y, axis=1)
+        self.p2 = np.cumsum(y * y, axis=1)
+
+    def moments(self, length):
+        """(mean, population variance) over each trailing `length` window; NaN before it fills."""
+        n, k = self.n, self.block
+        if length > k:
+            raise ValueError(f"window {length} is longer than the prefix block {k}")
+        if length < 1 or n < length:
+            return np.full(n, np.nan), np.full(n, np.nan)
+        p1, p2 = self.p1, self.p2
+        s1, s2 = np.empty_like(p1), np.empty_like(p2)
+        # Windows ending at column j >= length - 1 lie inside their block
+        s1[:, :length] = p1[:, :length]
+        s2[:, :length] = p2[:, :length]
+        np.subtract(p1[:, length:], p1[:, :k - length], out=s1[:, length:])
+        np.subtract(p2[:, length:], p2[:, :k - length], out=s2[:, length:])
+        if length > 1 and len(p1) > 1:
+            # Earlier columns also take the tail of the previous block, re-based onto this one
+            m = np.arange(length - 1, 0, -1, dtype=np.float64)
+            a1 = p1[:-1, k - 1:] - p1[:-1, k - length:k - 1]
+            a2 = p2[:-1, k - 1:] - p2[:-1, k - length:k - 1]
+            d = (self.ref[:-1] - self.ref[1:])[:, None]
+            s1[1:, :length - 1] += a1 + m * d
+            s2[1:, :length - 1] += a2 + 2 * d * a1 + m * d * d
+        # In place from here: s1 becomes the mean offset, s2 the variance
+        s1 /= length
+        s2 /= length
+        s2 -= s1 * s1
+        np.maximum(s2, 0.0, out=s2)
+        s1 += self.ref[:, None]
+        mean, var = s1.ravel()[:n], s2.ravel()[:n]
+        mean[:length - 1] = np.nan
+        var[:length - 1] = np.nan
+        return mean, var
+
+
+def sma(x, length, sums=None):
+    sums = sums or RollingSums(x, length)
+    return sums.moments(length)[0]
+
+
+def rolling_std(x, length, sums=None):
+    sums = sums or RollingSums(x, length)
+    return np.sqrt(sums.moments(length)[1])
+
+
+def bbands(x, length, std=2.0, sums=None):
+    """(lower, mid, upper) Bollinger Bands."""
+    sums = sums or RollingSums(x, length)
+    mid, var = sums.moments(length)
+    dev = std * np.sqrt(var)
+    return mid - dev, mid, mid + dev
+
+
+def ema(x, length):
+    """SMA-seeded exponential moving average (NaN before the seed)."""
+    x = _f64(x)
+    out = np.full(len(x), np.nan)
+    finite = np.flatnonzero(np.isfinite(x))
+    if len(finite) == 0 or len(x) - finite[0] < length:
+        return out
+    first = finite[0]
+    seeded = x[first:].copy()
+    seeded[length - 1] = seeded[:length].mean()
+    seeded[:length - 1] = np.nan
+    out[first:] = pd.Series(seeded).ewm(span=length, adjust=False).mean().to_numpy()
+    return out
+
+
+def rma(x, length):
+    """Wilder's moving average: ewm(alpha=1/length, adjust=True, min_periods=length)."""
+    return pd.Series(_f64(x)).ewm(alpha=1.0 / length, min_periods=length).mean().to_numpy()
+
+
+def macd(x, fast=12, slow=26, signal=9, fast_ema=None, slow_ema=None):
+    """(macd, histogram, signal); pass precomputed EMAs of x to share them across sets."""
+    fast_ema = ema(x, fast) if fast_ema is None else fast_ema
+    slow_ema = ema(x, slow) if slow_ema is None else slow_ema
+    line = fast_ema - slow_ema
+    return line, *_signal(line, signal)
+
+
+def _signal(line, signal):
+    sig = ema(line, signal)
+    return line - sig, sig
+
+
+def _changes(x):
+    d = np.empty(len(x))
+    d[:1] = np.nan
+    np.subtract(x[1:], x[:-1], out=d[1:])
+    return np.clip(d, 0, None), np.clip(d, None, 0)
+
+
+def _rsi(gain_avg, loss_avg):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return 100.0 * gain_avg / (gain_avg + np.abs(loss_avg))
+
+
+def rsi(x, length=14):
+    gains, losses = _changes(_f64(x))
+    return _rsi(rma(gains, length), rma(losses, length))
+
+
+def true_range(high, low, close):
+    high, low, close = _f64(high), _f64(low), _f64(close)
+    prev = np.empty(len(close))
+    prev[:1] = np.nan
+    prev[1:] = close[:-1]
+    tr = np.maximum(high - low, np.maximum(np.abs(high - prev), np.abs(prev - low)))
+    tr[:1] = np.nan
+    return tr
+
+
+def atr(high, low, close, length=14):
+    return rma(true_range(high, low, close), length)
+
+
+def _anchor_keys(time_sec, anchor):
+    days = np.asarray(time_sec, dtype=np.int64) // 86400
+    if anchor == "D":
+        return days
+    if anchor == "W":
+        return (days + 3) // 7  # weeks starting Monday (1970-01-01 was a Thursday)
+    if anchor == "M":
+        return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    raise ValueError(f"vwap anchor must be D, W or M, not {anchor!r}")
+
+
+def _group_cumsum(values, starts):
+    c = np.cumsum(values)
+    base = np.concatenate(([0.0], c[:-1]))[starts]
+    return c - np.repeat(base, np.diff(np.append(starts, len(values))))
+
+
+def vwap(high, low, close, volume, time_sec, anchor="D", tpv=None):
+    """Anchored VWAP of the typical price; `time_sec` must be sorted."""
+    volume = _f64(volume)
+    if tpv is None:
+        tpv = (_f64(high) + _f64(low) + _f64(close)) / 3.0 * volume
+    if len(volume) == 0:
+        return np.empty(0)
+    keys = _anchor_keys(time_sec, anchor)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return _group_cumsum(tpv, starts) / _group_cumsum(volume, starts)
+
+
+# --- parameter grid --------------------------------------------------------------------------
+
+def _fmt(value):
+    return f"{float(value):.1f}" if float(value).is_integer() else f"{float(value):g}"
+
+
+class IndicatorGrid:
+    """
+    A set of indicator parameterizations computed together over one bar series:
+
+        bb:   (length, std) pairs   -> BBL/BBM/BBU_<length>_<std>
+        sma:  lengths               -> SMA_<length>
+        ema:  lengths               -> EMA_<length>
+        macd: (fast, slow, signal)  -> MACD/MACDh/MACDs_<fast>_<slow>_<signal>
+        rsi:  lengths               -> RSI_<length>
+        atr:  lengths               -> ATRr_<length>   (needs high/low)
+        vwap: anchors (D, W, M)     -> VWAP_<anchor>   (needs high/low/volume/time_sec)
+
+    Column names are the ones pandas_ta gives the same indicators.
+    """
+
+    KINDS = ("bb", "sma", "ema", "macd", "rsi", "atr", "vwap")
+
+    def __init__(self, bb=(), sma=(), ema=(), macd=(), rsi=(), atr=(), vwap=()):
+        self.bb = [(int(n), float(s)) for n, s in bb]
+        self.sma = [int(n) for n in sma]
+        self.ema = [int(n) for n in ema]
+        self.macd = [tuple(int(v) for v in p) for p in macd]
+        self.rsi = [int(n) for n in rsi]
+        self.atr = [int(n) for n in atr]
+        self.vwap = [str(a).upper() for a in vwap]
+        lengths = [n for n, _ in self.bb] + self.sma + self.ema + self.rsi + self.atr + [v for p in self.macd for v in p]
+        if any(n < 1 for n in lengths):
+            raise ValueError("indicator lengths must be positive")
+        for a in self.vwap:
+            _anchor_keys(np.empty(0, dtype=np.int64), a)
+
+    @classmethod
+    def parse(cls, specs):
+        """
+        Grid from text specs, e.g. {"bb": "20x2,50x2.5", "macd": "12-26-9", "rsi": "7,14", "vwap": "D"}.
+        Raises ValueError for malformed values.
+        """
+        kw = {}
+        for kind, text in specs.items():
+            items = [t.strip() for t in (text or "").split(",") if t.strip()]
+            try:
+                if kind == "bb":
+                    kw[kind] = [(t.split("x")[0], t.split("x")[1] if "x" in t else 2.0) for t in items]
+                elif kind == "macd":
+                    kw[kind] = [re.split(r"[-_/]", t) for t in items]
+                    if any(len(p) != 3 for p in kw[kind]):
+                        raise ValueError
+                elif kind == "vwap":
+                    kw[kind] = items
+                elif kind in cls.KINDS:
+                    kw[kind] = [int(t) for t in items]
+                else:
+                    raise ValueError(f"unknown indicator {kind!r}")
+            except (ValueError, IndexError) as e:
+                raise ValueError(str(e) or f"malformed {kind} spec {text!r}") from None
+        return cls(**kw)
+
+    @property
+    def size(self):
+        return sum(len(getattr(self, k)) for k in self.KINDS)
+
+    @property
+    def needs_ohlcv(self):
+        return bool(self.atr or self.vwap)
+
+    @property
+    def warmup(self):
+        """Bars before every column has a value (EMA-based ones still converge after that)."""
+        need = [n for n, _ in self.bb] + self.sma + self.ema + [n + 1 for n in self.rsi + self.atr]
+        need += [max(f, s) + g - 1 for f, s, g in self.macd]
+        return max(need, default=0)
+
+    def columns(self):
+        cols = []
+        for n, s in self.bb:
+            cols += [f"BBL_{n}_{_fmt(s)}", f"BBM_{n}_{_fmt(s)}", f"BBU_{n}_{_fmt(s)}"]
+        cols += [f"SMA_{n}" for n in self.sma] + [f"EMA_{n}" for n in self.ema]
+        for f, s, g in self.macd:
+            cols += [f"MACD_{f}_{s}_{g}", f"MACDh_{f}_{s}_{g}", f"MACDs_{f}_{s}_{g}"]
+        cols += [f"RSI_{n}" for n in self.rsi] + [f"ATRr_{n}" for n in self.atr] + [f"VWAP_{a}" for a in self.vwap]
+        return cols
+
+    def compute(self, close, high=None, low=None, volume=None, time_sec=None):
+        """{column: float64 array aligned with close} for every parameter set in the grid."""
+        close = _f64(close)
+        out = {}
+
+        windows = sorted({n for n, _ in self.bb} | set(self.sma))
+        if windows:
+            sums = RollingSums(close, windows[-1])
+            # (mean, stddev) per length; each length's variance becomes its stddev in place
+            moments = {n: sums.moments(n) for n in windows}
+            for mean, var in moments.values():
+                np.sqrt(var, out=var)
+            for n, s in self.bb:
+                mid, dev = moments[n][0], moments[n][1] * s
+                out[f"BBL_{n}_{_fmt(s)}"] = mid - dev
+                out[f"BBM_{n}_{_fmt(s)}"] = mid
+                out[f"BBU_{n}_{_fmt(s)}"] = np.add(mid, dev, out=dev)
+            for n in self.sma:
+                out[f"SMA_{n}"] = moments[n][0]
+
+        emas = {n: ema(close, n) for n in sorted(set(self.ema) | {v for f, s, _ in self.macd for v in (f, s)})}
+        for n in self.ema:
+            out[f"EMA_{n}"] = emas[n]
+        lines = {}
+        for f, s, g in self.macd:
+            line = lines.setdefault((f, s), emas[f] - emas[s])
+            hist, sig = _signal(line, g)
+            out[f"MACD_{f}_{s}_{g}"], out[f"MACDh_{f}_{s}_{g}"], out[f"MACDs_{f}_{s}_{g}"] = line, hist, sig
+
+        if self.rsi:
+            gains, losses = _changes(close)
+            for n in self.rsi:
+                out[f"RSI_{n}"] = _rsi(rma(gains, n), rma(losses, n))
+
+        if self.needs_ohlcv and (high is None or low is None):
+            raise ValueError("atr/vwap need high and low")
+        if self.atr:
+            tr = true_range(high, low, close)
+            for n in self.atr:
+                out[f"ATRr_{n}"] = rma(tr, n)
+        if self.vwap:
+            if volume is None or time_sec is None:
+                raise ValueError("vwap needs volume and time_sec")
+            tpv = (_f64(high) + _f64(low) + close) / 3.0 * _f64(volume)
+            for a in self.vwap:
+                out[f"VWAP_{a}"] = vwap(high, low, close, volume, time_sec, a, tpv=tpv)
+        return out
+
+
+def ta_grid(params):
+    """Grid of the BBANDS/MACD/RSI set stored in ta_1d/ta_1m (a ta_state.IndicatorParams)."""
+    return IndicatorGrid(bb=[(params.bb_length, params.bb_std)],
+                         macd=[(params.macd_fast, params.macd_slow, params.macd_signal)],
+                         rsi=[params.rsi_length])
+
+
+def ta_columns(params):
+    """Grid column for each INDICATOR_FIELDS name of `params`."""
+    bb = f"{params.bb_length}_{_fmt(params.bb_std)}"
+    m = f"{params.macd_fast}_{params.macd_slow}_{params.macd_signal}"
+    return {"bb_l": f"BBL_{bb}", "bb_m": f"BBM_{bb}", "bb_u": f"BBU_{bb}", "macd": f"MACD_{m}",
+            "macds": f"MACDs_{m}", "macdh": f"MACDh_{m}", "rsi": f"RSI_{params.rsi_length}"}
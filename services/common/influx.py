@@ -1,7 +1,10 @@
 # Uses official InfluxDB Python client but keeps the same function names
 # services/common/influx.py
+import os
+import atexit
 import asyncio
-from influxdb_client import InfluxDBClient, Point, WritePrecision
+import threading
+from influxdb_client import InfluxDBClient, Point, WritePrecision, Dialect
 from influxdb_client.client.write_api import SYNCHRONOUS, ASYNCHRONOUS
 from config.settings import settings
 
@@ -17,6 +20,211 @@ def get_influxdb_client():
     return client, org, bucket
 
 
+class _SharedClient:
+    """
+    Process-wide InfluxDBClient with a reused urllib3 connection pool.
+
+    Thread-safe lazy creation; after a fork (gunicorn pre-fork, multiprocessing) the child
+    drops the parent's client without closing it and builds its own on first use, so
+    processes never share sockets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._write_api = None
+        self._pid = None
+        self.created = 0
+        self.checkouts = 0  # approximate under contention; only used for stats
+
+    def get(self):
+        client = self._client
+        if client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    self._open()
+                client = self._client
+        self.checkouts += 1
+        return client
+
+    def write_api(self):
+        client = self.get()
+        api = self._write_api
+        if api is None:
+            with self._lock:
+                if self._write_api is None:
+                    self._write_api = client.write_api(write_options=SYNCHRONOUS)
+                api = self._write_api
+        return api
+
+    def _open(self):
+        url = settings.INFLUX_URL
+        token = settings.INFLUX_TOKEN
+        org = settings.INFLUX_ORG
+        if not all([url, token, org, settings.INFLUX_BUCKET]):
+            raise RuntimeError("InfluxDB settings missing (INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG, INFLUX_BUCKET)")
+        self._client = InfluxDBClient(
+            url=url,
+            token=token,
+            org=org,
+            timeout=settings.INFLUX_TIMEOUT_MS,
+            connection_pool_maxsize=settings.INFLUX_POOL_SIZE,
+        )
+        self._write_api = None
+        self._pid = os.getpid()
+        self.created += 1
+
+    def reset_after_fork(self):
+        # Never close the inherited client here: its sockets belong to the parent
+        self._lock = threading.Lock()
+        self._client = None
+        self._write_api = None
+        self._pid = None
+
+    def close(self):
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                if self._write_api is not None:
+                    self._write_api.close()
+                self._client.close()
+            self._client = None
+            self._write_api = None
+            self._pid = None
+
+    def stats(self):
+        """Checkout counts plus urllib3 pool counters (connections opened vs requests served)."""
+        out = {
+            "pid": os.getpid(),
+            "pool_maxsize": settings.INFLUX_POOL_SIZE,
+            "clients_created": self.created,
+            "checkouts": self.checkouts,
+            "connections": 0,
+            "requests": 0,
+            "reused_requests": 0,
+        }
+        client = self._client
+        if client is None or self._pid != os.getpid():
+            return out
+        try:
+            pools = client.api_client.rest_client.pool_manager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    out["connections"] += pool.num_connections
+                    out["requests"] += pool.num_requests
+        except Exception:
+            pass
+        out["reused_requests"] = max(0, out["requests"] - out["connections"])
+        return out
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class _SingleFlight:
+    """
+    Coalesces identical concurrent queries: the first caller for a key runs the query, later
+    callers arriving while it is in flight wait for and share its result (or exception).
+    Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.deduplicated = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.deduplicated += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        total = self.executed + self.deduplicated
+        return {
+            "enabled": settings.INFLUX_SINGLE_FLIGHT,
+            "executed": self.executed,
+            "deduplicated": self.deduplicated,
+            "dedup_ratio": round(self.deduplicated / total, 3) if total else 0.0,
+            "in_flight": in_flight,
+        }
+
+
+_shared = _SharedClient()
+_flights = _SingleFlight()
+atexit.register(_shared.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_shared.reset_after_fork)
+    os.register_at_fork(after_in_child=_flights.reset_after_fork)
+
+
+def _flight_key(kind, query, org):
+    # Indentation and blank lines don't change a Flux query; string literals are left untouched
+    lines = (line.strip() for line in query.splitlines())
+    return kind, org, "\n".join(line for line in lines if line)
+
+
+def _coalesced(kind, query, fn):
+    if not settings.INFLUX_SINGLE_FLIGHT:
+        return fn()
+    return _flights.do(_flight_key(kind, query, settings.INFLUX_ORG), fn)
+
+
+def get_shared_client():
+    """Return (client, org, bucket) backed by the process-wide pooled client. Do not close it."""
+    return _shared.get(), settings.INFLUX_ORG, settings.INFLUX_BUCKET
+
+
+def influx_client_stats():
+    return _shared.stats()
+
+
+def single_flight_stats():
+    """Counts of queries executed vs. served from an identical in-flight query."""
+    return _flights.stats()
+
+
+def influx_health():
+    """Return (ok, message) from the Influx /health endpoint using the shared client."""
+    h = _shared.get().health()
+    ok = getattr(h, "status", "").lower() == "pass"
+    return ok, getattr(h, "message", None) or ("ok" if ok else "unknown")
+
+
 def get_write_api(client=None, mode="sync"):
     if client is None:
         client, _, _ = get_influxdb_client()
@@ -46,12 +254,7 @@ def point_from_bar(measurement, tags, bar):
 def write_points_batch(points):
     if not points:
         return
-    client, org, bucket = get_influxdb_client()
-    try:
-        write_api = get_write_api(client, mode="sync")
-        write_api.write(bucket=bucket, org=org, record=points)
-    finally:
-        client.close()
+    _shared.write_api().write(bucket=settings.INFLUX_BUCKET, org=settings.INFLUX_ORG, record=points)
 
 
 def write_points_batch_async(points):
@@ -61,14 +264,72 @@ def write_points_batch_async(points):
     return loop.run_in_executor(None, write_points_batch, points)
 
 
-def query_flux(query):
-    client, org, _ = get_influxdb_client()
+# Plain CSV (one header row, no annotation rows) so pandas' C parser can read the body directly
+_CSV_DIALECT = Dialect(header=True, delimiter=",", comment_prefix="#", annotations=[],
+                       date_time_format="RFC3339")
+
+
+def iter_flux_frames(query, chunk_rows=50000):
+    """
+    Stream query results as pandas DataFrames of up to `chunk_rows` rows.
+
+    The raw CSV response is parsed by pandas' C reader instead of per-record Python objects.
+    Columns are the Flux result columns; `_time` stays a string (see services/common/columnar.py
+    for bulk sanitation). Header rows repeated between result tables are dropped.
+    """
+    import pandas as pd  # only API/script processes pay for the import
+
+    client, org, _ = get_shared_client()
+    resp = client.query_api().query_raw(query=query, org=org, dialect=_CSV_DIALECT)
     try:
-        result = client.query_api().query(org=org, query=query)
-        rows = []
-        for table in result:
-            for record in table.records:
-                rows.append(record.values)
-        return rows
+        try:
+            reader = pd.read_csv(resp, chunksize=chunk_rows, dtype={"_time": str}, skip_blank_lines=True)
+        except pd.errors.EmptyDataError:
+            return
+        with reader:
+            for df in reader:
+                if "_time" in df.columns:
+                    df = df[df["_time"] != "_time"]
+                if len(df):
+                    yield df
     finally:
-        client.close()
+        resp.close()
+        resp.release_conn()
+
+
+def query_frames(query, chunk_rows=50000):
+    """
+    All result chunks of `query` as a list of raw DataFrames (see iter_flux_frames).
+    Identical concurrent queries share one execution; treat the frames as read-only.
+    Memory grows with the result: use it for bounded queries (range-cache fills, single
+    points) or where the caller needs every row anyway, and iter_flux_frames otherwise.
+    """
+    return list(_coalesced("frames", query, lambda: list(iter_flux_frames(query, chunk_rows))))
+
+
+def _query_rows(query):
+    client, org, _ = get_shared_client()
+    result = client.query_api().query(org=org, query=query)
+    rows = []
+    for table in result:
+        for record in table.records:
+            rows.append(record.values)
+    return rows
+
+
+def flux_any(column, values):
+    """
+    Flux predicate body matching rows whose `column` is one of `values`, e.g.
+    (r.symbol == "A" or r.symbol == "B"). Unlike contains(), an or-chain of equality tests on
+    a tag or _field is pushed down to the storage engine, so only the matching series are read.
+    """
+    terms = [f'r.{column} == "{v}"' for v in values]
+    return "(" + " or ".join(terms) + ")" if terms else "false"
+
+
+def query_flux(query):
+    """
+    Run `query` and return every record's values dict. Identical concurrent queries (same
+    org and Flux text, ignoring indentation) share one execution; treat the rows as read-only.
+    """
+    return list(_coalesced("rows", query, lambda: _query_rows(query)))
@@ -0,0 +1,160 @@
+# services/common/line_protocol.py
+# Direct InfluxDB line-protocol encoding for the write paths.
+# Building an influxdb_client.Point per row costs several Python objects and method calls;
+# these helpers go straight from bars / columns to line strings the write API accepts as-is.
+import math
+import numpy as np
+
+_MEASUREMENT_ESCAPES = str.maketrans({",": r"\,", " ": r"\ ", "\n": r"\n"})
+_KEY_ESCAPES = str.maketrans({",": r"\,", "=": r"\=", " ": r"\ ", "\n": r"\n"})
+
+
+def escape_measurement(name):
+    return str(name).translate(_MEASUREMENT_ESCAPES)
+
+
+def escape_key(value):
+    """Escape a tag key, tag value or field key."""
+    return str(value).translate(_KEY_ESCAPES)
+
+
+def escape_string_field(value):
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def encode_tags(tags):
+    """Encode a tag set as ',k=v,...' (sorted by key, empty values skipped), or '' for no tags."""
+    if not tags:
+        return ""
+    return "".join(
+        f",{escape_key(k)}={escape_key(v)}" for k, v in sorted(tags.items()) if v is not None and v != ""
+    )
+
+
+def series_key(measurement, tags):
+    """Measurement plus tag set; constant per series, so callers can encode it once and reuse it."""
+    return escape_measurement(measurement) + encode_tags(tags)
+
+
+def format_field(value):
+    """Encode one field value, or return None for values Influx cannot store (None, NaN, inf)."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, np.integer)):
+        return f"{int(value)}i"
+    if isinstance(value, (float, np.floating)):
+        value = float(value)
+        return repr(value) if math.isfinite(value) else None
+    return escape_string_field(value)
+
+
+def encode_row(measurement, tags, fields, timestamp_ns, key=None):
+    """
+    Encode one line. `fields` is a dict; ints become integer fields (suffix 'i'), floats
+    are written with full precision. Fields that are None/NaN are skipped; returns None
+    if nothing is left. Pass a precomputed `key` (see series_key) to skip tag encoding.
+    """
+    parts = []
+    for k, v in fields.items():
+        enc = format_field(v)
+        if enc is not None:
+            parts.append(f"{escape_key(k)}={enc}")
+    if not parts:
+        return None
+    if key is None:
+        key = series_key(measurement, tags)
+    line = key + " " + ",".join(parts)
+    if timestamp_ns is not None:
+        line += f" {int(timestamp_ns)}"
+    return line
+
+
+def encode_bar(measurement, tags, bar, key=None):
+    """Line-protocol equivalent of point_from_bar(); bar["timestamp"] is expected in ns."""
+    if key is None:
+        key = series_key(measurement, tags)
+    return (
+        f"{key} o={float(bar['open'])!r},h={float(bar['high'])!r},l={float(bar['low'])!r},"
+        f"c={float(bar['close'])!r},v={int(bar.get('volume', 0))}i,vw={float(bar.get('vwap', 0.0))!r},"
+        f"n={int(bar.get('transactions', 0))}i {int(bar['timestamp'])}"
+    )
+
+
+def encode_bars(measurement, tags, bars):
+    """Encode an iterable of bar dicts sharing one tag set into a list of lines."""
+    key = series_key(measurement, tags)
+    return [encode_bar(measurement, tags, b, key=key) for b in bars]
+
+
+def _column_strings(name, values, integer):
+    """Vectorized 'name=value' strings for a column, plus a mask of rows that have a value."""
+    arr = np.asarray(values)
+    if integer:
+        if arr.dtype.kind == "f":
+            valid = np.isfinite(arr)
+            arr = np.where(valid, arr, 0)
+        else:
+            valid = np.ones(len(arr), dtype=bool)
+        text = arr.astype(np.int64).astype(str).astype(object) + "i"
+    else:
+        arr = arr.astype(np.float64)
+        valid = np.isfinite(arr)
+        # numpy's str() for float64 is the shortest round-trip repr (e.g. '1.5', '1e-05')
+        text = arr.astype(str).astype(object)
+    return (escape_key(name) + "=") + text, valid
+
+
+def encode_columns(measurement, tags, timestamps_ns, columns, int_fields=()):
+    """
+    Vectorized encoder for column sets (NumPy arrays or pandas Series of equal length).
+
+    Args:
+        measurement: measurement name.
+        tags: dict of tags shared by every row.
+        timestamps_ns: int64 array of timestamps in ns.
+        columns: dict of field name -> array of values. Non-finite values are omitted per row,
+            and rows with no remaining fields are dropped (e.g. indicator warm-up NaNs).
+        int_fields: names of columns to write as integer fields.
+    Returns:
+        list of line strings.
+    """
+    ts = np.asarray(timestamps_ns).astype(np.int64)
+    n = len(ts)
+    if n == 0 or not columns:
+        return []
+    int_fields = set(int_fields)
+    acc = np.full(n, "", dtype=object)
+    has_any = np.zeros(n, dtype=bool)
+    for name, values in columns.items():
+        text, valid = _column_strings(name, values, name in int_fields)
+        # Append ",name=value" where valid; the first valid field of a row gets no comma
+        joined = np.where(has_any, acc + ",", acc) + text
+        acc = np.where(valid, joined, acc)
+        has_any |= valid
+    if not has_any.any():
+        return []
+    prefix = series_key(measurement, tags) + " "
+    lines = prefix + acc[has_any] + " " + ts[has_any].astype(str).astype(object)
+    return lines.tolist()
+
+
+def encode_frame(measurement, tags, df, fields=None, int_fields=()):
+    """
+    Encode a DataFrame indexed by timestamp (DatetimeIndex or int ns) into lines.
+    `fields` selects/orders columns (defaults to all columns present).
+    """
+    if df is None or len(df) == 0:
+        return []
+    idx = df.index
+    if hasattr(idx, "asi8"):
+        ts = idx.asi8
+        unit = getattr(getattr(idx, "dtype", None), "unit", "ns")
+        if unit != "ns":
+            ts = idx.as_unit("ns").asi8
+    else:
+        ts = np.asarray(idx, dtype=np.int64)
+    names = [f for f in (fields or df.columns) if f in df.columns]
+    columns = {f: df[f].to_numpy() for f in names}
+    return encode_columns(measurement, tags, ts, columns, int_fields=int_fields)
@@ -1,15 +1,235 @@
 import time
+import gzip
 import json
 import math
+import queue
+import threading
 import urllib.parse
-import urllib.request
-import urllib.error
 
+import urllib3
 
-def _polygon_get(url, timeout=30):
-    req = urllib.request.Request(url, method="GET")
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+from config.settings import settings
+
+
+class TokenBucket:
+    """
+    Thread-safe request limiter shared by every caller of one API key: `rate` requests per
+    second on average, bursts of up to `burst`. rate <= 0 disables limiting. pause() holds
+    every caller back, e.g. for a 429's Retry-After.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waited_sec = 0.0
+        self.pauses = 0
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self._updated > now:
+                    delay = self._updated - now  # paused
+                elif self.rate <= 0:
+                    self.acquired += 1
+                    return
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.acquired += 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+                self.waited_sec += delay
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """Empty the bucket and refill nothing for `seconds`."""
+        with self._lock:
+            self.pauses += 1
+            self._tokens = 0.0
+            self._updated = max(self._updated, time.monotonic() + seconds)
+
+    def stats(self):
+        with self._lock:
+            return {"rate": self.rate, "burst": self.capacity, "acquired": self.acquired,
+                    "waited_sec": round(self.waited_sec, 3), "pauses": self.pauses}
+
+
+def _retry_after(headers):
+    """Seconds from a Retry-After header (delta-seconds form only), else None."""
+    try:
+        return max(0.0, float(headers.get("Retry-After")))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class PolygonHTTPError(Exception):
+    def __init__(self, status, body, retry_after=None):
+        super().__init__(f"Polygon error: {status} {body}")
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+
+class PolygonSession:
+    """
+    Keep-alive HTTP client for the Polygon REST API: one urllib3 connection pool (the library
+    the Influx client is built on), gzip-compressed responses, no per-request TLS handshake.
+    Thread-safe; `pool_size` connections are kept per host for concurrent callers.
+    """
+
+    def __init__(self, base_url=None, pool_size=None, timeout=None):
+        self.base_url = (base_url or settings.POLYGON_BASE_URL).rstrip("/")
+        self._pool = urllib3.PoolManager(
+            maxsize=pool_size or settings.POLYGON_POOL_SIZE,
+            retries=False,
+            timeout=urllib3.Timeout(total=timeout or settings.POLYGON_TIMEOUT_SEC),
+            headers={"Accept-Encoding": "gzip", "Connection": "keep-alive"},
+        )
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.wire_bytes = 0
+
+    def url(self, path):
+        """Absolute URL for an API path (URLs that already carry a host are kept as is)."""
+        return path if path.startswith(("http://", "https://")) else self.base_url + path
+
+    def get_json(self, url):
+        resp = self._pool.request("GET", self.url(url), preload_content=False)
+        try:
+            raw = resp.read(decode_content=False)
+        finally:
+            resp.release_conn()
+        with self._lock:
+            self.requests += 1
+            self.wire_bytes += len(raw)
+        if resp.headers.get("Content-Encoding", "").lower() == "gzip":
+            raw = gzip.decompress(raw)
+        if resp.status >= 400:
+            raise PolygonHTTPError(resp.status, raw.decode("utf-8", errors="ignore"), _retry_after(resp.headers))
+        return json.loads(raw)
+
+    def stats(self):
+        with self._lock:
+            return {"base_url": self.base_url, "requests": self.requests, "wire_bytes": self.wire_bytes}
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_polygon_session():
+    """Process-wide PolygonSession configured from settings."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = PolygonSession()
+    return _session
+
+
+def _polygon_get(url):
+    return get_polygon_session().get_json(url)
+
+
+def _put(q, item, stop):
+    # Bounded put that gives up once the consumer has gone away
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _read_ahead(items, depth):
+    """
+    Iterate `items` from a background thread that runs up to `depth` items ahead of the
+    consumer (depth <= 0 iterates inline). Errors are re-raised in the consumer.
+    """
+    if depth <= 0:
+        yield from items
+        return
+    q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    end = object()
+
+    def produce():
+        try:
+            for item in items:
+                if not _put(q, item, stop):
+                    return
+            _put(q, end, stop)
+        except BaseException as e:
+            _put(q, e, stop)
+
+    threading.Thread(target=produce, name="polygon-read-ahead", daemon=True).start()
+    try:
+        while True:
+            item = q.get()
+            if item is end:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def _aggregate_pages(api_key, url, limiter, backoff_initial, backoff_max, max_retries):
+    """
+    Each page of an aggregates request in order, following next_url, with retry/backoff.
+    A page that fails with a 5xx or a connection error `max_retries` times in a row raises;
+    429s are retried for as long as Polygon asks.
+    """
+    backoff = backoff_initial
+    failures = 0
+    next_url = url
+
+    while next_url:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            data = _polygon_get(next_url)
+        except PolygonHTTPError as e:
+            if e.status in (429, 500, 502, 503, 504):
+                if e.status != 429:
+                    failures += 1
+                    if failures > max_retries:
+                        raise RuntimeError(f"{e} (gave up after {max_retries} retries)") from e
+                delay = e.retry_after if e.status == 429 else None
+                delay = backoff if delay is None else delay
+                if limiter is not None and e.status == 429:
+                    limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+                backoff = min(backoff * 2, backoff_max)
+                continue
+            raise RuntimeError(str(e)) from e
+        except (urllib3.exceptions.HTTPError, OSError) as e:
+            # Dropped keep-alive connection, timeout, reset: retry like a 5xx
+            failures += 1
+            if failures > max_retries:
+                raise RuntimeError(f"Polygon request failed: {e} (gave up after {max_retries} retries)") from e
+            time.sleep(backoff)
+            backoff = min(backoff * 2, backoff_max)
+            continue
+        backoff = backoff_initial
+        failures = 0
+        yield data
+
+        # Pagination: use "next_url" if present (absolute, or a path on the API host)
+        next_url = data.get("next_url")
+        if next_url:
+            sep = "&" if "?" in next_url else "?"
+            next_url = f"{next_url}{sep}apiKey={api_key}"
 
 
 def list_aggregates(
@@ -24,34 +244,33 @@ def list_aggregates(
         limit=50000,
         backoff_initial=0.5,
         backoff_max=8.0,
+        limiter=None,
+        prefetch=None,
+        max_retries=None,
 ):
     """
     Generator over Polygon aggregate bars (REST).
     Normalizes output to a dict with open, high, low, close, volume, vwap, transactions, timestamp (ns).
+    `limiter` (a TokenBucket) is acquired before every page request; a 429 pauses it for the
+    response's Retry-After (or the current backoff) so concurrent callers back off together.
+    Other transient failures are retried up to `max_retries` times (default POLYGON_MAX_RETRIES)
+    per page before a RuntimeError is raised.
+    Up to `prefetch` pages (default POLYGON_PREFETCH_PAGES) are fetched ahead in a background
+    thread, so the next page downloads while the caller is still writing the current one.
     """
-    base = f"https://api.polygon.io/v2/aggs/ticker/{urllib.parse.quote(symbol)}/range/{multiplier}/{timespan}/{start}/{end}"
+    path = f"/v2/aggs/ticker/{urllib.parse.quote(symbol)}/range/{multiplier}/{timespan}/{start}/{end}"
     params = {
         "adjusted": str(adjusted).lower(),
         "sort": sort,
         "limit": str(limit),
         "apiKey": api_key,
     }
-    url = base + "?" + urllib.parse.urlencode(params)
-
-    backoff = backoff_initial
-    next_url = url
-
-    while next_url:
-        try:
-            data = _polygon_get(next_url)
-        except urllib.error.HTTPError as e:
-            if e.code in (429, 500, 502, 503, 504):
-                time.sleep(backoff)
-                backoff = min(backoff * 2, backoff_max)
-                continue
-            body = e.read().decode("utf-8", errors="ignore")
-            raise RuntimeError(f"Polygon error: {e.code} {body}") from e
+    url = path + "?" + urllib.parse.urlencode(params)
+    retries = settings.POLYGON_MAX_RETRIES if max_retries is None else max_retries
+    pages = _aggregate_pages(api_key, url, limiter, backoff_initial, backoff_max, retries)
+    depth = settings.POLYGON_PREFETCH_PAGES if prefetch is None else prefetch
 
+    for data in _read_ahead(pages, depth):
         results = data.get("results") or []
         for r in results:
             # Polygon fields: t=timestamp(ms), o,h,l,c,v, vw, n
@@ -68,13 +287,6 @@ def list_aggregates(
                 "transactions": int(r.get("n", 0)),
             }
 
-        # Pagination: use "next_url" if present
-        next_url = data.get("next_url")
-        if next_url:
-            # next_url is partial; append apiKey
-            sep = "&" if "?" in next_url else "?"
-            next_url = f"https://api.polygon.io{next_url}{sep}apiKey={api_key}"
-
 
 def normalize_ws_aggregate(ev):
     """
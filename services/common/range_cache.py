@@ -0,0 +1,306 @@
+# services/common/range_cache.py
+# Chunked, range-aware cache for time-series API responses.
+import json
+import time
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from config.settings import settings
+from services.common.columnar import frame_to_json_rows
+
+
+class LRUBytesCache:
+    """Thread-safe in-process LRU keyed by string, bounded by total value size in bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self._data = OrderedDict()  # key -> (value, expires_at or None)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires <= time.monotonic():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, expires)
+            self.bytes += size
+            while self.bytes > self.max_bytes and self._data:
+                old_key = next(iter(self._data))
+                self._pop(old_key)
+                self.evictions += 1
+
+    def _pop(self, key):
+        value, _ = self._data.pop(key)
+        self.bytes -= len(value)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    """
+    Shared cache tier over any Redis-compatible client (redis.Redis, a local redis-server,
+    or an in-process stand-in such as fakeredis) exposing get(key) and set(key, value, ex=ttl).
+    """
+
+    def __init__(self, client, prefix="rc:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url):
+        import redis  # optional dependency, only needed when a shared backend is configured
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+        else:
+            self.client.set(self.prefix + key, value)
+
+
+class RangeCache:
+    """
+    Caches query results in time chunks aligned to the epoch (`chunk_rows` bars per chunk).
+
+    Chunks that ended more than `grace_sec` ago are closed and cached without expiry (still
+    subject to LRU eviction); the chunk containing "now" is cached for `open_ttl` seconds only,
+    and so are closed chunks without rows, which a later backfill may still fill. A request is
+    answered from whichever chunks are cached, and each run of consecutive missing chunks is
+    filled with one query per `fill_chunks` chunks, so overlapping ranges reuse each other's
+    chunks while a cold request never holds more than `fill_chunks` chunks in memory.
+
+    Chunks are stored as the JSON array text of their rows, which lets fully covered chunks be
+    streamed to the client without re-encoding, behind a CRC of that text taken when the chunk
+    was filled; version() combines those into a validator for a whole range.
+    """
+
+    def __init__(self, local, shared=None, chunk_rows=1440, grace_sec=120, open_ttl=5.0, fill_chunks=4):
+        self.local = local
+        self.shared = shared
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.fill_chunks = max(1, int(fill_chunks))
+        self.grace_sec = grace_sec
+        self.open_ttl = open_ttl
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.queries = 0
+        self.open_refreshes = 0
+
+    def chunk_seconds(self, step_sec):
+        return int(step_sec) * self.chunk_rows
+
+    def iter_segments(self, key_prefix, start_sec, end_sec, step_sec, fetch):
+        """
+        Yield the rows for [start_sec, end_sec) chunk by chunk, in time order.
+
+        Args:
+            key_prefix: identifies the series (kind, measurement, symbol, fields, window).
+            start_sec, end_sec: requested range in epoch seconds.
+            step_sec: bar/bucket size in seconds; chunks are whole multiples of it.
+            fetch: callable(lo_sec, hi_sec) -> cleaned DataFrame with an int "time_sec" column,
+                sorted by time (see services/common/columnar.py).
+        Yields:
+            ("json", text) for chunks fully inside the range (JSON array body without brackets),
+            or ("rows", list) for edge chunks trimmed to the range.
+        """
+        chunk = self.chunk_seconds(step_sec)
+        for lo, text, _, part in self._chunks(key_prefix, start_sec, end_sec, step_sec, fetch):
+            yield self._segment(text, lo, chunk, start_sec, end_sec, frame=part)
+
+    def version(self, key_prefix, start_sec, end_sec, step_sec, fetch):
+        """
+        Digest of the rows every chunk of [start_sec, end_sec) holds, read through the cache
+        (missing chunks are filled). It changes whenever a chunk is refilled with different
+        rows, e.g. the open chunk or an empty closed chunk that a backfill has since filled.
+        """
+        h = hashlib.sha1()
+        for lo, _, crc, _ in self._chunks(key_prefix, start_sec, end_sec, step_sec, fetch):
+            h.update(f"{lo}:{crc};".encode("ascii"))
+        return h.hexdigest()[:16]
+
+    def _chunks(self, key_prefix, start_sec, end_sec, step_sec, fetch):
+        """(chunk start, JSON text, crc, fetched frame or None) of every chunk of the range, in order."""
+        chunk = self.chunk_seconds(step_sec)
+        now = time.time()
+        # Nothing exists past the current bar; don't scan empty future chunks
+        end_sec = min(end_sec, int(now) + step_sec)
+        if end_sec <= start_sec:
+            return
+        first = (start_sec // chunk) * chunk
+        bounds = list(range(first, end_sec, chunk))
+
+        pending = []  # consecutive missing chunk starts
+        for lo in bounds:
+            key = f"{key_prefix}|{lo}"
+            closed = lo + chunk <= now - self.grace_sec
+            entry = self._get(key, None if closed else self.open_ttl)
+            if entry is None:
+                self.misses += 1
+                pending.append(lo)
+                if len(pending) >= self.fill_chunks:
+                    yield from self._fill(key_prefix, pending, chunk, now, fetch)
+                    pending = []
+                continue
+            self.hits += 1
+            if pending:
+                yield from self._fill(key_prefix, pending, chunk, now, fetch)
+                pending = []
+            yield lo, entry[0], entry[1], None
+        if pending:
+            yield from self._fill(key_prefix, pending, chunk, now, fetch)
+
+    def last_row(self, key_prefix, start_sec, end_sec, step_sec, fetch, field):
+        """
+        (time_sec, value) of the newest row in [start_sec, end_sec) with a `field` value, read
+        through the cache from the last `fill_chunks` chunks of the range (missing ones are
+        filled and cached for the request that follows). None when those chunks hold no such row.
+        """
+        chunk = self.chunk_seconds(step_sec)
+        end_sec = min(end_sec, int(time.time()) + step_sec)
+        if end_sec <= start_sec:
+            return None
+        lo = max(start_sec, ((end_sec - 1) // chunk - self.fill_chunks + 1) * chunk)
+        segments = list(self.iter_segments(key_prefix, lo, end_sec, step_sec, fetch))
+        for kind, body in reversed(segments):
+            rows = json.loads("[" + body + "]") if kind == "json" else body
+            for row in reversed(rows):
+                if row.get(field) is not None:
+                    return row["time_sec"], row[field]
+        return None
+
+    def _fill(self, key_prefix, starts, chunk, now, fetch):
+        lo, hi = starts[0], starts[-1] + chunk
+        self.queries += 1
+        frame = fetch(lo, hi)
+        ts = frame["time_sec"].to_numpy(dtype=np.int64)
+        for s in starts:
+            a, b = np.searchsorted(ts, [s, s + chunk])
+            part = frame.iloc[a:b]
+            text = frame_to_json_rows(part)
+            closed = s + chunk <= now - self.grace_sec
+            if not closed:
+                self.open_refreshes += 1
+            # An empty closed chunk may just not be backfilled yet: don't pin it
+            crc = self._set(f"{key_prefix}|{s}", text, None if closed and len(part) else self.open_ttl)
+            yield s, text, crc, part
+
+    @staticmethod
+    def _segment(text, lo, chunk, start_sec, end_sec, frame=None):
+        if lo >= start_sec and lo + chunk <= end_sec:
+            return "json", text[1:-1]
+        if frame is not None:
+            # Freshly fetched edge chunk: trim the frame and encode just that slice
+            ts = frame["time_sec"].to_numpy(dtype=np.int64)
+            a, b = np.searchsorted(ts, [start_sec, end_sec])
+            return "json", frame_to_json_rows(frame.iloc[a:b])[1:-1]
+        return "rows", [r for r in json.loads(text) if start_sec <= r["time_sec"] < end_sec]
+
+    @staticmethod
+    def _decode(value):
+        """(JSON text, crc) of a stored value: b"<crc hex>\n<JSON array>"."""
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        head, sep, body = value.partition(b"\n")
+        if not sep:
+            # Written before values carried their CRC
+            return value.decode("utf-8"), zlib.crc32(value)
+        return body.decode("utf-8"), int(head, 16)
+
+    def _get(self, key, ttl):
+        """(JSON text, crc) of a cached chunk, or None."""
+        value = self.local.get(key)
+        if value is not None:
+            return self._decode(value)
+        if self.shared is None:
+            return None
+        try:
+            value = self.shared.get(key)
+        except Exception:
+            return None
+        if value is None:
+            return None
+        self.shared_hits += 1
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        text, crc = self._decode(value)
+        self.local.set(key, value, ttl=ttl if text != "[]" else self.open_ttl)
+        return text, crc
+
+    def _set(self, key, text, ttl):
+        """Cache a chunk's JSON text; returns its crc."""
+        body = text.encode("utf-8")
+        crc = zlib.crc32(body)
+        value = b"%08x\n" % crc + body
+        self.local.set(key, value, ttl=ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, ttl=ttl)
+            except Exception:
+                pass
+        return crc
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "queries": self.queries,
+            "open_refreshes": self.open_refreshes,
+            "entries": len(self.local),
+            "bytes": self.local.bytes,
+            "evictions": self.local.evictions,
+            "shared": self.shared is not None,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_range_cache():
+    """Process-wide RangeCache configured from settings, or None when disabled."""
+    global _cache
+    if not settings.HISTORY_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                shared = RedisBackend.from_url(settings.HISTORY_CACHE_REDIS_URL) \
+                    if settings.HISTORY_CACHE_REDIS_URL else None
+                _cache = RangeCache(
+                    LRUBytesCache(settings.HISTORY_CACHE_MAX_MB * 1024 * 1024),
+                    shared=shared,
+                    chunk_rows=settings.HISTORY_CACHE_CHUNK_ROWS,
+                    grace_sec=settings.HISTORY_CACHE_GRACE_SEC,
+                    open_ttl=settings.HISTORY_CACHE_OPEN_TTL_SEC,
+                    fill_chunks=settings.HISTORY_CACHE_FILL_CHUNKS,
+                )
+    return _cache
@@ -0,0 +1,359 @@
+# services/common/rollup.py
+# Coarser bar measurements (aggs_5m/15m/1h/4h) rolled up from the minute bars.
+#
+# The minute bars are aggs_1m (backfilled from Polygon REST) merged with aggs_stream (the
+# streamer's live bars); where both have a minute, aggs_1m wins. Closed buckets have a single
+# writer:
+#   - catch_up(): re-reads the merged minutes from a per-symbol watermark and writes every bucket
+#     that has closed since, advancing the watermark chunk by chunk, also over chunks that had no
+#     bars (scripts/rollup.py and the streamer's loop); a backfill moves the watermarks back with
+#     rewind_watermarks() so the newly loaded range is rolled up again.
+# StreamRollup only writes the bucket that is still open (re-emitted on every live 1m bar), so
+# recent ranges are served before catch_up() gets to them; once the bucket has closed,
+# catch_up() overwrites it with the merged result and the stream never writes it again.
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from config.settings import settings
+from services.common.influx import query_flux, query_frames, get_shared_client, write_points_batch
+from services.common.columnar import clean_history_frame
+from services.common.line_protocol import encode_columns, encode_row, series_key
+
+logger = logging.getLogger("rollup")
+
+# Minute measurements rolled up, by precedence; watermarks are tagged with the first
+ROLLUP_SOURCES = ("aggs_1m", "aggs_stream")
+ROLLUP_SOURCE = ROLLUP_SOURCES[0]
+# (measurement, bucket seconds), finest first; every step divides the next
+ROLLUPS = (("aggs_5m", 300), ("aggs_15m", 900), ("aggs_1h", 3600), ("aggs_4h", 14400))
+WATERMARK_MEASUREMENT = "rollup_watermark"
+_NS = 1_000_000_000
+
+
+def aggregate_ohlcv(time_sec, o, h, l, c, v, vw, n, step_sec):
+    """
+    Bucket time-sorted bars into `step_sec` buckets labelled by their start:
+    o=first, h=max, l=min, c=last, v/n=sum, vw=volume-weighted mean (0.0 when v is 0).
+    Returns a dict of arrays (time_sec, o, h, l, c, v, vw, n).
+    """
+    time_sec = np.asarray(time_sec, dtype=np.int64)
+    if len(time_sec) == 0:
+        return {k: np.empty(0) for k in ("time_sec", "o", "h", "l", "c", "v", "vw", "n")}
+    bucket = time_sec - time_sec % step_sec
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+    ends = np.concatenate((starts[1:], [len(bucket)])) - 1
+    v = np.asarray(v, dtype=np.float64)
+    vol = np.add.reduceat(v, starts)
+    pv = np.add.reduceat(np.asarray(vw, dtype=np.float64) * v, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        vwap = np.where(vol > 0, pv / vol, 0.0)
+    return {
+        "time_sec": bucket[starts],
+        "o": np.asarray(o, dtype=np.float64)[starts],
+        "h": np.maximum.reduceat(np.asarray(h, dtype=np.float64), starts),
+        "l": np.minimum.reduceat(np.asarray(l, dtype=np.float64), starts),
+        "c": np.asarray(c, dtype=np.float64)[ends],
+        "v": vol.astype(np.int64),
+        "vw": vwap,
+        "n": np.add.reduceat(np.asarray(n, dtype=np.int64), starts),
+    }
+
+
+def encode_rollup(measurement, symbol, agg):
+    columns = {f: agg[f] for f in ("o", "h", "l", "c", "v", "vw", "n")}
+    return encode_columns(measurement, {"symbol": symbol}, agg["time_sec"] * _NS, columns, int_fields=("v", "n"))
+
+
+def _flux_time(sec):
+    return datetime.fromtimestamp(sec, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def read_watermarks(symbol, source=ROLLUP_SOURCE):
+    """{rollup measurement: epoch seconds up to which it is complete} for `symbol`."""
+    rows = query_flux(f'''
+from(bucket: "{settings.INFLUX_BUCKET}")
+  |> range(start: 0)
+  |> filter(fn: (r) => r._measurement == "{WATERMARK_MEASUREMENT}")
+  |> filter(fn: (r) => r.symbol == "{symbol}" and r.source == "{source}")
+  |> last()
+''')
+    return {r["_field"]: int(r["_value"]) // _NS for r in rows if r.get("_value") is not None}
+
+
+def _watermark_lines(symbol, source, marks):
+    line = encode_row(WATERMARK_MEASUREMENT, {"symbol": symbol, "source": source},
+                      {m: int(sec) * _NS for m, sec in marks.items()}, time.time_ns())
+    return [line] if line else []
+
+
+def first_bar_sec(symbol, source):
+    """Epoch seconds of the first `source` bar of `symbol`, or None when there is none."""
+    rows = query_flux(f'''
+from(bucket: "{settings.INFLUX_BUCKET}")
+  |> range(start: 0)
+  |> filter(fn: (r) => r._measurement == "{source}")
+  |> filter(fn: (r) => r.symbol == "{symbol}")
+  |> filter(fn: (r) => r._field == "c")
+  |> first()
+''')
+    if not rows or rows[0].get("_time") is None:
+        return None
+    return int(rows[0]["_time"].timestamp())
+
+
+def source_frame(symbol, source, lo, hi, adjusted=None):
+    """
+    Cleaned `source` bars of `symbol` in [lo, hi) (see clean_history_frame), or None if empty.
+    With `adjusted` only the Polygon bars with that `adjusted` tag are read.
+    """
+    tag = "" if adjusted is None else f' and r.adjusted == "{str(adjusted).lower()}"'
+    flux = f'''
+from(bucket: "{settings.INFLUX_BUCKET}")
+  |> range(start: time(v: "{_flux_time(lo)}"), stop: time(v: "{_flux_time(hi)}"))
+  |> filter(fn: (r) => r._measurement == "{source}")
+  |> filter(fn: (r) => r.symbol == "{symbol}"{tag})
+  |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+  |> keep(columns: ["_time","o","h","l","c","v","vw","n"])
+  |> group()
+  |> sort(columns: ["_time"], desc: false)
+'''
+    frames = [clean_history_frame(df) for df in query_frames(flux)]
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return None
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def _sources(source):
+    return ROLLUP_SOURCES if source == ROLLUP_SOURCE else (source,)
+
+
+def minute_frame(symbol, source, lo, hi):
+    """
+    Cleaned minute bars of `symbol` in [lo, hi) that `source` rolls up: for ROLLUP_SOURCE the
+    merge of ROLLUP_SOURCES (the first source wins per minute), otherwise `source` alone.
+    None when there are none.
+    """
+    frames = [f for f in (source_frame(symbol, s, lo, hi) for s in _sources(source)) if f is not None]
+    if len(frames) <= 1:
+        return frames[0] if frames else None
+    merged = pd.concat(frames, ignore_index=True).drop_duplicates("time_sec", keep="first")
+    return merged.sort_values("time_sec", kind="stable").reset_index(drop=True)
+
+
+def _first_minute_sec(symbol, source):
+    firsts = [t for t in (first_bar_sec(symbol, s) for s in _sources(source)) if t is not None]
+    return min(firsts) if firsts else None
+
+
+def _roll_ranges(symbol, source, ranges, chunk_sec, write, on_chunk=None):
+    """
+    Write rollup buckets for {measurement: (lo_sec, hi_sec)}, reading the minute bars (see
+    minute_frame) in chunks aligned to the coarsest step so no bucket spans two reads.
+    Returns lines written. `on_chunk(hi_sec)` runs once each chunk's lines are written, with
+    the end of the chunk (used to advance watermarks).
+    """
+    coarsest = ROLLUPS[-1][1]
+    lo = min(a for a, _ in ranges.values())
+    hi = max(b for _, b in ranges.values())
+    lo -= lo % coarsest
+    chunk_sec = max(coarsest, chunk_sec - chunk_sec % coarsest)
+    written = 0
+    for c_lo in range(lo, hi, chunk_sec):
+        c_hi = min(c_lo + chunk_sec, hi)
+        frame = minute_frame(symbol, source, c_lo, c_hi)
+        lines = []
+        if frame is not None:
+            ts = frame["time_sec"].to_numpy(dtype=np.int64)
+            for measurement, step in ROLLUPS:
+                if measurement not in ranges:
+                    continue
+                a, b = ranges[measurement]
+                i, j = np.searchsorted(ts, [max(a, c_lo), min(b, c_hi)])
+                if i >= j:
+                    continue
+                part = frame.iloc[i:j]
+                agg = aggregate_ohlcv(ts[i:j], part["o"], part["h"], part["l"], part["c"],
+                                      part["v"], part["vw"], part["n"], step)
+                lines.extend(encode_rollup(measurement, symbol, agg))
+        for k in range(0, len(lines), settings.INFLUX_WRITE_BATCH_SIZE):
+            write(lines[k:k + settings.INFLUX_WRITE_BATCH_SIZE])
+        written += len(lines)
+        if on_chunk is not None:
+            on_chunk(c_hi)
+    return written
+
+
+def catch_up(symbol, source=ROLLUP_SOURCE, now=None, write=write_points_batch):
+    """
+    Roll up every bucket of `symbol` that closed (ROLLUP_GRACE_SEC ago) since its watermark,
+    starting from the first minute bar when there is no watermark yet. Returns lines written.
+
+    Watermarks advance to the end of every chunk read, whether or not it held bars: its range
+    closed ROLLUP_GRACE_SEC ago, so both sources are complete there, and bars a backfill adds
+    later are picked up again through rewind_watermarks().
+    """
+    now = int(now if now is not None else time.time()) - settings.ROLLUP_GRACE_SEC
+    marks = read_watermarks(symbol, source)
+    first = None
+    ranges = {}
+    for measurement, step in ROLLUPS:
+        end = now - now % step
+        start = marks.get(measurement)
+        if start is None:
+            first = first if first is not None else _first_minute_sec(symbol, source)
+            if first is None:
+                return 0
+            start = first - first % step
+        if start < end:
+            ranges[measurement] = (start, end)
+    if not ranges:
+        return 0
+
+    def advance(hi_sec):
+        # Chunk ends are multiples of the coarsest step (or the end of the ranges)
+        done = {m: min(b, hi_sec) for m, (a, b) in ranges.items() if min(b, hi_sec) > a}
+        if done:
+            write(_watermark_lines(symbol, source, done))
+
+    written = _roll_ranges(symbol, source, ranges, settings.ROLLUP_CHUNK_DAYS * 86400, write, on_chunk=advance)
+    logger.info("Rollup catch-up %s: %d bucket lines", symbol, written)
+    return written
+
+
+def rewind_watermarks(symbol, start_sec, source=ROLLUP_SOURCE, write=write_points_batch):
+    """
+    Move the watermarks of `symbol` back to the bucket holding `start_sec` (e.g. after a backfill
+    of the source from there), so the next catch_up() rolls that range up again.
+    Returns {measurement: new watermark} for the ones that moved.
+    """
+    marks = read_watermarks(symbol, source)
+    moved = {}
+    for measurement, step in ROLLUPS:
+        mark = marks.get(measurement)
+        if mark is not None and mark > start_sec - start_sec % step:
+            moved[measurement] = start_sec - start_sec % step
+    if moved:
+        write(_watermark_lines(symbol, source, moved))
+    return moved
+
+
+def rebuild(symbol, start_sec, end_sec, source=ROLLUP_SOURCE, write=write_points_batch):
+    """
+    Recompute every rollup of `symbol` over [start_sec, end_sec) (widened to whole 4h buckets):
+    existing rollup points in the range are deleted first. Watermarks are left as they are.
+    """
+    coarsest = ROLLUPS[-1][1]
+    lo = start_sec - start_sec % coarsest
+    hi = end_sec + (-end_sec % coarsest)
+    client, org, bucket = get_shared_client()
+    delete_api = client.delete_api()
+    for measurement, _ in ROLLUPS:
+        delete_api.delete(
+            datetime.fromtimestamp(lo, tz=timezone.utc), datetime.fromtimestamp(hi, tz=timezone.utc),
+            f'_measurement="{measurement}" AND symbol="{symbol}"', bucket=bucket, org=org,
+        )
+    ranges = {m: (lo, hi) for m, _ in ROLLUPS}
+    return _roll_ranges(symbol, source, ranges, settings.ROLLUP_CHUNK_DAYS * 86400, write)
+
+
+class StreamRollup:
+    """
+    Streamer-side rollups: keeps the minute bars of the open bucket per (symbol, rollup) and
+    returns fresh lines for the open buckets a new/updated 1m bar touches. Closed buckets are
+    never written here (catch_up() owns them), and neither is the first bucket seen for a
+    series, which is incomplete because the stream started mid-bucket.
+    """
+
+    def __init__(self, rollups=ROLLUPS):
+        self.rollups = rollups
+        self._open = {}   # (symbol, measurement) -> [bucket_start_ns, {ts_ns: bar tuple}, complete]
+        self._keys = {}   # (symbol, measurement) -> series key
+
+    def update(self, bar):
+        sym = bar["symbol"]
+        ts = int(bar["timestamp"])
+        row = (float(bar["open"]), float(bar["high"]), float(bar["low"]), float(bar["close"]),
+               int(bar.get("volume", 0) or 0), float(bar.get("vwap", 0.0) or 0.0), int(bar.get("transactions", 0) or 0))
+        lines = []
+        for measurement, step in self.rollups:
+            start = ts - ts % (step * _NS)
+            slot = (sym, measurement)
+            state = self._open.get(slot)
+            if state is None:
+                state = self._open[slot] = [start, {}, False]
+            elif start > state[0]:
+                state[:] = [start, {}, True]
+            elif start < state[0]:
+                continue  # late bar for an already closed bucket; catch_up() owns those
+            state[1][ts] = row
+            if state[2]:
+                lines.append(self._encode(slot, state))
+        return lines
+
+    def _encode(self, slot, state):
+        bars = [state[1][t] for t in sorted(state[1])]
+        volume = sum(b[4] for b in bars)
+        pv = sum(b[5] * b[4] for b in bars)
+        key = self._keys.get(slot)
+        if key is None:
+            key = self._keys[slot] = series_key(slot[1], {"symbol": slot[0]})
+        fields = {
+            "o": bars[0][0],
+            "h": max(b[1] for b in bars),
+            "l": min(b[2] for b in bars),
+            "c": bars[-1][3],
+            "v": volume,
+            "vw": pv / volume if volume > 0 else 0.0,
+            "n": sum(b[6] for b in bars),
+        }
+        return encode_row(slot[1], None, fields, state[0], key=key)
+
+
+def pick_rollup(window_sec, rollups=ROLLUPS):
+    """Coarsest (measurement, step) whose buckets tile `window_sec` exactly, or None."""
+    best = None
+    for measurement, step in rollups:
+        if step <= window_sec and window_sec % step == 0:
+            best = (measurement, step)
+    return best
+
+
+class WatermarkCache:
+    """Per-process cache of rollup watermarks so API requests don't query them every time."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = {}  # symbol -> (expires, marks)
+
+    def get(self, symbol):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(symbol)
+            if item is not None and item[0] > now:
+                return item[1]
+        marks = read_watermarks(symbol)
+        with self._lock:
+            self._data[symbol] = (now + self.ttl, marks)
+        return marks
+
+
+_watermarks = WatermarkCache(ttl=30.0)
+
+
+def rollup_covers(symbol, measurement, step, end_sec, now=None):
+    """
+    True when `measurement` is complete for `symbol` up to `end_sec` (or up to now), allowing
+    ROLLUP_MAX_LAG_SEC plus one bucket of lag, which the streamer's open-bucket writes cover.
+    """
+    mark = _watermarks.get(symbol).get(measurement)
+    if mark is None:
+        return False
+    now = now if now is not None else time.time()
+    return mark >= min(end_sec, now) - step - settings.ROLLUP_MAX_LAG_SEC
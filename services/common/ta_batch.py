@@ -0,0 +1,418 @@
+# services/common/ta_batch.py
+# BBANDS/MACD/RSI for many symbols per run (see scripts/compute_indicators.py).
+#
+# Symbols are handled in groups: one Flux query fetches the closes of up to `group_size`
+# symbols (closed months come from the local bar store), the per-symbol computations (the
+# services/common/indicators.py kernels) run in a process pool and a single writer thread
+# coalesces every symbol's points into large Influx writes. Fetching the next group overlaps
+# with computing and writing the previous ones.
+#
+# With `incremental`, symbols that have a saved IndicatorState (services/common/ta_state.py)
+# only fetch their warm-up lookback plus the bars after it; the others are computed in full.
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from config.settings import settings
+from services.common.influx import flux_any, iter_flux_frames, write_points_batch
+from services.common.columnar import INDICATOR_FIELDS, clean_close_frame, close_frame
+from services.common.bar_store import get_bar_store
+from services.common.indicators import ta_columns, ta_grid
+from services.common.line_protocol import encode_frame
+from services.common.ta_state import IndicatorState, read_states, state_line
+
+logger = logging.getLogger("ta_batch")
+
+STEP_SEC = {"day": 86400, "minute": 60}
+# Doublings of the lookback span tried before giving up on finding a state's warm-up closes
+LOOKBACK_ATTEMPTS = 12
+
+
+def ta_measurement(granularity):
+    return "ta_1d" if granularity == "day" else "ta_1m"
+
+
+def bars_measurement(granularity):
+    return "aggs_1d" if granularity == "day" else "aggs_1m"
+
+
+def epoch_sec(value):
+    return int(pd.Timestamp(value).timestamp())
+
+
+def epoch_iso(sec):
+    return pd.Timestamp(sec, unit="s", tz="UTC").strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def closed_bar_end(granularity, now=None):
+    """Start (epoch seconds) of the bar still forming at `now`; runs without --end stop before it."""
+    step = STEP_SEC[granularity]
+    now = int(time.time()) if now is None else int(now)
+    return now - now % step
+
+
+def _influx_closes(measurement, symbols, lo, hi):
+    flux = f'''
+from(bucket: "{settings.INFLUX_BUCKET}")
+  |> range(start: time(v: "{epoch_iso(lo)}"), stop: time(v: "{epoch_iso(hi)}"))
+  |> filter(fn: (r) => r._measurement == "{measurement}")
+  |> filter(fn: (r) => {flux_any("symbol", symbols)})
+  |> filter(fn: (r) => r._field == "c")
+  |> keep(columns: ["_time", "symbol", "_value"])
+'''
+    frames = list(iter_flux_frames(flux))
+    if not frames:
+        return {}
+    raw = pd.concat(frames, ignore_index=True).rename(columns={"_value": "c"})
+    # One table per symbol, already time-ordered; clean_close_frame only sorts when it isn't
+    return {sym: clean_close_frame(part, "c") for sym, part in raw.groupby("symbol", sort=False)}
+
+
+def fetch_closes(measurement, ranges, group_size=50, store=None):
+    """
+    Close series per symbol for `ranges` ({symbol: (lo_sec, hi_sec)}) as clean_close_frame
+    frames. Months inside a symbol's bar-store watermark are read from disk; the rest comes
+    from Influx, with symbols that need the same range sharing queries of up to `group_size`.
+    """
+    parts = {sym: [] for sym in ranges}
+    requests = {}
+    for sym, (lo, hi) in ranges.items():
+        mark = store.watermark(measurement, sym) if store is not None else None
+        if mark is None or mark[1] <= lo or mark[0] >= hi:
+            requests.setdefault((lo, hi), []).append(sym)
+            continue
+        a, b = max(lo, mark[0]), min(hi, mark[1])
+        bars = store.read(measurement, sym, a, b, columns=["c"])
+        parts[sym].append(close_frame(bars["time_sec"].to_numpy() * 1_000_000_000, bars["c"].to_numpy(), "c"))
+        if lo < a:
+            requests.setdefault((lo, a), []).append(sym)
+        if b < hi:
+            requests.setdefault((b, hi), []).append(sym)
+    for (lo, hi), syms in requests.items():
+        for i in range(0, len(syms), max(1, group_size)):
+            for sym, frame in _influx_closes(measurement, syms[i:i + group_size], lo, hi).items():
+                parts[sym].append(frame)
+
+    out = {}
+    for sym, frames in parts.items():
+        frames = sorted((f for f in frames if len(f)), key=lambda f: f.index[0])
+        out[sym] = pd.concat(frames) if frames else clean_close_frame(None, "c")
+    return out
+
+
+def indicator_frame(df, params):
+    """BBANDS/MACD/RSI (INDICATOR_FIELDS columns) of df["c"], indexed like df."""
+    cols = ta_grid(params).compute(df["c"].to_numpy())
+    names = ta_columns(params)
+    return pd.DataFrame({f: cols[names[f]] for f in INDICATOR_FIELDS}, index=df.index)
+
+
+def compute_symbol(job):
+    """
+    Pool task: (symbol, granularity, params, ns, close, state, split) -> line-protocol lines
+    and timing. Without a state every close is used (full recompute); with one, close[:split]
+    is the warm-up lookback ending at the state's bar and close[split:] the new bars.
+    """
+    symbol, granularity, params, ns, close, state, split = job
+    t0 = time.monotonic()
+    if state is None:
+        df = close_frame(ns, close, "c")
+        indicators = indicator_frame(df, params)
+        state = IndicatorState.from_closes(close, ns[-1], params)
+    else:
+        cols = state.advance(close[split:], ns[-1], close[:split], params)
+        index = close_frame(ns[split:], close[split:], "c").index
+        indicators = pd.DataFrame(cols, index=index)[INDICATOR_FIELDS]
+    measurement = ta_measurement(granularity)
+    # Vectorized line-protocol encoding: NaN fields are omitted per row and
+    # rows that are all NaN (warm-up period) are skipped
+    lines = encode_frame(measurement, {"symbol": symbol, "source": "ta"}, indicators, fields=INDICATOR_FIELDS)
+    points = len(lines)
+    if state is not None:
+        # Last line of the symbol, so it is only written once the points before it are
+        lines.append(state_line(symbol, measurement, params, state))
+    return {"symbol": symbol, "lines": lines, "points": points, "compute_sec": time.monotonic() - t0}
+
+
+def state_split(df, state, need):
+    """Index just past the state's bar in df when it is there with `need` closes up to it, else None."""
+    ns = df.index.asi8
+    split = int(np.searchsorted(ns, state.time_ns, side="right"))
+    if split < max(need, 1) or ns[split - 1] != state.time_ns:
+        return None
+    return split
+
+
+def same_close(value, expected):
+    return bool(np.isclose(value, expected, rtol=1e-12, atol=0.0))
+
+
+class SymbolResult:
+    """Per-symbol outcome of a batch run."""
+
+    __slots__ = ("symbol", "mode", "bars", "points", "fetch_sec", "compute_sec", "write_sec", "error")
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.mode = "-"
+        self.bars = 0
+        self.points = 0
+        self.fetch_sec = 0.0
+        self.compute_sec = 0.0
+        self.write_sec = 0.0
+        self.error = None
+
+    def line(self):
+        status = f"FAILED: {self.error}" if self.error else "ok"
+        return (f"{self.symbol}: {self.mode}, {self.bars} bars, {self.points} points, fetch {self.fetch_sec:.2f}s, "
+                f"compute {self.compute_sec:.2f}s, write {self.write_sec:.2f}s - {status}")
+
+
+class IndicatorBatch:
+    """
+    Indicator job over many symbols for one granularity and parameter set. `processes` <= 1
+    computes in the calling process; `write` receives lists of at most `batch_size` lines.
+    """
+
+    def __init__(self, granularity, params, processes=0, group_size=50, batch_size=5000,
+                 store=None, write=write_points_batch):
+        self.granularity = granularity
+        self.params = params
+        self.processes = processes or os.cpu_count() or 1
+        self.group_size = max(1, group_size)
+        self.batch_size = max(1, batch_size)
+        self.store = store
+        self.write = write
+        self.measurement = bars_measurement(granularity)
+        self._lines = queue.Queue(maxsize=max(4, 2 * self.processes))
+        self._lock = threading.Lock()
+        self.results = {}
+        self.written = 0
+        self.started = None
+
+    # --- planning / fetching ---------------------------------------------------------------
+
+    def _lookback_span(self):
+        return max(self.params.bb_length - 1, 1) * STEP_SEC[self.granularity] * 2
+
+    def _since_state(self, symbol, state, end_sec):
+        """Lookback + new closes of one symbol, widening the lookback until it is found."""
+        need = self.params.bb_length - 1
+        state_sec = state.time_ns // 1_000_000_000
+        span = self._lookback_span()
+        for _ in range(LOOKBACK_ATTEMPTS):
+            span *= 2
+            df = fetch_closes(self.measurement, {symbol: (state_sec - span, end_sec)}, store=self.store)[symbol]
+            split = state_split(df, state, need)
+            if split is not None:
+                return df, split
+        return None, None
+
+    def _plan_group(self, symbols, states, start_sec, end_sec):
+        """Fetch one group of symbols; returns the pool jobs for the ones with work to do."""
+        span = self._lookback_span()
+        ranges = {}
+        for sym in symbols:
+            state = states.get(sym)
+            if state is not None:
+                # Rounded down so symbols with nearby states share one query range
+                lo = (state.time_ns // 1_000_000_000 - span) // span * span
+                ranges[sym] = (lo, end_sec)
+            elif start_sec is not None:
+                ranges[sym] = (start_sec, end_sec)
+            else:
+                self.results[sym].error = "no saved state; --start is required for a full recompute"
+        t0 = time.monotonic()
+        closes = fetch_closes(self.measurement, ranges, self.group_size, self.store) if ranges else {}
+        share = (time.monotonic() - t0) / max(1, len(ranges))
+
+        jobs = []
+        for sym in ranges:
+            res = self.results[sym]
+            res.fetch_sec += share
+            df, state, split = closes[sym], states.get(sym), None
+            if state is not None:
+                split = state_split(df, state, self.params.bb_length - 1)
+                if split is None:
+                    t1 = time.monotonic()
+                    df, split = self._since_state(sym, state, end_sec)
+                    res.fetch_sec += time.monotonic() - t1
+                if split is None or not same_close(df["c"].iloc[split - 1], state.last_close):
+                    # The state's bar is gone or was rewritten: start over from --start
+                    if start_sec is None:
+                        res.error = "saved state no longer matches the bars; --start is required to recompute"
+                        continue
+                    t1 = time.monotonic()
+                    df, state = fetch_closes(self.measurement, {sym: (start_sec, end_sec)}, store=self.store)[sym], None
+                    res.fetch_sec += time.monotonic() - t1
+                    res.mode = "full (state outdated)"
+                else:
+                    res.mode = "incremental"
+            else:
+                res.mode = "full"
+            res.bars = len(df) - (split or 0) if state is not None else len(df)
+            if res.bars == 0:
+                res.mode = "up to date" if state is not None else "no data"
+                continue
+            jobs.append((sym, self.granularity, self.params, df.index.asi8, df["c"].to_numpy(), state, split))
+        return jobs
+
+    # --- computing / writing ---------------------------------------------------------------
+
+    def _collect(self, symbol, run):
+        res = self.results[symbol]
+        try:
+            out = run()
+        except Exception as e:
+            logger.warning("Indicators for %s failed: %s", symbol, e)
+            res.error = f"compute: {e}"
+            return
+        res.compute_sec += out["compute_sec"]
+        res.points = out["points"]
+        if out["lines"]:
+            self._lines.put((symbol, out["lines"]))
+
+    def _flush(self, buffered):
+        total = sum(len(lines) for _, lines in buffered)
+        t0 = time.monotonic()
+        flat = [line for _, lines in buffered for line in lines]
+        error, failed_at = None, len(flat)
+        for i in range(0, len(flat), self.batch_size):
+            try:
+                self.write(flat[i:i + self.batch_size])
+            except Exception as e:
+                # Stop here: the remaining chunks hold the state points of these symbols
+                logger.warning("Indicator write of %d points failed: %s", len(flat[i:i + self.batch_size]), e)
+                error, failed_at = f"write: {e}", i
+                break
+            with self._lock:
+                self.written += len(flat[i:i + self.batch_size])
+        elapsed = time.monotonic() - t0
+        end = 0
+        for symbol, lines in buffered:
+            res = self.results[symbol]
+            res.write_sec += elapsed * len(lines) / total
+            end += len(lines)
+            # Symbols whose lines all landed in chunks before the failing one were written
+            if end > failed_at:
+                res.error = error
+
+    def _write_loop(self):
+        buffered, count, done = [], 0, False
+        while not done:
+            item = self._lines.get()
+            while True:
+                if item is None:
+                    done = True
+                    break
+                buffered.append(item)
+                count += len(item[1])
+                if count >= self.batch_size:
+                    break
+                try:
+                    item = self._lines.get_nowait()
+                except queue.Empty:
+                    break
+            if buffered:
+                self._flush(buffered)
+                buffered, count = [], 0
+
+    def progress(self):
+        """One line describing overall progress."""
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        done = sum(1 for r in self.results.values() if r.mode != "-" or r.error)
+        failed = sum(1 for r in self.results.values() if r.error)
+        return [f"{done}/{len(self.results)} symbols planned, {self.written} points written "
+                f"({self.written / elapsed if elapsed else 0:,.0f}/s), {failed} failures"]
+
+    def run(self, symbols, start_sec=None, end_sec=None, incremental=False, progress=None, progress_sec=10.0):
+        """
+        Compute and write indicators for `symbols` over [start_sec, end_sec) (end defaults to
+        the current bar's start). With `incremental`, symbols with a saved state continue from
+        it and `start_sec` is only needed for the others. Returns a summary dict whose
+        "results" are the SymbolResult of every symbol, in input order.
+        """
+        end_sec = closed_bar_end(self.granularity) if end_sec is None else end_sec
+        self.results = {sym: SymbolResult(sym) for sym in symbols}
+        self.written = 0
+        self.started = time.monotonic()
+        states = read_states(list(symbols), ta_measurement(self.granularity), self.params) if incremental else {}
+
+        writer = threading.Thread(target=self._write_loop, name="ta-batch-write", daemon=True)
+        # spawn, not fork: the writer thread (and Influx client) must not be copied into workers
+        pool = (ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+                if self.processes > 1 else None)
+        writer.start()
+        pending = {}
+        deadline = time.monotonic() + progress_sec
+
+        def drain(limit):
+            nonlocal deadline
+            while len(pending) > limit:
+                done, _ = wait(list(pending), timeout=progress_sec, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    self._collect(pending.pop(fut), fut.result)
+                if progress is not None and time.monotonic() >= deadline:
+                    progress(self.progress())
+                    deadline = time.monotonic() + progress_sec
+
+        try:
+            for i in range(0, len(symbols), self.group_size):
+                group = symbols[i:i + self.group_size]
+                try:
+                    jobs = self._plan_group(group, states, start_sec, end_sec)
+                except Exception as e:
+                    logger.warning("Fetching closes for %d symbols failed: %s", len(group), e)
+                    for sym in group:
+                        self.results[sym].error = self.results[sym].error or f"fetch: {e}"
+                    continue
+                for job in jobs:
+                    if pool is None:
+                        self._collect(job[0], lambda job=job: compute_symbol(job))
+                    else:
+                        pending[pool.submit(compute_symbol, job)] = job[0]
+                # Bound the closes held in flight to a couple of groups
+                drain(2 * max(self.processes, self.group_size))
+            drain(0)
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True)
+            self._lines.put(None)
+            writer.join()
+        if progress is not None:
+            progress(self.progress())
+
+        results = [self.results[sym] for sym in symbols]
+        elapsed = time.monotonic() - self.started
+        return {
+            "symbols": len(results),
+            "failed": sum(1 for r in results if r.error),
+            "bars": sum(r.bars for r in results),
+            "written": self.written,
+            "elapsed_sec": round(elapsed, 1),
+            "points_per_sec": round(self.written / elapsed, 1) if elapsed else 0.0,
+            "fetch_sec": round(sum(r.fetch_sec for r in results), 2),
+            "compute_sec": round(sum(r.compute_sec for r in results), 2),
+            "write_sec": round(sum(r.write_sec for r in results), 2),
+            "results": results,
+            "failures": [(r.symbol, r.error) for r in results if r.error],
+        }
+
+
+def default_batch(granularity, params, **overrides):
+    """IndicatorBatch with the INDICATOR_*/INFLUX_WRITE_BATCH_SIZE settings and the configured bar store."""
+    opts = {
+        "processes": settings.INDICATOR_PROCESSES,
+        "group_size": settings.INDICATOR_GROUP_SIZE,
+        "batch_size": settings.INFLUX_WRITE_BATCH_SIZE,
+        "store": get_bar_store(),
+    }
+    opts.update({k: v for k, v in overrides.items() if v is not None})
+    return IndicatorBatch(granularity, params, **opts)
@@ -0,0 +1,170 @@
+# services/common/ta_state.py
+# Carry-forward state for the BBANDS/MACD/RSI indicators written to ta_1m/ta_1d, so a run can
+# continue from the last computed bar instead of recomputing the whole close series.
+#
+# The recursions are the step-by-step form of the kernels in services/common/indicators.py
+# (pandas_ta 0.3.14b0 defaults), so continuing from a state gives the same values as a full
+# recompute over the original range:
+#   - ema(length): seeded with the mean of the first `length` values, then smoothed with
+#     alpha = 2 / (length + 1) (adjust=False); MACD's signal line is that EMA of the MACD line;
+#   - rsi(length): gains/losses averaged by ewm(alpha=1/length, adjust=True), whose running
+#     state is the weighted average plus the accumulated weight;
+#   - bbands(length, std): rolling mean -/+ std * rolling stddev (ddof=0), which only needs the
+#     previous length - 1 closes (the warm-up lookback fetched with the new bars).
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from config.settings import settings
+from services.common.indicators import bbands, ema, rma
+from services.common.influx import flux_any, query_flux
+from services.common.line_protocol import encode_row
+
+STATE_MEASUREMENT = "ta_state"
+_STATE_FIELDS = ("last_close", "ema_fast", "ema_slow", "ema_signal", "gain_avg", "loss_avg", "rsi_weight")
+
+
+class IndicatorParams(namedtuple("IndicatorParams", "bb_length bb_std macd_fast macd_slow macd_signal rsi_length")):
+    __slots__ = ()
+
+    @property
+    def key(self):
+        """Tag value identifying the parameter set a state belongs to."""
+        return (f"bb{self.bb_length}x{self.bb_std:g}_macd{self.macd_fast}-{self.macd_slow}-{self.macd_signal}"
+                f"_rsi{self.rsi_length}")
+
+    @property
+    def warmup(self):
+        """Closes needed before every indicator has produced a value."""
+        return max(self.bb_length, self.macd_slow + self.macd_signal - 1, self.rsi_length + 1)
+
+
+def _rsi_from(gain_avg, loss_avg):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return 100.0 * gain_avg / (gain_avg + np.abs(loss_avg))
+
+
+def _bbands(window_closes, length, std, count):
+    """Lower/mid/upper for the last `count` positions of `window_closes`."""
+    lower, mid, upper = bbands(window_closes, length, std)
+    return lower[len(lower) - count:], mid[len(mid) - count:], upper[len(upper) - count:]
+
+
+class IndicatorState:
+    """
+    Everything needed to extend BBANDS/MACD/RSI past `time_ns` (the last bar folded in) other
+    than the bb_length - 1 lookback closes, which are re-read from the bars themselves.
+    """
+
+    __slots__ = ("time_ns",) + _STATE_FIELDS
+
+    def __init__(self, time_ns, **fields):
+        self.time_ns = int(time_ns)
+        for name in _STATE_FIELDS:
+            setattr(self, name, float(fields[name]))
+
+    @classmethod
+    def from_closes(cls, close, time_ns, params):
+        """
+        State after the whole `close` series (the one a full recompute used), whose last bar
+        is at `time_ns`. None while the series is shorter than the warm-up.
+        """
+        close = np.asarray(close, dtype=np.float64)
+        if len(close) < params.warmup:
+            return None
+        fast = ema(close, params.macd_fast)
+        slow = ema(close, params.macd_slow)
+        signal = ema((fast - slow)[max(params.macd_fast, params.macd_slow) - 1:], params.macd_signal)
+        diff = np.diff(close)
+        gains, losses = np.clip(diff, 0, None), np.clip(diff, None, 0)
+        a = 1.0 / params.rsi_length
+        # Accumulated adjust=True weight after len(diff) observations: sum of (1 - a)^k
+        weight = (1.0 - (1.0 - a) ** len(diff)) / a
+        return cls(
+            time_ns,
+            last_close=close[-1],
+            ema_fast=fast[-1],
+            ema_slow=slow[-1],
+            ema_signal=signal[-1],
+            gain_avg=rma(np.concatenate(([np.nan], gains)), params.rsi_length)[-1],
+            loss_avg=rma(np.concatenate(([np.nan], losses)), params.rsi_length)[-1],
+            rsi_weight=weight,
+        )
+
+    def advance(self, close, time_ns, lookback, params):
+        """
+        Fold in the new closes (after self.time_ns, time-sorted, last bar at `time_ns`) and
+        return their indicator columns (bb_l, bb_m, bb_u, macd, macds, macdh, rsi) as arrays.
+        `lookback` is the bb_length - 1 closes up to and including the state's bar.
+        """
+        close = np.asarray(close, dtype=np.float64)
+        n = len(close)
+        out = {k: np.empty(n) for k in ("macd", "macds", "macdh", "rsi")}
+        af = 2.0 / (params.macd_fast + 1)
+        aslow = 2.0 / (params.macd_slow + 1)
+        asig = 2.0 / (params.macd_signal + 1)
+        decay = 1.0 - 1.0 / params.rsi_length
+        fast, slow, sig = self.ema_fast, self.ema_slow, self.ema_signal
+        gain, loss, weight, last = self.gain_avg, self.loss_avg, self.rsi_weight, self.last_close
+        for i in range(n):
+            x = close[i]
+            fast = af * x + (1 - af) * fast
+            slow = aslow * x + (1 - aslow) * slow
+            macd = fast - slow
+            sig = asig * macd + (1 - asig) * sig
+            d = x - last
+            weight *= decay
+            gain = (weight * gain + max(d, 0.0)) / (weight + 1.0)
+            loss = (weight * loss + min(d, 0.0)) / (weight + 1.0)
+            weight += 1.0
+            last = x
+            out["macd"][i], out["macds"][i], out["macdh"][i] = macd, sig, macd - sig
+            out["rsi"][i] = _rsi_from(gain, loss)
+        if n:
+            self.ema_fast, self.ema_slow, self.ema_signal = fast, slow, sig
+            self.gain_avg, self.loss_avg, self.rsi_weight, self.last_close = gain, loss, weight, last
+            self.time_ns = int(time_ns)
+
+        window = np.concatenate((np.asarray(lookback, dtype=np.float64)[-(params.bb_length - 1):], close))
+        out["bb_l"], out["bb_m"], out["bb_u"] = _bbands(window, params.bb_length, params.bb_std, n)
+        return out
+
+
+def _state_tags(symbol, measurement, params):
+    return {"symbol": symbol, "measurement": measurement, "params": params.key}
+
+
+def state_line(symbol, measurement, params, state):
+    """Line-protocol point persisting `state` (timestamped when written; the bar time is a field)."""
+    fields = {name: getattr(state, name) for name in _STATE_FIELDS}
+    fields["bar_time"] = state.time_ns
+    return encode_row(STATE_MEASUREMENT, _state_tags(symbol, measurement, params), fields, time.time_ns())
+
+
+def read_states(symbols, measurement, params):
+    """Latest persisted IndicatorState per symbol (one query for all of them); missing ones are left out."""
+    if not symbols:
+        return {}
+    rows = query_flux(f'''
+from(bucket: "{settings.INFLUX_BUCKET}")
+  |> range(start: 0)
+  |> filter(fn: (r) => r._measurement == "{STATE_MEASUREMENT}")
+  |> filter(fn: (r) => r.measurement == "{measurement}" and r.params == "{params.key}")
+  |> filter(fn: (r) => {flux_any("symbol", symbols)})
+  |> last()
+''')
+    fields = {}
+    for r in rows:
+        if r.get("_value") is not None:
+            fields.setdefault(r.get("symbol"), {})[r["_field"]] = r["_value"]
+    states = {}
+    for symbol, f in fields.items():
+        if "bar_time" in f and all(name in f for name in _STATE_FIELDS):
+            states[symbol] = IndicatorState(int(f["bar_time"]), **{name: f[name] for name in _STATE_FIELDS})
+    return states
+
+
+def read_state(symbol, measurement, params):
+    """Latest persisted IndicatorState for (symbol, ta measurement, params), or None."""
+    return read_states([symbol], measurement, params).get(symbol)
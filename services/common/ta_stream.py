@@ -0,0 +1,271 @@
+# services/common/ta_stream.py
+# Live BBANDS/MACD/RSI for the streamer: every 1m bar updates its symbol's indicators in O(1)
+# and yields the ta_1m line plus a {"type": "ta"} message for the fanout.
+#
+# Per-symbol state is one row in a few float64 arrays: the recursions of
+# services/common/ta_state.py (EMAs, RSI averages) plus a ring of the last bb_length - 1
+# closes with their running sums, kept relative to a recent close and re-summed every time
+# the ring wraps so rounding doesn't accumulate. A bar is only folded into the state when
+# the next minute's bar arrives; a re-sent (updated) aggregate of the same minute just
+# recomputes its values from the committed state.
+#
+# After a restart, and again on every WS reconnect, the state is seeded from Influx: the
+# indicator job's saved state for ta_1m advanced over the closes since (the same values a
+# --incremental run writes), or, without a usable state, a recompute over the last
+# TA_STREAM_SEED_DAYS of closes.
+import math
+import logging
+
+import numpy as np
+import pandas as pd
+
+from config.settings import settings
+from services.common.bar_store import get_bar_store
+from services.common.columnar import INDICATOR_FIELDS, clean_close_frame
+from services.common.line_protocol import encode_frame, encode_row, series_key
+from services.common.ta_batch import closed_bar_end, fetch_closes, same_close, state_split
+from services.common.ta_state import IndicatorParams, IndicatorState, read_states
+
+logger = logging.getLogger("ta_stream")
+
+TA_MEASUREMENT = "ta_1m"
+# Minute bars the seed reads: the backfilled history first, then what the streamer wrote itself
+SEED_SOURCES = ("aggs_1m", "aggs_stream")
+# compute_indicators.py defaults, i.e. the parameter set /api/indicators serves from ta_1m
+STREAM_PARAMS = IndicatorParams(20, 2.0, 12, 26, 9, 14)
+_NS = 1_000_000_000
+# Columns of the state arrays (the IndicatorState fields)
+_FAST, _SLOW, _SIGNAL, _GAIN, _LOSS, _WEIGHT, _LAST = range(7)
+# Columns of the window sums: reference close, sum(x - ref), sum((x - ref) ** 2)
+_REF, _SUM, _SUMSQ = range(3)
+
+
+def seed_closes(ranges, group_size=50, store=None):
+    """
+    Minute closes per symbol for `ranges` ({symbol: (lo_sec, hi_sec)}) from SEED_SOURCES;
+    where both have a bar the first source (aggs_1m) wins.
+    """
+    merged = None
+    for measurement in SEED_SOURCES:
+        part = fetch_closes(measurement, ranges, group_size, store if measurement == "aggs_1m" else None)
+        if merged is None:
+            merged = {sym: df["c"] for sym, df in part.items()}
+        else:
+            merged = {sym: merged[sym].combine_first(df["c"]) for sym, df in part.items()}
+    return {sym: s.to_frame("c") if len(s) else clean_close_frame(None, "c") for sym, s in merged.items()}
+
+
+class StreamIndicators:
+    """
+    BBANDS/MACD/RSI over live 1m bars for many symbols. `update(bar)` returns the
+    (ta_1m line, fanout message) of the bar, or None while the symbol is still warming up
+    or the bar is older than its state.
+    """
+
+    def __init__(self, params=STREAM_PARAMS, capacity=64):
+        self.params = params
+        self.width = max(params.bb_length - 1, 0)
+        self.slots = {}                                   # symbol -> row in the arrays below
+        self.state = np.zeros((capacity, 7))              # committed state (through bar_ns)
+        self.pending = np.zeros((capacity, 7))            # state including the open bar
+        self.bar_ns = np.zeros(capacity, dtype=np.int64)      # last committed bar
+        self.pending_ns = np.zeros(capacity, dtype=np.int64)  # open bar; 0 = none
+        self.window = np.zeros((capacity, self.width))    # last bb_length - 1 closes, minus the reference
+        self.sums = np.zeros((capacity, 3))
+        self.head = np.zeros(capacity, dtype=np.int64)    # oldest window entry (next to overwrite)
+        self._warming = {}                                # symbol -> [(ns, close)] before the warm-up is reached
+        self._keys = {}
+        self._af = 2.0 / (params.macd_fast + 1)
+        self._aslow = 2.0 / (params.macd_slow + 1)
+        self._asig = 2.0 / (params.macd_signal + 1)
+        self._decay = 1.0 - 1.0 / params.rsi_length
+
+    # --- state ----------------------------------------------------------------------------
+
+    def _grow(self):
+        size = 2 * len(self.bar_ns)
+        for name in ("state", "pending", "bar_ns", "pending_ns", "window", "sums", "head"):
+            old = getattr(self, name)
+            new = np.zeros((size,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def activate(self, symbol, state, closes):
+        """Start updating `symbol` from `state`; `closes` ends with the state's bar (bb_length - 1 are kept)."""
+        i = self.slots.get(symbol)
+        if i is None:
+            if len(self.slots) == len(self.bar_ns):
+                self._grow()
+            i = self.slots[symbol] = len(self.slots)
+        self._warming.pop(symbol, None)
+        self.state[i] = [state.ema_fast, state.ema_slow, state.ema_signal, state.gain_avg, state.loss_avg,
+                         state.rsi_weight, state.last_close]
+        self.bar_ns[i] = state.time_ns
+        self.pending_ns[i] = 0
+        if self.width:
+            last = np.asarray(closes, dtype=np.float64)[-self.width:]
+            ref = last[-1]
+            self.window[i] = last - ref
+            self.sums[i] = [ref, self.window[i].sum(), np.square(self.window[i]).sum()]
+        self.head[i] = 0
+
+    def _commit(self, i):
+        """Fold the open bar of row `i` into its committed state and BB window."""
+        self.state[i] = self.pending[i]
+        self.bar_ns[i] = self.pending_ns[i]
+        self.pending_ns[i] = 0
+        if not self.width:
+            return
+        ref, s1, s2 = self.sums[i].tolist()
+        h = int(self.head[i])
+        y = float(self.pending[i, _LAST]) - ref
+        old = float(self.window[i, h])
+        self.window[i, h] = y
+        h = (h + 1) % self.width
+        self.head[i] = h
+        if h == 0:
+            # Re-base on the newest close and re-sum, so the running sums never drift
+            row = self.window[i]
+            row -= y
+            self.sums[i] = [ref + y, row.sum(), np.square(row).sum()]
+        else:
+            self.sums[i, _SUM] = s1 + y - old
+            self.sums[i, _SUMSQ] = s2 + y * y - old * old
+
+    def _step(self, i, x):
+        """Indicators of close `x` on top of row `i`'s committed state; the new state goes to `pending`."""
+        fast, slow, sig, gain, loss, weight, last = self.state[i].tolist()
+        fast = self._af * x + (1.0 - self._af) * fast
+        slow = self._aslow * x + (1.0 - self._aslow) * slow
+        macd = fast - slow
+        sig = self._asig * macd + (1.0 - self._asig) * sig
+        d = x - last
+        weight *= self._decay
+        gain = (weight * gain + max(d, 0.0)) / (weight + 1.0)
+        loss = (weight * loss + min(d, 0.0)) / (weight + 1.0)
+        weight += 1.0
+        self.pending[i] = [fast, slow, sig, gain, loss, weight, x]
+
+        ref, s1, s2 = self.sums[i].tolist()
+        n = self.width + 1
+        y = x - ref
+        mean = (s1 + y) / n
+        std = math.sqrt(max((s2 + y * y) / n - mean * mean, 0.0))
+        mid = ref + mean
+        band = self.params.bb_std * std
+        total = gain - loss
+        rsi = 100.0 * gain / total if total else math.nan
+        return mid - band, mid, mid + band, macd, sig, macd - sig, rsi
+
+    def _warm(self, symbol, ts, x):
+        """Collect closes of a symbol without enough history; True once it has been activated."""
+        bars = self._warming.setdefault(symbol, [])
+        if bars and ts <= bars[-1][0]:
+            if ts == bars[-1][0]:
+                bars[-1] = (ts, x)
+            return False
+        if len(bars) < self.params.warmup:
+            bars.append((ts, x))
+            return False
+        closes = np.array([c for _, c in bars])
+        self.activate(symbol, IndicatorState.from_closes(closes, bars[-1][0], self.params), closes)
+        return True
+
+    # --- per bar --------------------------------------------------------------------------
+
+    def update(self, bar):
+        symbol = bar["symbol"]
+        ts = int(bar["timestamp"])
+        x = float(bar["close"])
+        if not math.isfinite(x):
+            return None
+        i = self.slots.get(symbol)
+        if i is None:
+            if not self._warm(symbol, ts, x):
+                return None
+            i = self.slots[symbol]
+        if ts <= self.bar_ns[i]:
+            return None  # late bar for an already committed minute
+        open_ns = int(self.pending_ns[i])
+        if open_ns:
+            if ts < open_ns:
+                return None
+            if ts > open_ns:
+                self._commit(i)
+        self.pending_ns[i] = ts
+        values = self._step(i, x)
+        return self._line(symbol, ts, values), self._message(symbol, ts, values)
+
+    def _line(self, symbol, ts, values):
+        key = self._keys.get(symbol)
+        if key is None:
+            key = self._keys[symbol] = series_key(TA_MEASUREMENT, {"symbol": symbol, "source": "ta"})
+        return encode_row(TA_MEASUREMENT, None, dict(zip(INDICATOR_FIELDS, values)), ts, key=key)
+
+    @staticmethod
+    def _message(symbol, ts, values):
+        msg = {"type": "ta", "symbol": symbol, "t": ts}
+        for name, v in zip(INDICATOR_FIELDS, values):
+            msg[name] = v if math.isfinite(v) else None
+        return msg
+
+    # --- seeding --------------------------------------------------------------------------
+
+    def seed(self, symbols, end_sec=None, store=None, group_size=None):
+        """
+        Load the state of `symbols` from Influx as of `end_sec` (default: the start of the
+        current minute). Returns the ta_1m lines of the bars between a saved ta_state and
+        `end_sec`, which the indicator job has not written yet.
+        """
+        p = self.params
+        end_sec = closed_bar_end("minute") if end_sec is None else end_sec
+        group_size = group_size or settings.INDICATOR_GROUP_SIZE
+        seed_lo = end_sec - settings.TA_STREAM_SEED_DAYS * 86400
+        # A day of lookback covers bb_length - 1 closes unless the bars have a long gap
+        lookback = max(86400, 2 * p.bb_length * 60)
+        states = {sym: st for sym, st in read_states(list(symbols), TA_MEASUREMENT, p).items()
+                  if seed_lo <= st.time_ns // _NS < end_sec}
+        ranges = {sym: ((states[sym].time_ns // _NS - lookback) // lookback * lookback, end_sec)
+                  for sym in symbols if sym in states}
+        closes = seed_closes(ranges, group_size, store) if ranges else {}
+
+        lines = []
+        fresh = [sym for sym in symbols if sym not in states]
+        for sym in ranges:
+            df, state = closes[sym], states[sym]
+            split = state_split(df, state, p.bb_length - 1)
+            if split is None or not same_close(df["c"].iloc[split - 1], state.last_close):
+                logger.info("Saved indicator state of %s no longer matches the bars; recomputing", sym)
+                fresh.append(sym)
+                continue
+            close = df["c"].to_numpy()
+            if split < len(close):
+                ns = df.index.asi8
+                cols = state.advance(close[split:], ns[-1], close[:split], p)
+                frame = pd.DataFrame(cols, index=df.index[split:])[INDICATOR_FIELDS]
+                lines.extend(encode_frame(TA_MEASUREMENT, {"symbol": sym, "source": "ta"}, frame,
+                                          fields=INDICATOR_FIELDS))
+            self.activate(sym, state, close)
+
+        warming = 0
+        if fresh:
+            closes = seed_closes({sym: (seed_lo, end_sec) for sym in fresh}, group_size, store)
+            for sym in fresh:
+                df = closes[sym]
+                close = df["c"].to_numpy()
+                state = IndicatorState.from_closes(close, df.index.asi8[-1], p) if len(close) else None
+                if state is not None:
+                    self.activate(sym, state, close)
+                else:
+                    self._warming[sym] = list(zip(df.index.asi8.tolist(), close.tolist()))
+                    warming += 1
+        logger.info("Seeded live indicators: %d symbols from saved state (%d gap points), %d recomputed, "
+                    "%d warming up", len(symbols) - len(fresh), len(lines), len(fresh) - warming, warming)
+        return lines
+
+
+def default_stream_indicators(symbols, end_sec=None):
+    """StreamIndicators seeded for `symbols` (with the configured bar store) plus the gap lines to write."""
+    indicators = StreamIndicators(capacity=max(1, len(symbols)))
+    lines = indicators.seed(symbols, end_sec=end_sec, store=get_bar_store())
+    return indicators, lines
@@ -1,61 +1,344 @@
 import json
+import time
 import logging
 import asyncio
+import itertools
 import websockets
+from collections import OrderedDict
 
 from config.settings import settings
 from services.streamer.polygon_ws import stream_polygon
 from services.common.auth import verify_jwt
+from services.common.hot_window import HotWindow, serve_hot_window
+from services.common.rollup import catch_up
 
 logger = logging.getLogger("fanout_ws")
 logging.basicConfig(level=logging.INFO)
 
+# What to do when a client's outbound queue is full:
+# - drop_oldest: discard the oldest queued message to make room
+# - latest:      keep only the newest message per (type, symbol); falls back to drop_oldest
+# - disconnect:  close the slow client so it can reconnect and resync
+SLOW_CLIENT_POLICIES = ("drop_oldest", "latest", "disconnect")
+
+# Subscribing to this topic delivers every symbol (the pre-subscription behaviour). New
+# connections start on it unless they pass ?symbols=; their first "subscribe" replaces it.
+WILDCARD = "*"
+
+
+class ClientConnection:
+    """
+    One connected WebSocket plus its bounded outbound queue and writer task.
+
+    The Hub only ever calls `enqueue` (synchronous, never awaits), so a slow client
+    can only fall behind on its own queue; it never stalls delivery to other clients.
+    """
+
+    def __init__(self, ws, maxsize, policy):
+        self.ws = ws
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.closed = False
+        self.slow_disconnect = False
+        self.topics = set()  # symbols this client is subscribed to (maintained by the Hub)
+        self.default_wildcard = False  # on WILDCARD only because it never subscribed itself
+        # seq -> (key, payload, enqueued_at), in send order; key is (type, symbol) for conflation
+        self._queue = OrderedDict()
+        self._newest = {}  # key -> seq of its newest queued message
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        # Lag counters
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.last_lag = 0.0  # seconds between enqueue and send of the latest message
+        self.max_lag = 0.0
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def start(self, on_done):
+        self._task = asyncio.create_task(self._writer())
+        self._task.add_done_callback(lambda _t: on_done(self))
+
+    def enqueue(self, key, payload):
+        """Queue a pre-encoded payload; applies the slow-client policy when full. Returns False if closed."""
+        if self.closed:
+            return False
+        if len(self._queue) >= self.maxsize:
+            if self.policy == "disconnect":
+                self.dropped += 1
+                self.slow_disconnect = True
+                self.close(code=1013, reason="Slow consumer")
+                return False
+            stale = self._newest.get(key) if self.policy == "latest" and key is not None else None
+            if stale is not None:
+                # Replace the stale entry for the same key instead of losing another symbol's data
+                del self._queue[stale]
+            else:
+                self._pop()
+            self.dropped += 1
+        seq = next(self._seq)
+        self._queue[seq] = (key, payload, time.monotonic())
+        if key is not None:
+            self._newest[key] = seq
+        self.enqueued += 1
+        if len(self._queue) > self.max_depth:
+            self.max_depth = len(self._queue)
+        self._wakeup.set()
+        return True
+
+    def close(self, code=1000, reason=""):
+        if self.closed:
+            return
+        self.closed = True
+        self._clear()
+        self._wakeup.set()
+        asyncio.create_task(self._close_ws(code, reason))
+
+    def _pop(self):
+        """Remove and return the oldest queued (key, payload, enqueued_at)."""
+        seq, item = self._queue.popitem(last=False)
+        if self._newest.get(item[0]) == seq:
+            del self._newest[item[0]]
+        return item
+
+    def _clear(self):
+        self._queue.clear()
+        self._newest.clear()
+
+    async def _close_ws(self, code, reason):
+        try:
+            await self.ws.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    async def _writer(self):
+        try:
+            while not self.closed:
+                if not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                _, payload, enqueued_at = self._pop()
+                await self.ws.send(payload)
+                self.sent += 1
+                self.last_lag = time.monotonic() - enqueued_at
+                if self.last_lag > self.max_lag:
+                    self.max_lag = self.last_lag
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Broken connection; the done-callback unregisters us
+            self.closed = True
+
+    def stop(self):
+        self.closed = True
+        self._clear()
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def stats(self):
+        return {
+            "remote": str(getattr(self.ws, "remote_address", "")),
+            "topics": len(self.topics),
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "last_lag_ms": round(self.last_lag * 1000.0, 1),
+            "max_lag_ms": round(self.max_lag * 1000.0, 1),
+        }
+
 
 class Hub:
-    def __init__(self):
-        self.clients = set()
+    def __init__(self, queue_size=None, policy=None):
+        self.clients = {}  # ws -> ClientConnection
+        self.topics = {}   # symbol (or WILDCARD) -> set of ClientConnection
+        self.queue_size = queue_size or settings.WS_CLIENT_QUEUE_SIZE
+        self.policy = policy or settings.WS_SLOW_CLIENT_POLICY
+        if self.policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy {self.policy!r}; expected one of {SLOW_CLIENT_POLICIES}")
+        self.disconnected_slow = 0
 
     async def register(self, ws):
-        self.clients.add(ws)
+        conn = ClientConnection(ws, self.queue_size, self.policy)
+        self.clients[ws] = conn
+        conn.start(self._on_writer_done)
+        return conn
 
     async def unregister(self, ws):
-        self.clients.discard(ws)
+        conn = self.clients.pop(ws, None)
+        if conn is not None:
+            self._drop_topics(conn)
+            conn.stop()
+
+    def _on_writer_done(self, conn):
+        # Writer exited (send error or slow-consumer close); drop the client from the hub
+        if conn.slow_disconnect:
+            self.disconnected_slow += 1
+        if self.clients.get(conn.ws) is conn:
+            del self.clients[conn.ws]
+            self._drop_topics(conn)
+
+    def subscribe(self, conn, symbols):
+        """
+        Add `conn` to each symbol's subscriber set, up to WS_MAX_SUBSCRIPTIONS per client.
+        Returns (the client's full topic list, the symbols rejected by the limit).
+        """
+        rejected = []
+        for sym in symbols:
+            if len(conn.topics) >= settings.WS_MAX_SUBSCRIPTIONS and sym not in conn.topics:
+                rejected.append(sym)
+                continue
+            self.topics.setdefault(sym, set()).add(conn)
+            conn.topics.add(sym)
+        return sorted(conn.topics), rejected
+
+    def unsubscribe(self, conn, symbols):
+        for sym in symbols:
+            subs = self.topics.get(sym)
+            if subs is not None:
+                subs.discard(conn)
+                if not subs:
+                    del self.topics[sym]
+            conn.topics.discard(sym)
+        return sorted(conn.topics)
 
-    async def broadcast(self, message):
+    def _drop_topics(self, conn):
+        self.unsubscribe(conn, list(conn.topics))
+
+    def broadcast(self, message):
+        """
+        Route a message to the subscribers of its symbol (plus wildcard subscribers).
+
+        The payload is encoded once per message/topic and enqueued without awaiting,
+        so one slow socket cannot block the rest. Messages without a symbol go to everyone.
+        """
         if not self.clients:
             return
-        dead = []
+        symbol = message.get("symbol")
+        if symbol is None:
+            targets = list(self.clients.values())
+        else:
+            subs = self.topics.get(symbol)
+            wild = self.topics.get(WILDCARD)
+            if not subs and not wild:
+                return
+            targets = list(subs or ())
+            if wild:
+                targets.extend(c for c in wild if not subs or c not in subs)
         payload = json.dumps(message)
-        for ws in list(self.clients):
-            try:
-                await ws.send(payload)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            await self.unregister(ws)
+        key = (message.get("type"), symbol)
+        for conn in targets:
+            conn.enqueue(key, payload)
+
+    def stats(self, top=10):
+        """Aggregate lag counters plus the `top` slowest clients by queue depth."""
+        conns = list(self.clients.values())
+        slowest = sorted(conns, key=lambda c: (c.depth, c.dropped), reverse=True)[:top]
+        return {
+            "clients": len(conns),
+            "topics": len(self.topics),
+            "policy": self.policy,
+            "queued": sum(c.depth for c in conns),
+            "dropped": sum(c.dropped for c in conns),
+            "disconnected_slow": self.disconnected_slow,
+            "slowest": [c.stats() for c in slowest],
+        }
+
+
+def _parse_symbols(value):
+    """Accept a list of symbols or a comma-separated string; returns a de-duplicated list."""
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)):
+        return []
+    out = []
+    for s in value:
+        s = str(s).strip()
+        if s and s not in out:
+            out.append(s)
+    return out
+
+
+def _subscribe(hub, conn, symbols):
+    """Subscribe `conn` to `symbols`, telling the client which ones went over its limit."""
+    topics, rejected = hub.subscribe(conn, symbols)
+    if rejected:
+        conn.enqueue(None, json.dumps({
+            "type": "error",
+            "error": f"subscription limit of {settings.WS_MAX_SUBSCRIPTIONS} symbols reached",
+            "symbols": rejected,
+        }))
+    return topics
+
+
+def handle_client_message(hub, conn, raw):
+    """
+    Apply a control message from a client.
+
+    Supported messages:
+      {"action": "subscribe", "symbols": ["X:BTCUSD", "X:ETHUSD"]}   ("*" = all symbols)
+      {"action": "unsubscribe", "symbols": "X:BTCUSD"}
+    A client still on its default "*" subscription leaves it with its first "subscribe".
+    Replies are queued on the client's own outbound queue; symbols over WS_MAX_SUBSCRIPTIONS
+    are listed in an {"type": "error"} reply before the subscriptions.
+    """
+    try:
+        msg = json.loads(raw)
+    except (TypeError, ValueError):
+        conn.enqueue(None, json.dumps({"type": "error", "error": "invalid json"}))
+        return
+    action = msg.get("action") if isinstance(msg, dict) else None
+    if action not in ("subscribe", "unsubscribe"):
+        conn.enqueue(None, json.dumps({"type": "error", "error": "unknown action"}))
+        return
+    symbols = _parse_symbols(msg.get("symbols"))
+    if action == "subscribe":
+        if conn.default_wildcard:
+            conn.default_wildcard = False
+            hub.unsubscribe(conn, [WILDCARD])
+        topics = _subscribe(hub, conn, symbols)
+    else:
+        topics = hub.unsubscribe(conn, symbols)
+    conn.enqueue(None, json.dumps({"type": "subscriptions", "symbols": topics}))
 
 
 async def client_handler(ws, path, hub):
     # Simple JWT auth via header or ?token=
     token = None
+    qs = {}
     try:
+        if "?" in path:
+            from urllib.parse import parse_qs, urlparse
+            qs = parse_qs(urlparse(path).query)
         auth_header = ws.request_headers.get("Authorization")
         if auth_header and auth_header.lower().startswith("bearer "):
             token = auth_header.split(" ", 1)[1].strip()
         else:
-            if "?" in path:
-                from urllib.parse import parse_qs, urlparse
-                qs = parse_qs(urlparse(path).query)
-                token = (qs.get("token") or [None])[0]
+            token = (qs.get("token") or [None])[0]
         verify_jwt(token)
     except Exception:
         await ws.close(code=4401, reason="Unauthorized")
         return
 
-    await hub.register(ws)
+    conn = await hub.register(ws)
+    # Optional initial subscription via ?symbols=X:BTCUSD,X:ETHUSD; without it the client gets
+    # every symbol, as before subscriptions existed, until it subscribes to something itself
+    initial = _parse_symbols((qs.get("symbols") or [""])[0])
+    if initial:
+        _subscribe(hub, conn, initial)
+    else:
+        hub.subscribe(conn, [WILDCARD])
+        conn.default_wildcard = True
     try:
-        async for _ in ws:
-            pass  # push-only server
+        async for raw in ws:
+            handle_client_message(hub, conn, raw)
     finally:
         await hub.unregister(ws)
 
@@ -69,16 +352,49 @@ async def run():
     async def fanout_loop():
         while True:
             msg = await queue.get()
-            await hub.broadcast(msg)
+            hub.broadcast(msg)
+
+    async def stats_loop(interval):
+        # Periodically surface slow consumers so lag is visible at thousands of connections
+        while True:
+            await asyncio.sleep(interval)
+            st = hub.stats(top=5)
+            logger.info("Hub: clients=%d queued=%d dropped=%d disconnected_slow=%d",
+                        st["clients"], st["queued"], st["dropped"], st["disconnected_slow"])
+            for c in st["slowest"]:
+                if c["depth"] or c["dropped"]:
+                    logger.info("Slow client %s depth=%d dropped=%d last_lag_ms=%.1f",
+                                c["remote"], c["depth"], c["dropped"], c["last_lag_ms"])
+
+    async def rollup_loop(interval):
+        # Closed rollup buckets are recomputed from aggs_1m + aggs_stream and the watermarks advanced
+        while True:
+            for sym in symbols:
+                try:
+                    await asyncio.to_thread(catch_up, sym)
+                except Exception as e:
+                    logger.warning("Rollup catch-up failed for %s: %s", sym, e)
+            await asyncio.sleep(interval)
 
     host, port = settings.WS_BIND_HOST, settings.WS_BIND_PORT
     server = await websockets.serve(lambda ws, path: client_handler(ws, path, hub), host, port)
     logger.info("Fanout WS server listening on ws://%s:%s", host, port)
 
-    streamer_task = asyncio.create_task(stream_polygon(queue=queue, symbols=symbols))
+    # Recent bars kept in memory for /api/snapshot and "last N" reads
+    hot_window = HotWindow(settings.HOT_WINDOW_SIZE)
+
+    streamer_task = asyncio.create_task(stream_polygon(queue=queue, symbols=symbols, hot_window=hot_window))
     fanout_task = asyncio.create_task(fanout_loop())
+    tasks = [server.wait_closed(), streamer_task, fanout_task]
+    if settings.HOT_WINDOW_BIND_PORT > 0:
+        tasks.append(asyncio.create_task(
+            serve_hot_window(hot_window, settings.HOT_WINDOW_BIND_HOST, settings.HOT_WINDOW_BIND_PORT)))
+    if settings.ROLLUPS_ENABLED and settings.ROLLUP_INTERVAL_SEC > 0:
+        tasks.append(asyncio.create_task(rollup_loop(settings.ROLLUP_INTERVAL_SEC)))
+    if settings.WS_STATS_INTERVAL_SEC > 0:
+        tasks.append(asyncio.create_task(stats_loop(settings.WS_STATS_INTERVAL_SEC)))
 
-    await asyncio.gather(server.wait_closed(), streamer_task, fanout_task)
+    await asyncio.gather(*tasks)
 
 
 if __name__ == "__main__":
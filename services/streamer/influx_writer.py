@@ -0,0 +1,271 @@
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger("influx_writer")
+
+
+class InfluxBatchWriter:
+    """
+    Background Influx writer stage for the streamer.
+
+    The receive loop hands points to `put()`, which only touches a bounded asyncio.Queue.
+    A single background task drains that queue into batches and flushes them when the batch
+    reaches `batch_size` or when `flush_interval` elapses (a real timer, so a quiet market still
+    gets flushed). The blocking HTTP write runs in a worker thread, so pings, the receive loop
+    and the fanout keep running while Influx is slow.
+
+    When the queue is full, `put()` either waits (backpressure) or, if `spill_dir` is set,
+    appends the point as line protocol to a spill file. Failed batches are spilled the same way
+    instead of being dropped. A separate replay task streams the spill file back in
+    `batch_size` chunks once writes succeed again, yielding to the live drain whenever it has
+    points queued; file I/O runs in worker threads so the event loop never blocks on disk.
+    """
+
+    def __init__(self, write_api, bucket, org, batch_size=1000, flush_interval=0.25,
+                 max_queue=50000, spill_dir=None, stats_interval=60.0, replay_retry_sec=30.0):
+        self.write_api = write_api
+        self.bucket = bucket
+        self.org = org
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.spill_path = os.path.join(spill_dir, "influx_spill.lp") if spill_dir else None
+        self.stats_interval = stats_interval
+        self.replay_retry_sec = float(replay_retry_sec)
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self._replay_task = None
+        self._closing = False
+        self._spill_lock = asyncio.Lock()   # serializes spill-file appends and the replay hand-off
+        self._writable = asyncio.Event()    # set while the last write succeeded
+        # Metrics
+        self.batches = 0
+        self.points = 0
+        self.failures = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.max_batch = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self._last_stats = time.monotonic()
+
+    def start(self):
+        self._writable.set()
+        self._task = asyncio.create_task(self._run())
+        if self.spill_path:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            self._replay_task = asyncio.create_task(self._replay_loop())
+        return self._task
+
+    def _check_running(self):
+        if self._closing:
+            raise RuntimeError("InfluxBatchWriter is closed")
+        if self._task is None or self._task.done():
+            error = self._task.exception() if self._task is not None and not self._task.cancelled() else None
+            raise RuntimeError(f"InfluxBatchWriter task is not running: {error!r}") from error
+
+    async def put(self, point):
+        """
+        Queue one point. Waits when the buffer is full unless spilling is enabled; raises
+        RuntimeError when the writer is closed or its background task has died.
+        """
+        self._check_running()
+        try:
+            self._queue.put_nowait(point)
+            return
+        except asyncio.QueueFull:
+            if self.spill_path is not None:
+                await self._spill([point])
+                return
+        # Backpressure, but don't wait forever on a queue nobody drains any more
+        put = asyncio.ensure_future(self._queue.put(point))
+        await asyncio.wait({put, self._task}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            self._check_running()
+
+    async def close(self, timeout=10.0):
+        """
+        Stop accepting points, flush everything still queued and stop the background tasks.
+        Spilled lines not replayed yet stay on disk for the next start.
+        """
+        if self._task is None:
+            return
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Influx writer did not drain within %.1fs; %d points left", timeout, self._queue.qsize())
+            self._task.cancel()
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+            try:
+                await self._replay_task
+            except asyncio.CancelledError:
+                pass
+            self._replay_task = None
+        self._task = None
+        self._log_stats()
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "points": self.points,
+            "failures": self.failures,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "avg_batch": round(self.points / self.batches, 1) if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "last_latency_ms": round(self.last_latency * 1000.0, 1),
+            "avg_latency_ms": round(self.total_latency / self.batches * 1000.0, 1) if self.batches else 0.0,
+            "max_latency_ms": round(self.max_latency * 1000.0, 1),
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        deadline = loop.time() + self.flush_interval
+        while True:
+            if self._closing and self._queue.empty():
+                break
+            timeout = max(0.0, deadline - loop.time())
+            try:
+                point = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                batch.append(point)
+                # Grab whatever else is already buffered without yielding
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+            except asyncio.TimeoutError:
+                pass
+
+            if len(batch) >= self.batch_size or loop.time() >= deadline:
+                if batch:
+                    await self._flush(batch)
+                    batch = []
+                deadline = loop.time() + self.flush_interval
+                if time.monotonic() - self._last_stats >= self.stats_interval:
+                    self._log_stats()
+
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        t0 = time.monotonic()
+        try:
+            await asyncio.to_thread(self.write_api.write, bucket=self.bucket, org=self.org, record=batch)
+        except Exception as e:
+            self.failures += 1
+            self._writable.clear()
+            if self.spill_path:
+                logger.warning("Influx write of %d points failed, spilling to %s: %s", len(batch), self.spill_path, e)
+                await self._spill(batch)
+            else:
+                logger.exception("Influx write of %d points failed; dropping batch: %s", len(batch), e)
+            return
+        latency = time.monotonic() - t0
+        self.batches += 1
+        self.points += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+        self._writable.set()
+
+    async def _spill(self, points):
+        lines = [p if isinstance(p, str) else p.to_line_protocol() for p in points]
+        async with self._spill_lock:
+            await asyncio.to_thread(_append_lines, self.spill_path, lines)
+        self.spilled += len(points)
+
+    async def _replay_loop(self):
+        """
+        Replay the spill file whenever it exists and writes succeed: right after a live flush
+        succeeded, or every `replay_retry_sec` otherwise. A replay file left by an earlier run
+        (stopped mid-replay) is sent first.
+        """
+        pending = self.spill_path + ".replay"
+        while True:
+            try:
+                await asyncio.wait_for(self._writable.wait(), timeout=self.replay_retry_sec)
+            except asyncio.TimeoutError:
+                pass
+            async with self._spill_lock:
+                ready = os.path.exists(pending)
+                if not ready and os.path.exists(self.spill_path):
+                    os.replace(self.spill_path, pending)
+                    ready = True
+            if not ready:
+                await asyncio.sleep(self.flush_interval)
+                continue
+            if not await self._replay_file(pending):
+                self._writable.clear()
+                await asyncio.sleep(self.flush_interval)
+
+    async def _replay_file(self, pending):
+        """
+        Stream `pending` into Influx in `batch_size` chunks. On a failed write the unsent lines
+        are moved back to the spill file; returns whether the whole file was sent.
+        """
+        f = await asyncio.to_thread(open, pending, "r", encoding="utf-8")
+        done = 0
+        chunk = []
+        sent = False
+        try:
+            while True:
+                chunk = await asyncio.to_thread(_read_lines, f, self.batch_size)
+                if not chunk:
+                    break
+                await asyncio.to_thread(self.write_api.write, bucket=self.bucket, org=self.org, record=chunk)
+                done += len(chunk)
+                self.replayed += len(chunk)
+                chunk = []
+                # Throttle: live points go first whenever the drain has some queued
+                await asyncio.sleep(self.flush_interval if self._queue.qsize() else 0)
+            sent = True
+        except Exception as e:
+            logger.warning("Spill replay failed after %d lines, will retry later: %s", done, e)
+            async with self._spill_lock:
+                await asyncio.to_thread(_move_rest, f, chunk, self.spill_path)
+        finally:
+            await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.remove, pending)
+        return sent
+
+    def _log_stats(self):
+        self._last_stats = time.monotonic()
+        st = self.stats()
+        logger.info("Influx writer: batches=%d points=%d avg_batch=%.1f avg_ms=%.1f max_ms=%.1f queued=%d "
+                    "failures=%d spilled=%d replayed=%d",
+                    st["batches"], st["points"], st["avg_batch"], st["avg_latency_ms"], st["max_latency_ms"],
+                    st["queued"], st["failures"], st["spilled"], st["replayed"])
+
+
+def _append_lines(path, lines):
+    with open(path, "a", encoding="utf-8") as f:
+        for line in lines:
+            f.write(line + "\n")
+
+
+def _read_lines(f, n):
+    """Up to `n` non-blank lines from the open file `f`."""
+    out = []
+    for line in f:
+        line = line.rstrip("\n")
+        if line.strip():
+            out.append(line)
+            if len(out) >= n:
+                break
+    return out
+
+
+def _move_rest(f, unsent, path):
+    """Append the `unsent` lines plus the rest of the open file `f` to `path`."""
+    with open(path, "a", encoding="utf-8") as out:
+        for line in unsent:
+            out.write(line + "\n")
+        for line in f:
+            if line.strip():
+                out.write(line if line.endswith("\n") else line + "\n")
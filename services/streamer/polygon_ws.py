@@ -4,8 +4,12 @@ import logging
 import websockets
 
 from config.settings import settings
-from services.common.influx import get_influxdb_client, get_write_api, point_from_bar
+from services.common.influx import get_influxdb_client, get_write_api
+from services.common.line_protocol import encode_bar, series_key
 from services.common.polygon import normalize_ws_aggregate
+from services.common.rollup import StreamRollup
+from services.common.ta_stream import StreamIndicators, default_stream_indicators
+from services.streamer.influx_writer import InfluxBatchWriter
 
 logger = logging.getLogger("polygon_ws")
 logging.basicConfig(level=logging.INFO)
@@ -13,15 +17,18 @@ logging.basicConfig(level=logging.INFO)
 # Polygon Crypto WebSocket endpoint. XA events (aggregate bars) are emitted here.
 POLYGON_WS = "wss://socket.polygon.io/crypto"
 
-async def stream_polygon(queue, symbols):
+async def stream_polygon(queue, symbols, hot_window=None):
     """
     Open a persistent WebSocket connection to Polygon, subscribe to aggregate (XA) events
-    for the provided symbols, batch received bars into InfluxDB points, write them periodically,
+    for the provided symbols, hand received bars to a background Influx writer stage,
     and push a compact payload to an internal asyncio queue for fan-out to clients.
+    With TA_STREAM_ENABLED, every bar also updates its symbol's BBANDS/MACD/RSI (seeded from
+    Influx on every (re)connect), which are written to ta_1m and pushed as {"type": "ta"} messages.
 
     Args:
         queue: asyncio.Queue where compact bar payloads are put for downstream broadcasting.
         symbols: iterable of symbol strings, e.g., ["X:BTCUSD", "X:ETHUSD"].
+        hot_window: optional HotWindow kept up to date with every received bar.
     """
     api_key = settings.POLYGON_API_KEY
     if not api_key:
@@ -33,10 +40,39 @@ async def stream_polygon(queue, symbols):
 
     # Prepare Influx write API once and reuse the client (lower overhead vs. reconnecting each write)
     client, org, bucket = get_influxdb_client()
-    write_api = get_write_api(client, mode="sync")  # synchronous write API for simplicity
+    write_api = get_write_api(client, mode="sync")  # blocking writes run in the writer's worker thread
     measurement = "aggs_stream"                     # measurement name used in InfluxDB
     default_tags = {"source": "polygon"}            # static tags applied to every point
-
+    series_keys = {}                                # symbol -> encoded "measurement,tags" prefix
+    rollup = StreamRollup() if settings.ROLLUPS_ENABLED else None  # open 5m/15m/1h/4h buckets
+
+    # Writes happen off the receive loop: batches flush on size or on a timer, independent of traffic
+    writer = InfluxBatchWriter(
+        write_api,
+        bucket=bucket,
+        org=org,
+        batch_size=settings.INFLUX_WRITE_BATCH_SIZE,
+        flush_interval=settings.INFLUX_WRITE_FLUSH_MS / 1000.0,
+        max_queue=settings.INFLUX_WRITE_QUEUE_SIZE,
+        spill_dir=settings.INFLUX_SPILL_DIR or None,
+    )
+    writer.start()
+
+    async def seed_indicators(current):
+        # Seeded indicators plus their ta_1m gap lines; on failure keep `current` (or start cold)
+        try:
+            seeded, gap_lines = await asyncio.to_thread(default_stream_indicators, list(symbols))
+        except Exception as e:
+            if current is None:
+                logger.exception("Seeding live indicators failed; they will warm up from live bars: %s", e)
+                return StreamIndicators()
+            logger.exception("Reseeding live indicators failed; continuing from the last live bars: %s", e)
+            return current
+        for line in gap_lines:
+            await writer.put(line)
+        return seeded
+
+    indicators = None
     try:
         # Reconnect loop: if the WS drops or errors, wait briefly and reconnect
         while True:
@@ -48,10 +84,10 @@ async def stream_polygon(queue, symbols):
                     await ws.send(json.dumps({"action": "subscribe", "params": subs}))
                     logger.info("Connected and subscribed: %s", subs)
 
-                    # Buffer of Influx points to batch-write for efficiency
-                    batch_points = []
-                    # Timestamp used to ensure periodic flushing even if the batch is small
-                    last_flush = asyncio.get_event_loop().time()
+                    # (Re)seed on every connect, so bars missed while disconnected are read back from
+                    # Influx; live bars arriving meanwhile wait in the socket and continue from the seed
+                    if settings.TA_STREAM_ENABLED:
+                        indicators = await seed_indicators(indicators)
 
                     # Main receive loop: Polygon sends JSON strings (arrays of events)
                     async for msg in ws:
@@ -72,13 +108,23 @@ async def stream_polygon(queue, symbols):
                                         # Skip if normalization failed or event is not XA
                                         continue
 
-                                    # Build tags per point (symbol-specific + defaults)
-                                    tags = {"symbol": bar["symbol"]}
-                                    tags.update(default_tags)
+                                    if hot_window is not None:
+                                        hot_window.update(bar)
+
+                                    # Build tags per series once (symbol-specific + defaults)
+                                    key = series_keys.get(bar["symbol"])
+                                    if key is None:
+                                        tags = {"symbol": bar["symbol"]}
+                                        tags.update(default_tags)
+                                        key = series_keys[bar["symbol"]] = series_key(measurement, tags)
+
+                                    # Encode the bar straight to line protocol and hand it to the writer
+                                    await writer.put(encode_bar(measurement, None, bar, key=key))
 
-                                    # Convert the bar dict into an InfluxDB Point
-                                    pt = point_from_bar(measurement, tags, bar)
-                                    batch_points.append(pt)
+                                    # Re-emit the open rollup buckets this bar falls into
+                                    if rollup is not None:
+                                        for line in rollup.update(bar):
+                                            await writer.put(line)
 
                                     # Also enqueue a compact payload for downstream fan-out (e.g., to WebSocket clients)
                                     await queue.put({
@@ -92,14 +138,13 @@ async def stream_polygon(queue, symbols):
                                         "v": bar.get("volume", 0),
                                     })
 
-                        # Periodically flush to Influx:
-                        # - when batch size reaches 1000 points (throughput optimization)
-                        # - or at least every 250 ms (latency bound for near-real-time visibility)
-                        now = asyncio.get_event_loop().time()
-                        if batch_points and (len(batch_points) >= 1000 or (now - last_flush) > 0.25):
-                            write_api.write(bucket=bucket, org=org, record=batch_points)
-                            batch_points.clear()
-                            last_flush = now
+                                    # Live indicators: O(1) update, then the ta_1m point and fan-out message
+                                    if indicators is not None:
+                                        out = indicators.update(bar)
+                                        if out is not None:
+                                            line, message = out
+                                            await writer.put(line)
+                                            await queue.put(message)
 
             except Exception as e:
                 # Log error and back off briefly before attempting to reconnect.
@@ -107,8 +152,11 @@ async def stream_polygon(queue, symbols):
                 logger.exception("WS error, reconnecting shortly: %s", e)
                 await asyncio.sleep(2.0 + 2.0 * (asyncio.get_event_loop().time() % 1.0))  # jitter
     finally:
-        # Ensure the Influx client is closed on task cancellation/shutdown
-        client.close()
+        # Drain buffered points before closing the Influx client on cancellation/shutdown
+        try:
+            await writer.close()
+        finally:
+            client.close()
 
 async def main():
     """
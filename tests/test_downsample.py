@@ -0,0 +1,101 @@
+# tests/test_downsample.py
+import numpy as np
+import pytest
+
+from services.common.downsample import NICE_WINDOWS, lttb_indices, parse_duration, pick_window
+
+
+@pytest.mark.parametrize("span, points, native, expected", [
+    (86400, 1440, 60, None),             # one bar per point already fits
+    (86400, 5000, 60, None),
+    (86400, 500, 60, (300, "5m")),       # 172.8s per point -> next nice window up
+    (86400, 288, 60, (300, "5m")),       # exactly 300s per point
+    (86400, 1000, 60, (120, "2m")),
+    (7 * 86400, 100, 60, (7200, "2h")),
+    (365 * 86400, 300, 86400, (604800, "1w")),  # daily bars: only windows above the native size
+    (20 * 365 * 86400, 500, 60, (15 * 86400, "15d")),
+    (20 * 365 * 86400, 100, 60, (73 * 86400, "73d")),  # past the table: whole days
+    (86400, 0, 60, None),
+    (0, 500, 60, None),
+])
+def test_pick_window(span, points, native, expected):
+    assert pick_window(span, points, native) == expected
+
+
+def test_pick_window_never_exceeds_budget():
+    for span in (3600, 86400, 30 * 86400, 400 * 86400):
+        for points in (10, 100, 1000):
+            picked = pick_window(span, points, 60)
+            step = picked[0] if picked else 60
+            assert span / step <= points
+            assert parse_duration(picked[1]) == picked[0] if picked else True
+
+
+def test_nice_windows_parse():
+    assert [parse_duration(lit) for _, lit in NICE_WINDOWS] == [sec for sec, _ in NICE_WINDOWS]
+    assert parse_duration("0m") is None
+    assert parse_duration("5x") is None
+    assert parse_duration(None) is None
+
+
+def test_lttb_keeps_everything_below_threshold():
+    x = np.arange(10.0)
+    assert lttb_indices(x, x, 10).tolist() == list(range(10))
+    assert lttb_indices(x, x, 50).tolist() == list(range(10))
+    assert lttb_indices(x, x, 2).tolist() == list(range(10))
+
+
+@pytest.mark.parametrize("n, threshold", [(1000, 100), (1001, 3), (10, 9), (5000, 4999), (257, 17)])
+def test_lttb_shape(n, threshold):
+    rng = np.random.default_rng(n)
+    x = np.cumsum(rng.uniform(1, 60, n))
+    y = np.cumsum(rng.normal(size=n))
+    idx = lttb_indices(x, y, threshold)
+    assert len(idx) == threshold
+    assert idx[0] == 0 and idx[-1] == n - 1
+    assert (np.diff(idx) > 0).all()
+
+
+def test_lttb_one_point_per_bucket():
+    n, threshold = 1000, 52
+    x = np.arange(n, dtype=np.float64)
+    idx = lttb_indices(x, np.sin(x / 30.0), threshold)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    for i, j in enumerate(idx[1:-1]):
+        assert edges[i] <= j < max(edges[i + 1], edges[i] + 1)
+
+
+def test_lttb_keeps_spikes():
+    n = 2000
+    x = np.arange(n, dtype=np.float64)
+    y = np.zeros(n)
+    spikes = [137, 900, 1555]
+    y[spikes] = [50.0, -80.0, 30.0]
+    idx = lttb_indices(x, y, 40)
+    assert set(spikes) <= set(idx.tolist())
+
+
+def test_lttb_matches_reference():
+    # Straightforward per-bucket loop over the same bucket edges
+    rng = np.random.default_rng(7)
+    n, threshold = 600, 25
+    x = np.sort(rng.uniform(0, 1e6, n))
+    y = rng.normal(size=n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    expected, a = [0], 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i + 2 < len(edges):
+            nlo, nhi = edges[i + 1], max(edges[i + 2], edges[i + 1] + 1)
+        else:
+            nlo, nhi = n - 1, n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a])) / 2
+            if area > best_area:
+                best, best_area = j, area
+        expected.append(best)
+        a = best
+    expected.append(n - 1)
+    assert lttb_indices(x, y, threshold).tolist() == expected
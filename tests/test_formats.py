@@ -0,0 +1,73 @@
+# tests/test_formats.py
+import struct
+
+import numpy as np
+import pandas as pd
+
+from api.formats import (
+    BINARY_MAGIC, HISTORY_COLUMNS, columnar_payload, indicator_columns, pack_binary, rows_to_arrays,
+)
+
+
+def unpack_binary(buf):
+    """Decode a TSB1 body the way a client does: header, then aligned column views."""
+    assert buf[:4] == BINARY_MAGIC
+    rows, ncols = struct.unpack_from("<IH", buf, 4)
+    pos, columns = 10, []
+    for _ in range(ncols):
+        (name_len,) = struct.unpack_from("<B", buf, pos)
+        name = buf[pos + 1:pos + 1 + name_len].decode("utf-8")
+        code = chr(buf[pos + 1 + name_len])
+        columns.append((name, code))
+        pos += 2 + name_len
+    pos += -pos % 8
+    out = {}
+    for name, code in columns:
+        assert pos % 8 == 0
+        out[name] = np.frombuffer(buf, dtype="<" + code, count=rows, offset=pos)
+        pos += rows * 8
+    assert pos == len(buf)
+    return columns, out
+
+
+def test_binary_round_trip():
+    frame = pd.DataFrame({
+        "time_sec": [1704067200, 1704067260, 1704067320],
+        "o": [1.5, np.nan, 3.25], "h": [2.0, 2.5, 4.0], "l": [1.0, 1.0, 3.0], "c": [1.75, 2.25, 3.5],
+        "v": [10, 0, 2**40], "vw": [1.6, 2.0, 3.3], "n": [1, 2, 3],
+    })
+    arrays = rows_to_arrays(frame, HISTORY_COLUMNS)
+    columns, out = unpack_binary(pack_binary(arrays, HISTORY_COLUMNS))
+    assert columns == HISTORY_COLUMNS
+    for name, code in HISTORY_COLUMNS:
+        np.testing.assert_array_equal(out[name], frame[name].to_numpy(dtype=np.int64 if code == "q" else np.float64))
+
+
+def test_binary_round_trip_odd_header_and_no_rows():
+    # Column names chosen so the header needs padding; zero rows still decode
+    columns = indicator_columns(["rsi", "bb_l", "x"])
+    arrays = {name: np.empty(0, dtype=np.int64 if code == "q" else np.float64) for name, code in columns}
+    decoded_columns, out = unpack_binary(pack_binary(arrays, columns))
+    assert decoded_columns == columns
+    assert all(len(v) == 0 for v in out.values())
+
+
+def test_rows_to_arrays_from_dicts_matches_frame():
+    rows = [{"time_sec": 1, "rsi": None, "macd": 1.5}, {"time_sec": 2, "rsi": 40.0}]
+    columns = indicator_columns(["rsi", "macd"])
+    from_rows = rows_to_arrays(rows, columns)
+    from_frame = rows_to_arrays(pd.DataFrame(rows), columns)
+    for name, _ in columns:
+        np.testing.assert_array_equal(from_rows[name], from_frame[name])
+    _, out = unpack_binary(pack_binary(from_rows, columns))
+    assert np.isnan(out["rsi"][0]) and out["rsi"][1] == 40.0 and np.isnan(out["macd"][1])
+
+
+def test_columnar_payload_nulls_and_iso():
+    columns = indicator_columns(["rsi"])
+    arrays = {"time_sec": np.array([1704067200, 1704067260]), "rsi": np.array([np.nan, 55.5])}
+    assert columnar_payload(arrays, columns) == {
+        "_time": ["2024-01-01T00:00:00Z", "2024-01-01T00:01:00Z"],
+        "time_sec": [1704067200, 1704067260],
+        "rsi": [None, 55.5],
+    }
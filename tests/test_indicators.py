@@ -0,0 +1,48 @@
+# tests/test_indicators.py
+# Block-restarted prefix sums against plain per-window statistics.
+import numpy as np
+import pytest
+
+from services.common.indicators import RollingSums
+
+
+def closes(n, seed=0, level=30000.0):
+    rng = np.random.default_rng(seed)
+    return level + np.cumsum(rng.normal(scale=25.0, size=n))
+
+
+def naive_moments(x, length):
+    mean, var = np.full(len(x), np.nan), np.full(len(x), np.nan)
+    for i in range(length - 1, len(x)):
+        w = x[i - length + 1:i + 1]
+        mean[i], var[i] = w.mean(), w.var()
+    return mean, var
+
+
+@pytest.mark.parametrize("length", [1, 2, 20, 255, 256])
+@pytest.mark.parametrize("n", [1, 19, 256, 257, 1000])
+def test_rolling_sums_match_naive_windows(n, length):
+    x = closes(n, seed=n + length)
+    mean, var = RollingSums(x, length).moments(length)
+    ref_mean, ref_var = naive_moments(x, length)
+    np.testing.assert_allclose(mean, ref_mean, rtol=1e-12, equal_nan=True)
+    # Variance of ~30000-level prices from differences: allow absolute rounding of the squares
+    np.testing.assert_allclose(var, ref_var, rtol=1e-9, atol=1e-6, equal_nan=True)
+
+
+def test_rolling_sums_share_prefix_across_lengths():
+    x = closes(700, seed=3)
+    sums = RollingSums(x, 300)
+    for length in (5, 20, 300):
+        np.testing.assert_allclose(sums.moments(length)[0], naive_moments(x, length)[0], rtol=1e-12,
+                                   equal_nan=True)
+    with pytest.raises(ValueError):
+        sums.moments(sums.block + 1)
+
+
+def test_rolling_sums_trending_series_keeps_precision():
+    # A long trend far from zero is where plain cumulative sums lose the variance
+    x = 1e6 + np.arange(5000) * 0.5 + np.sin(np.arange(5000))
+    _, var = RollingSums(x, 20).moments(20)
+    _, ref = naive_moments(x, 20)
+    np.testing.assert_allclose(var[19:], ref[19:], rtol=1e-6)
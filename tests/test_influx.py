@@ -0,0 +1,17 @@
+# tests/test_influx.py
+from services.common.influx import flux_any
+
+
+def test_flux_any_or_chain():
+    assert flux_any("symbol", ["X:BTCUSD"]) == '(r.symbol == "X:BTCUSD")'
+    assert flux_any("_field", ["o", "h", "c"]) == '(r._field == "o" or r._field == "h" or r._field == "c")'
+
+
+def test_flux_any_empty_matches_nothing():
+    assert flux_any("symbol", []) == "false"
+
+
+def test_flux_any_accepts_iterables():
+    assert flux_any("_measurement", ("aggs_1m", "aggs_stream")) == \
+        '(r._measurement == "aggs_1m" or r._measurement == "aggs_stream")'
+    assert flux_any("symbol", (s for s in ["A"])) == '(r.symbol == "A")'
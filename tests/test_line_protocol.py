@@ -0,0 +1,106 @@
+# tests/test_line_protocol.py
+# The direct line-protocol encoders must write exactly what influxdb_client's Point would.
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from influxdb_client import Point, WritePrecision
+
+from services.common.influx import point_from_bar
+from services.common.line_protocol import encode_bar, encode_frame, encode_row, series_key
+
+
+def _split(text, sep):
+    """Split on `sep` outside backslash escapes and double-quoted strings."""
+    out, cur, escaped, quoted = [], "", False, False
+    for ch in text:
+        if escaped:
+            cur, escaped = cur + ch, False
+            continue
+        if ch == "\\":
+            cur, escaped = cur + ch, True
+            continue
+        if ch == '"':
+            quoted = not quoted
+        if ch == sep and not quoted:
+            out.append(cur)
+            cur = ""
+            continue
+        cur += ch
+    out.append(cur)
+    return out
+
+
+def _value(text):
+    """A field value as Influx reads it; Point writes whole floats as "2" where we write "2.0"."""
+    if text.startswith('"'):
+        return "str", text
+    if text.endswith("i"):
+        return "int", int(text[:-1])
+    if text in ("true", "false"):
+        return "bool", text == "true"
+    return "float", float(text)
+
+
+def canonical(line):
+    """(series key, {field: typed value}, timestamp); Point also sorts fields by key."""
+    key, fields, *ts = _split(line, " ")
+    return key, dict((k, _value(v)) for k, v in (f.split("=", 1) for f in _split(fields, ","))), ts
+
+
+BARS = [
+    {"timestamp": 1704067200_000_000_000, "open": 42000.5, "high": 42100.25, "low": 41999.0, "close": 42050.125,
+     "volume": 12, "vwap": 42040.1, "transactions": 3},
+    {"timestamp": 1704067260_123_456_789, "open": 0.1 + 0.2, "high": 1e-7, "low": 1e20, "close": 1 / 3},
+    {"timestamp": 1, "open": 1, "high": 2, "low": 0, "close": 1, "volume": 2**53 + 1, "vwap": -0.0,
+     "transactions": 0},
+]
+TAGS = [{"symbol": "X:BTCUSD", "source": "polygon"}, {"sym bol": "a,b=c", "empty": "", "z": "1"}, None]
+
+
+@pytest.mark.parametrize("tags", TAGS)
+@pytest.mark.parametrize("bar", BARS)
+def test_encode_bar_matches_point(bar, tags):
+    expected = point_from_bar("aggs 1m,x", tags, bar).to_line_protocol()
+    assert canonical(encode_bar("aggs 1m,x", tags, bar)) == canonical(expected)
+
+
+def test_encode_bar_with_precomputed_key():
+    tags = {"symbol": "X:ETHUSD"}
+    key = series_key("aggs_stream", tags)
+    assert encode_bar("aggs_stream", None, BARS[0], key=key) == encode_bar("aggs_stream", tags, BARS[0])
+
+
+def test_encode_row_matches_point():
+    fields = {"f": 1.5, "i": np.int64(7), "b": True, "s": 'say "hi"\\', "nan": math.nan, "none": None,
+              "inf": math.inf, "np": np.float32(0.25)}
+    p = Point("ta_1m").tag("symbol", "X:BTCUSD").time(1704067200_000_000_000, WritePrecision.NS)
+    for k in ("f", "i", "b", "s", "np"):
+        p = p.field(k, fields[k].item() if isinstance(fields[k], np.generic) else fields[k])
+    line = encode_row("ta_1m", {"symbol": "X:BTCUSD"}, fields, 1704067200_000_000_000)
+    assert canonical(line) == canonical(p.to_line_protocol())
+
+
+def test_encode_row_without_fields_is_none():
+    assert encode_row("m", {"a": "b"}, {"x": None, "y": math.nan}, 1) is None
+
+
+def test_encode_frame_matches_point_per_row():
+    idx = pd.to_datetime([1704067200, 1704067260, 1704067320, 1704067380], unit="s", utc=True)
+    df = pd.DataFrame({"rsi": [math.nan, 55.5, 1 / 7, math.nan],
+                       "macd": [math.nan, -0.5, 2.0, math.nan],
+                       "n": [1.0, math.nan, 3.0, math.nan]}, index=idx)
+    tags = {"symbol": "X:BTCUSD", "source": "ta"}
+    lines = encode_frame("ta_1m", tags, df, fields=["rsi", "macd", "n"], int_fields=("n",))
+
+    expected = []
+    for ts, row in df.iterrows():
+        p = Point("ta_1m").tag("symbol", "X:BTCUSD").tag("source", "ta").time(ts.value, WritePrecision.NS)
+        values = {k: v for k, v in row.items() if math.isfinite(v)}
+        if not values:
+            continue  # rows with nothing to write are dropped
+        for k, v in values.items():
+            p = p.field(k, int(v) if k == "n" else float(v))
+        expected.append(p.to_line_protocol())
+    assert [canonical(line) for line in lines] == [canonical(line) for line in expected]
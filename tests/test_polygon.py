@@ -0,0 +1,78 @@
+# tests/test_polygon.py
+import pytest
+
+import services.common.polygon as polygon
+from services.common.polygon import TokenBucket
+
+
+class Clock:
+    """Stands in for the time module; sleep() advances the clock and records the delay."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(polygon, "time", c)
+    return c
+
+
+def test_burst_then_rate(clock):
+    bucket = TokenBucket(rate=2.0, burst=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.slept == []
+    bucket.acquire()
+    assert clock.slept == [pytest.approx(0.5)]
+    assert bucket.acquired == 4
+
+
+def test_pause_holds_every_caller(clock):
+    bucket = TokenBucket(rate=5.0, burst=5)
+    bucket.pause(30.0)
+    start = clock.now
+    bucket.acquire()
+    # Nothing refills during the pause: the first request waits it out plus one token
+    assert clock.now - start == pytest.approx(30.0 + 1 / 5.0)
+    assert bucket.pauses == 1
+    assert bucket.stats()["waited_sec"] == pytest.approx(30.2)
+
+
+def test_pause_does_not_shorten_a_longer_pause(clock):
+    bucket = TokenBucket(rate=1.0)
+    bucket.pause(60.0)
+    bucket.pause(5.0)
+    start = clock.now
+    bucket.acquire()
+    assert clock.now - start >= 60.0
+
+
+def test_pause_applies_without_rate_limit(clock):
+    bucket = TokenBucket(rate=0)
+    for _ in range(100):
+        bucket.acquire()
+    assert clock.slept == []
+    bucket.pause(10.0)
+    bucket.acquire()
+    assert sum(clock.slept) == pytest.approx(10.0)
+
+
+def test_tokens_refill_after_pause(clock):
+    bucket = TokenBucket(rate=1.0, burst=2)
+    bucket.acquire()
+    bucket.acquire()
+    bucket.pause(3.0)
+    clock.now += 10.0  # long after the pause ended
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.slept == []
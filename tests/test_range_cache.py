@@ -0,0 +1,171 @@
+# tests/test_range_cache.py
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import services.common.range_cache as rc
+from services.common.range_cache import LRUBytesCache, RangeCache
+
+STEP = 60
+CHUNK = 60 * STEP  # chunk_rows=60 below
+
+
+class Clock:
+    """Stands in for the time module: wall and monotonic time both move only when told to."""
+
+    def __init__(self, now):
+        self.now = float(now)
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+class Source:
+    """fetch(lo, hi) over one bar per minute from `first` up to `last` (exclusive), recording calls."""
+
+    def __init__(self, first=0, last=None, value=1.0):
+        self.first, self.last, self.value = first, last, value
+        self.calls = []
+
+    def __call__(self, lo, hi):
+        self.calls.append((lo, hi))
+        t = np.arange(max(lo, self.first), min(hi, self.last), STEP, dtype=np.int64)
+        return pd.DataFrame({"time_sec": t, "c": np.full(len(t), self.value)})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock(100 * CHUNK + 30 * STEP)  # halfway through chunk 100
+    monkeypatch.setattr(rc, "time", c)
+    return c
+
+
+def make_cache(**kw):
+    opts = dict(chunk_rows=60, grace_sec=120, open_ttl=5.0, fill_chunks=4)
+    opts.update(kw)
+    return RangeCache(LRUBytesCache(1 << 24), **opts)
+
+
+def rows(segments):
+    out = []
+    for kind, body in segments:
+        out.extend(json.loads("[" + body + "]") if kind == "json" else body)
+    return [r["time_sec"] for r in out]
+
+
+def test_segments_cover_exactly_the_range(clock):
+    cache, src = make_cache(), Source(last=clock.now)
+    start, end = 90 * CHUNK + 7 * STEP, 95 * CHUNK + 13 * STEP
+    assert rows(cache.iter_segments("k", start, end, STEP, src)) == list(range(start, end, STEP))
+    # Served from the cache the second time, still trimmed to the range
+    src.calls.clear()
+    assert rows(cache.iter_segments("k", start + STEP, end - STEP, STEP, src)) == \
+        list(range(start + STEP, end - STEP, STEP))
+    assert src.calls == []
+
+
+def test_fills_are_chunk_aligned_and_capped(clock):
+    cache, src = make_cache(fill_chunks=4), Source(last=clock.now)
+    list(cache.iter_segments("k", 80 * CHUNK + 1, 90 * CHUNK - 1, STEP, src))
+    assert src.calls == [(80 * CHUNK, 84 * CHUNK), (84 * CHUNK, 88 * CHUNK), (88 * CHUNK, 90 * CHUNK)]
+    assert all(lo % CHUNK == 0 and hi % CHUNK == 0 for lo, hi in src.calls)
+
+
+def test_fill_only_the_missing_runs(clock):
+    cache, src = make_cache(), Source(last=clock.now)
+    list(cache.iter_segments("k", 82 * CHUNK, 83 * CHUNK, STEP, src))
+    list(cache.iter_segments("k", 85 * CHUNK, 86 * CHUNK, STEP, src))
+    src.calls.clear()
+    list(cache.iter_segments("k", 80 * CHUNK, 88 * CHUNK, STEP, src))
+    assert src.calls == [(80 * CHUNK, 82 * CHUNK), (83 * CHUNK, 85 * CHUNK), (86 * CHUNK, 88 * CHUNK)]
+
+
+def test_future_chunks_are_not_scanned(clock):
+    cache, src = make_cache(), Source(last=clock.now)
+    list(cache.iter_segments("k", 99 * CHUNK, 200 * CHUNK, STEP, src))
+    assert src.calls == [(99 * CHUNK, 101 * CHUNK)]
+
+
+def test_closed_chunks_are_kept_and_open_chunk_expires(clock):
+    cache, src = make_cache(), Source(last=clock.now)
+    list(cache.iter_segments("k", 98 * CHUNK, 101 * CHUNK, STEP, src))
+    clock.now += 4.0
+    src.calls.clear()
+    list(cache.iter_segments("k", 98 * CHUNK, 101 * CHUNK, STEP, src))
+    assert src.calls == []
+    clock.now += 2.0  # past open_ttl: only the chunk containing "now" is refetched
+    list(cache.iter_segments("k", 98 * CHUNK, 101 * CHUNK, STEP, src))
+    assert src.calls == [(100 * CHUNK, 101 * CHUNK)]
+
+
+def test_chunk_within_grace_is_still_open(clock):
+    clock.now = 100 * CHUNK + 60  # chunk 99 ended a minute ago, inside grace_sec
+    cache, src = make_cache(), Source(last=clock.now)
+    list(cache.iter_segments("k", 99 * CHUNK, 100 * CHUNK, STEP, src))
+    clock.now += 6.0
+    src.calls.clear()
+    list(cache.iter_segments("k", 99 * CHUNK, 100 * CHUNK, STEP, src))
+    assert src.calls == [(99 * CHUNK, 100 * CHUNK)]
+
+
+def test_empty_closed_chunk_expires_until_backfilled(clock):
+    cache, src = make_cache(), Source(first=60 * CHUNK, last=clock.now)
+    assert rows(cache.iter_segments("k", 50 * CHUNK, 51 * CHUNK, STEP, src)) == []
+    src.first = 0  # a backfill fills the gap
+    clock.now += 6.0
+    assert rows(cache.iter_segments("k", 50 * CHUNK, 51 * CHUNK, STEP, src)) == \
+        list(range(50 * CHUNK, 51 * CHUNK, STEP))
+    clock.now += 1000.0
+    src.calls.clear()
+    list(cache.iter_segments("k", 50 * CHUNK, 51 * CHUNK, STEP, src))
+    assert src.calls == []
+
+
+def test_version_follows_chunk_contents(clock):
+    cache, src = make_cache(), Source(last=clock.now)
+    v1 = cache.version("k", 95 * CHUNK, 101 * CHUNK, STEP, src)
+    assert cache.version("k", 95 * CHUNK, 101 * CHUNK, STEP, src) == v1
+    clock.now += 6.0  # open chunk refilled with the same rows
+    assert cache.version("k", 95 * CHUNK, 101 * CHUNK, STEP, src) == v1
+    src.last = clock.now + STEP  # ... and then with a new bar
+    clock.now += 6.0
+    assert cache.version("k", 95 * CHUNK, 101 * CHUNK, STEP, src) != v1
+    assert cache.version("k", 96 * CHUNK, 101 * CHUNK, STEP, src) != \
+        cache.version("k", 95 * CHUNK, 101 * CHUNK, STEP, src)
+
+
+def test_reads_values_cached_without_crc(clock):
+    cache = make_cache()
+    body = json.dumps([{"time_sec": 50 * CHUNK, "c": 2.0}], separators=(",", ":"))
+    cache.local.set(f"k|{50 * CHUNK}", body.encode("utf-8"))
+    src = Source(last=clock.now)
+    assert rows(cache.iter_segments("k", 50 * CHUNK, 51 * CHUNK, STEP, src)) == [50 * CHUNK]
+    assert src.calls == []
+
+
+def test_last_row(clock):
+    cache, src = make_cache(), Source(last=98 * CHUNK + 10 * STEP)
+    assert cache.last_row("k", 80 * CHUNK, 101 * CHUNK, STEP, src, "c") == (98 * CHUNK + 9 * STEP, 1.0)
+    assert src.calls == [(97 * CHUNK, 101 * CHUNK)]  # only the last fill_chunks chunks are read
+    assert cache.last_row("k", 80 * CHUNK, 101 * CHUNK, STEP, src, "missing") is None
+    # Older than those chunks counts as no row
+    assert make_cache().last_row("k", 80 * CHUNK, 101 * CHUNK, STEP, Source(last=90 * CHUNK), "c") is None
+
+
+def test_lru_evicts_by_bytes(clock):
+    lru = LRUBytesCache(10)
+    lru.set("a", b"12345")
+    lru.set("b", b"12345")
+    lru.get("a")
+    lru.set("c", b"1")
+    assert lru.get("b") is None and lru.get("a") == b"12345" and lru.bytes == 6
+    lru.set("big", b"x" * 11)
+    assert lru.get("big") is None
+    lru.set("t", b"1", ttl=1.0)
+    clock.now += 1.0
+    assert lru.get("t") is None
@@ -0,0 +1,66 @@
+# tests/test_ta_state.py
+# Continuing from a carried state must give the values of a full recompute.
+import numpy as np
+import pytest
+
+from services.common.columnar import INDICATOR_FIELDS
+from services.common.indicators import bbands, macd, rsi
+from services.common.ta_state import IndicatorParams, IndicatorState
+
+PARAMS = IndicatorParams(20, 2.0, 12, 26, 9, 14)
+
+
+def closes(n, seed=0, level=30000.0):
+    rng = np.random.default_rng(seed)
+    return level + np.cumsum(rng.normal(scale=25.0, size=n))
+
+
+def full_recompute(close, params=PARAMS):
+    """Indicator columns over the whole series, the way a non-incremental run computes them."""
+    lower, mid, upper = bbands(close, params.bb_length, params.bb_std)
+    line, hist, signal = macd(close, params.macd_fast, params.macd_slow, params.macd_signal)
+    return {"bb_l": lower, "bb_m": mid, "bb_u": upper, "macd": line, "macds": signal, "macdh": hist,
+            "rsi": rsi(close, params.rsi_length)}
+
+
+@pytest.mark.parametrize("split", [PARAMS.warmup, 100, 999])
+def test_advance_matches_full_recompute(split):
+    close = closes(1000, seed=split)
+    ns = np.arange(len(close), dtype=np.int64) * 60_000_000_000
+    expected = full_recompute(close)
+
+    state = IndicatorState.from_closes(close[:split], ns[split - 1], PARAMS)
+    cols = state.advance(close[split:], ns[-1], close[:split], PARAMS)
+    for name in INDICATOR_FIELDS:
+        np.testing.assert_allclose(cols[name], expected[name][split:], rtol=1e-9, atol=1e-9, err_msg=name)
+    assert state.time_ns == ns[-1]
+    assert state.last_close == close[-1]
+
+
+def test_advance_in_pieces():
+    close = closes(800, seed=11)
+    expected = full_recompute(close)
+    start = 60
+    state = IndicatorState.from_closes(close[:start], 0, PARAMS)
+    done = start
+    for stop in (61, 61, 200, 450, 800):  # includes an empty step
+        cols = state.advance(close[done:stop], stop, close[:done], PARAMS)
+        for name in INDICATOR_FIELDS:
+            np.testing.assert_allclose(cols[name], expected[name][done:stop], rtol=1e-9, atol=1e-9,
+                                       err_msg=name)
+        done = stop
+
+
+@pytest.mark.parametrize("params", [IndicatorParams(5, 1.5, 3, 7, 4, 2), IndicatorParams(50, 3.0, 26, 52, 18, 30)])
+def test_advance_other_parameter_sets(params):
+    close = closes(500, seed=params.bb_length)
+    expected = full_recompute(close, params)
+    state = IndicatorState.from_closes(close[:params.warmup + 3], 0, params)
+    cols = state.advance(close[params.warmup + 3:], 1, close[:params.warmup + 3], params)
+    for name in INDICATOR_FIELDS:
+        np.testing.assert_allclose(cols[name], expected[name][params.warmup + 3:], rtol=1e-9, atol=1e-9,
+                                   err_msg=name)
+
+
+def test_from_closes_needs_warmup():
+    assert IndicatorState.from_closes(closes(PARAMS.warmup - 1), 0, PARAMS) is None
@@ -0,0 +1,78 @@
+# tests/test_ta_stream.py
+# Live per-bar updates must give the values of a full recompute over the same closes.
+import numpy as np
+import pytest
+
+from services.common.columnar import INDICATOR_FIELDS
+from services.common.indicators import bbands, macd, rsi
+from services.common.ta_state import IndicatorState
+from services.common.ta_stream import STREAM_PARAMS, StreamIndicators
+
+P = STREAM_PARAMS
+T0 = 1_700_000_000
+
+
+def closes(n, seed=0, level=30000.0):
+    rng = np.random.default_rng(seed)
+    return level + np.cumsum(rng.normal(scale=25.0, size=n))
+
+
+def full_recompute(close):
+    lower, mid, upper = bbands(close, P.bb_length, P.bb_std)
+    line, hist, signal = macd(close, P.macd_fast, P.macd_slow, P.macd_signal)
+    return {"bb_l": lower, "bb_m": mid, "bb_u": upper, "macd": line, "macds": signal, "macdh": hist,
+            "rsi": rsi(close, P.rsi_length)}
+
+
+def bar(symbol, i, close):
+    return {"symbol": symbol, "timestamp": (T0 + 60 * i) * 1_000_000_000, "close": float(close)}
+
+
+def assert_matches(message, expected, i):
+    for name in INDICATOR_FIELDS:
+        assert message[name] == pytest.approx(expected[name][i], rel=1e-9, abs=1e-9), (i, name)
+
+
+def test_updates_match_full_recompute():
+    close = closes(600, seed=5)
+    expected = full_recompute(close)
+    start = 50
+
+    live = StreamIndicators(capacity=1)
+    live.activate("X", IndicatorState.from_closes(close[:start], bar("X", start - 1, 0)["timestamp"], P),
+                  close[:start])
+    for i in range(start, len(close)):
+        if i % 7 == 0:
+            # An earlier aggregate of the same minute is superseded by the later one
+            live.update(bar("X", i, close[i] + 100.0))
+        _, message = live.update(bar("X", i, close[i]))
+        assert message["t"] == bar("X", i, 0)["timestamp"]
+        assert_matches(message, expected, i)
+
+    # Late bars for committed minutes are ignored
+    assert live.update(bar("X", 100, 1.0)) is None
+
+
+def test_warm_up_from_live_bars():
+    close = closes(P.warmup + 40, seed=9)
+    expected = full_recompute(close)
+    live = StreamIndicators(capacity=1)
+    out = [live.update(bar("Y", i, c)) for i, c in enumerate(close)]
+    first = next(i for i, o in enumerate(out) if o is not None)
+    # Activated once warmup closes are collected; from the next bar on it tracks the full recompute
+    assert first == P.warmup
+    for i in range(first, len(close)):
+        assert_matches(out[i][1], expected, i)
+
+
+def test_symbols_are_independent_and_storage_grows():
+    series = {f"S{k}": closes(200, seed=k) for k in range(5)}
+    live = StreamIndicators(capacity=1)
+    for sym, close in series.items():
+        live.activate(sym, IndicatorState.from_closes(close[:60], bar(sym, 59, 0)["timestamp"], P), close[:60])
+    last = {}
+    for i in range(60, 200):
+        for sym, close in series.items():
+            last[sym] = live.update(bar(sym, i, close[i]))[1]
+    for sym, close in series.items():
+        assert_matches(last[sym], full_recompute(close), 199)